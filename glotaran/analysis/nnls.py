@@ -4,21 +4,143 @@ least-squares method."""
 import typing
 
 import numpy as np
-from scipy.optimize import nnls
 
 
-def residual_nnls(matrix: np.ndarray, data: np.ndarray) -> typing.Tuple[np.ndarray, np.ndarray]:
+def residual_nnls(
+    matrix: np.ndarray, data: np.ndarray, passive_set: typing.Optional[np.ndarray] = None
+) -> typing.Tuple[np.ndarray, np.ndarray]:
     """Calculate the conditionally linear parameters and residual with the nnls method.
 
     nnls stands for 'non-negative least-squares'.
 
+    The data can either be a single vector or a 2 dimensional array of shape
+    ``(model_axis_size, number_of_columns)``. In the latter case all columns sharing the same
+    passive set are solved with a single least-squares call.
+
     Parameters
     ----------
     matrix :
         The model matrix.
     data : np.ndarray
         The data to analyze.
+    passive_set : typing.Optional[np.ndarray]
+        A boolean mask of the conditionally linear parameters which were positive in a
+        previous solution, used to warm start the active set method. It has the shape of the
+        returned clps. Ignored if it does not match the shape.
+    """
+    number_of_clps = matrix.shape[1]
+    columns = data.reshape((data.shape[0], -1))
+    number_of_columns = columns.shape[1]
+
+    if passive_set is None or passive_set.size != number_of_clps * number_of_columns:
+        passive_sets = np.zeros((number_of_clps, number_of_columns), dtype=bool)
+    else:
+        passive_sets = passive_set.reshape((number_of_clps, number_of_columns))
+
+    clps = np.zeros((number_of_clps, number_of_columns), dtype=np.float64)
+
+    unique_passive_sets, inverse = np.unique(passive_sets.T, axis=0, return_inverse=True)
+    for i, unique_passive_set in enumerate(unique_passive_sets):
+        column_indices = np.flatnonzero(inverse == i)
+        candidate_clps = _solve_passive_set(matrix, columns[:, column_indices], unique_passive_set)
+        gradient = matrix.T @ (columns[:, column_indices] - matrix @ candidate_clps)
+
+        # The warm start is optimal if it is feasible and fulfills the KKT conditions.
+        is_optimal = np.all(candidate_clps[unique_passive_set] > 0, axis=0) & np.all(
+            gradient[~unique_passive_set] <= 0, axis=0
+        )
+        clps[:, column_indices[is_optimal]] = candidate_clps[:, is_optimal]
+
+        for column_index in column_indices[~is_optimal]:
+            clps[:, column_index], _ = nnls(matrix, columns[:, column_index], unique_passive_set)
+
+    residual = columns - matrix @ clps
+    if data.ndim == 1:
+        return clps[:, 0], residual[:, 0]
+    return clps, residual
+
+
+def nnls(
+    matrix: np.ndarray,
+    data: np.ndarray,
+    passive_set: typing.Optional[np.ndarray] = None,
+    maximum_iterations: typing.Optional[int] = None,
+) -> typing.Tuple[np.ndarray, np.ndarray]:
+    """Solves a non-negative least-squares problem with the Lawson-Hanson active set method.
+
+    Parameters
+    ----------
+    matrix : np.ndarray
+        The model matrix.
+    data : np.ndarray
+        The data vector.
+    passive_set : typing.Optional[np.ndarray]
+        A boolean mask of the parameters to start with in the passive set.
+    maximum_iterations : typing.Optional[int]
+        The maximum number of iterations, defaults to three times the number of parameters.
+
+    Returns
+    -------
+    typing.Tuple[np.ndarray, np.ndarray]
+        The solution and the final passive set.
+
+    Raises
+    ------
+    RuntimeError
+        If the maximum number of iterations is reached.
     """
-    clp, _ = nnls(matrix, data)
-    residual = data - np.dot(matrix, clp)
-    return clp, residual
+    number_of_clps = matrix.shape[1]
+    if maximum_iterations is None:
+        maximum_iterations = 3 * number_of_clps
+
+    passive_set = (
+        np.zeros(number_of_clps, dtype=bool) if passive_set is None else passive_set.copy()
+    )
+    clp = np.zeros(number_of_clps, dtype=np.float64)
+
+    # Shrink the warm start until the least-squares solution on it is feasible.
+    while np.any(passive_set):
+        candidate = _solve_passive_set(matrix, data, passive_set)
+        if np.all(candidate[passive_set] > 0):
+            clp = candidate
+            break
+        passive_set &= candidate > 0
+
+    excluded = np.zeros(number_of_clps, dtype=bool)
+    for _ in range(maximum_iterations):
+        gradient = matrix.T @ (data - matrix @ clp)
+        candidates = ~passive_set & ~excluded & (gradient > 0)
+        if not np.any(candidates):
+            return clp, passive_set
+
+        new_index = np.argmax(np.where(candidates, gradient, -np.inf))
+        passive_set[new_index] = True
+
+        candidate = _solve_passive_set(matrix, data, passive_set)
+        if candidate[new_index] <= 0:
+            # Numerically the new parameter does not improve the solution.
+            passive_set[new_index] = False
+            excluded[new_index] = True
+            continue
+        excluded[:] = False
+
+        while not np.all(candidate[passive_set] > 0):
+            infeasible = np.flatnonzero(passive_set & (candidate <= 0))
+            step_sizes = clp[infeasible] / (clp[infeasible] - candidate[infeasible])
+            blocking_index = np.argmin(step_sizes)
+            clp += step_sizes[blocking_index] * (candidate - clp)
+            clp[infeasible[blocking_index]] = 0
+            passive_set &= clp > 0
+            clp[~passive_set] = 0
+            candidate = _solve_passive_set(matrix, data, passive_set)
+        clp = candidate
+
+    raise RuntimeError("Maximum number of iterations reached in nnls.")
+
+
+def _solve_passive_set(matrix: np.ndarray, data: np.ndarray, passive_set: np.ndarray):
+    """Solves the unconstrained least-squares problem for the parameters in the passive set."""
+    solution = np.zeros((matrix.shape[1],) + data.shape[1:], dtype=np.float64)
+    if np.any(passive_set):
+        solution[passive_set] = np.linalg.lstsq(matrix[:, passive_set], data, rcond=None)[0]
+    return solution
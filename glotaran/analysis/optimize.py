@@ -1,5 +1,8 @@
 from __future__ import annotations
 
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from warnings import warn
 
 import numpy as np
@@ -9,6 +12,7 @@ from scipy.optimize import least_squares
 from glotaran.analysis.problem import Problem
 from glotaran.analysis.problem_grouped import GroupedProblem
 from glotaran.analysis.problem_ungrouped import UngroupedProblem
+from glotaran.analysis.residual_pool import ResidualProcessPool
 from glotaran.project import Result
 from glotaran.project import Scheme
 
@@ -18,6 +22,11 @@ SUPPORTED_METHODS = {
     "Levenberg-Marquardt": "lm",
 }
 
+SUPPORTED_JACOBIAN_METHODS = ["FiniteDifference", "ParallelFiniteDifference", "Analytic"]
+
+_jacobian_worker_problem: Problem | None = None
+"""The problem of a worker process of the parallel finite difference jacobian."""
+
 
 def optimize(scheme: Scheme, verbose: bool = True, raise_exception: bool = False) -> Result:
     problem = GroupedProblem(scheme) if scheme.is_grouped() else UngroupedProblem(scheme)
@@ -34,6 +43,12 @@ def optimize_problem(
             f"Supported methods are '{list(SUPPORTED_METHODS.keys())}'"
         )
 
+    if problem.scheme.jacobian_method not in SUPPORTED_JACOBIAN_METHODS:
+        raise ValueError(
+            f"Unsupported jacobian method {problem.scheme.jacobian_method}. "
+            f"Supported methods are '{SUPPORTED_JACOBIAN_METHODS}'"
+        )
+
     (
         free_parameter_labels,
         initial_parameter,
@@ -48,19 +63,46 @@ def optimize_problem(
     verbose = 2 if verbose else 0
     termination_reason = ""
 
-    try:
-        ls_result = least_squares(
-            _calculate_penalty,
-            initial_parameter,
-            bounds=(lower_bounds, upper_bounds),
-            method=method,
-            max_nfev=nfev,
-            verbose=verbose,
-            ftol=ftol,
-            gtol=gtol,
-            xtol=xtol,
-            kwargs={"free_parameter_labels": free_parameter_labels, "problem": problem},
+    jacobian = "2-point"
+    if problem.scheme.jacobian_method == "Analytic":
+        if problem.supports_analytic_jacobian(free_parameter_labels):
+            jacobian = _calculate_jacobian
+        else:
+            warn(
+                "The analytic jacobian is not supported for this model, "
+                "falling back to finite differences."
+            )
+
+    # the penalty of the last evaluation, which is reused by the parallel finite differences
+    last_penalty = {}
+    executor = None
+    if problem.scheme.jacobian_method == "ParallelFiniteDifference":
+        executor = _create_jacobian_executor(problem)
+        jacobian = partial(
+            _calculate_parallel_finite_difference_jacobian,
+            executor=executor,
+            last_penalty=last_penalty,
+            lower_bounds=lower_bounds,
+            upper_bounds=upper_bounds,
         )
+
+    residual_pool = _create_residual_pool(problem, free_parameter_labels)
+
+    try:
+        with problem.limit_blas_threads():
+            ls_result = least_squares(
+                partial(_calculate_penalty, last_penalty=last_penalty),
+                initial_parameter,
+                jac=jacobian,
+                bounds=(lower_bounds, upper_bounds),
+                method=method,
+                max_nfev=nfev,
+                verbose=verbose,
+                ftol=ftol,
+                gtol=gtol,
+                xtol=xtol,
+                kwargs={"free_parameter_labels": free_parameter_labels, "problem": problem},
+            )
         termination_reason = ls_result.message
     except Exception as e:
         if raise_exception:
@@ -68,17 +110,163 @@ def optimize_problem(
         warn(f"Optimization failed:\n\n{e}")
         termination_reason = str(e)
         ls_result = None
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        if residual_pool is not None:
+            problem.set_residual_pool(None)
+            residual_pool.shutdown()
+        # the history is created on the first record, which opens its spill file
+        if problem._parameter_history is not None:
+            problem._parameter_history.close()
 
-    return _create_result(problem, ls_result, free_parameter_labels, termination_reason)
+    try:
+        return _create_result(problem, ls_result, free_parameter_labels, termination_reason)
+    finally:
+        problem.shutdown_residual_executor()
 
 
 def _calculate_penalty(
-    parameters: np.ndarray, free_parameter_labels: list[str] = None, problem: Problem = None
+    parameters: np.ndarray,
+    free_parameter_labels: list[str] = None,
+    problem: Problem = None,
+    last_penalty: dict[str, np.ndarray] = None,
 ):
+    problem.parameters.set_from_label_and_value_arrays(free_parameter_labels, parameters)
     problem.save_parameters_for_history()
+    problem.reset()
+    # the penalty is a buffer of the problem, which is overwritten by the next evaluation
+    penalty = problem.full_penalty.copy()
+    problem.parameter_history.set_last_cost(0.5 * np.dot(penalty, penalty))
+    if last_penalty is not None:
+        last_penalty["parameters"] = parameters.copy()
+        last_penalty["penalty"] = penalty
+    return penalty
+
+
+def _calculate_jacobian(
+    parameters: np.ndarray, free_parameter_labels: list[str] = None, problem: Problem = None
+):
     problem.parameters.set_from_label_and_value_arrays(free_parameter_labels, parameters)
     problem.reset()
-    return problem.full_penalty
+    jacobian = problem.calculate_jacobian(free_parameter_labels)
+    # non-negative parameters are optimized in log space
+    for i, label in enumerate(free_parameter_labels):
+        parameter = problem.parameters.get(label)
+        if parameter.non_negative:
+            jacobian[:, i] *= parameter.value
+    return jacobian
+
+
+def _create_jacobian_executor(problem: Problem) -> ProcessPoolExecutor:
+    """Creates a process pool where each worker holds its own copy of the problem."""
+    return ProcessPoolExecutor(
+        max_workers=problem.scheme.number_of_jacobian_workers,
+        mp_context=multiprocessing.get_context(problem.scheme.jacobian_start_method),
+        initializer=_initialize_jacobian_worker,
+        initargs=(type(problem), problem.scheme),
+    )
+
+
+def _create_residual_pool(
+    problem: Problem, free_parameter_labels: list[str]
+) -> ResidualProcessPool | None:
+    """Creates a pool of worker processes calculating the residual results of the problem
+    during the optimization, if :attr:`Scheme.number_of_residual_workers` is larger than one."""
+    if (problem.scheme.number_of_residual_workers or 1) <= 1:
+        return None
+    try:
+        residual_pool = ResidualProcessPool(
+            problem, problem.scheme.number_of_residual_workers, free_parameter_labels
+        )
+    except ValueError as e:
+        warn(f"{e} Falling back to calculating the residual in a single process.")
+        return None
+    problem.set_residual_pool(residual_pool)
+    return residual_pool
+
+
+def _initialize_jacobian_worker(problem_type: type[Problem], scheme: Scheme):
+    global _jacobian_worker_problem
+    _jacobian_worker_problem = problem_type(scheme)
+
+
+def _calculate_worker_penalty(
+    parameters: np.ndarray, free_parameter_labels: list[str]
+) -> np.ndarray:
+    problem = _jacobian_worker_problem
+    problem.parameters.set_from_label_and_value_arrays(free_parameter_labels, parameters)
+    problem.reset()
+    # the penalty is a buffer of the problem, which is overwritten by the next evaluation
+    return problem.full_penalty.copy()
+
+
+def _calculate_parallel_finite_difference_jacobian(
+    parameters: np.ndarray,
+    free_parameter_labels: list[str] = None,
+    problem: Problem = None,
+    executor: ProcessPoolExecutor = None,
+    lower_bounds: np.ndarray = None,
+    upper_bounds: np.ndarray = None,
+    last_penalty: dict[str, np.ndarray] = None,
+) -> np.ndarray:
+    """Calculates the jacobian with forward differences, where the columns are evaluated
+    concurrently by the workers of the executor.
+
+    The steps are chosen like the "2-point" scheme of :func:`scipy.optimize.least_squares`.
+    The unperturbed penalty is taken from ``last_penalty``, which :func:`_calculate_penalty`
+    sets, if it was calculated for the same parameters.
+    """
+    steps = np.sqrt(np.finfo(np.float64).eps) * np.where(parameters >= 0, 1.0, -1.0)
+    steps *= np.maximum(1.0, np.abs(parameters))
+    steps = _adjust_steps_to_bounds(parameters, steps, lower_bounds, upper_bounds)
+    steps = (parameters + steps) - parameters
+
+    futures = []
+    for i, step in enumerate(steps):
+        perturbed_parameters = parameters.copy()
+        perturbed_parameters[i] += step
+        futures.append(
+            executor.submit(_calculate_worker_penalty, perturbed_parameters, free_parameter_labels)
+        )
+
+    if last_penalty is not None and np.array_equal(last_penalty.get("parameters"), parameters):
+        penalty = last_penalty["penalty"]
+    else:
+        # the unperturbed penalty is calculated while the workers are busy
+        problem.parameters.set_from_label_and_value_arrays(free_parameter_labels, parameters)
+        problem.reset()
+        penalty = problem.full_penalty
+
+    return np.stack(
+        [(future.result() - penalty) / step for future, step in zip(futures, steps)], axis=1
+    )
+
+
+def _adjust_steps_to_bounds(
+    parameters: np.ndarray,
+    steps: np.ndarray,
+    lower_bounds: np.ndarray,
+    upper_bounds: np.ndarray,
+) -> np.ndarray:
+    """Adjusts forward difference steps, so that the perturbed parameters stay within bounds.
+
+    Like :func:`scipy.optimize.least_squares`, a step violating a bound is reversed if it fits
+    on the other side. Otherwise it is shrunk to the distance to the farther bound.
+    """
+    lower_distances = parameters - lower_bounds
+    upper_distances = upper_bounds - parameters
+    perturbed_parameters = parameters + steps
+    violated = (perturbed_parameters < lower_bounds) | (perturbed_parameters > upper_bounds)
+    fitting = np.abs(steps) <= np.maximum(lower_distances, upper_distances)
+
+    steps = steps.copy()
+    steps[violated & fitting] *= -1
+    forward = (upper_distances >= lower_distances) & ~fitting
+    steps[forward] = upper_distances[forward]
+    backward = (upper_distances < lower_distances) & ~fitting
+    steps[backward] = -lower_distances[backward]
+    return steps
 
 
 def _create_result(
@@ -91,7 +279,7 @@ def _create_result(
     success = ls_result is not None
 
     number_of_function_evaluation = (
-        ls_result.nfev if ls_result is not None else len(problem.parameter_history)
+        ls_result.nfev if ls_result is not None else problem.parameter_history.number_of_records
     )
     number_of_jacobian_evaluation = ls_result.njev if success else None
     optimality = ls_result.optimality if success else None
@@ -106,9 +294,14 @@ def _create_result(
     if success:
         problem.parameters.set_from_label_and_value_arrays(free_parameter_labels, ls_result.x)
     problem.reset()
-    history_index = None if success else -2
+    # the parameters of the last evaluation with a cost, if the optimization has crashed
+    history_index = None
+    if not success:
+        evaluated = np.flatnonzero(np.isfinite(problem.parameter_history.costs))
+        if evaluated.size != 0:
+            history_index = evaluated[-1]
     data = problem.create_result_data(history_index=history_index)
-    # the optimized parameters are those of the last run if the optimization has crashed
+    # the optimized parameters are those of the last evaluation if the optimization has crashed
     parameters = problem.parameters
     covariance_matrix = None
     if success:
@@ -1,25 +1,39 @@
 from __future__ import annotations
 
+import contextlib
+import os
+import threading
 import warnings
+from concurrent.futures import ThreadPoolExecutor
 from typing import TYPE_CHECKING
 from typing import Dict
 from typing import NamedTuple
 from typing import TypeVar
 
+import numba as nb
 import numpy as np
 import xarray as xr
 
 from glotaran.analysis.nnls import residual_nnls
+from glotaran.analysis.util import ClpLabelRegistry
+from glotaran.analysis.util import calculate_matrix_derivatives
 from glotaran.analysis.util import get_min_max_from_interval
 from glotaran.analysis.variable_projection import residual_variable_projection
 from glotaran.io.prepare_dataset import add_svd_to_dataset
 from glotaran.model import DatasetModel
 from glotaran.model import Model
+from glotaran.parameter import Parameter
 from glotaran.parameter import ParameterGroup
+from glotaran.parameter import ParameterHistory
 from glotaran.project import Scheme
 
 if TYPE_CHECKING:
+    from typing import Any
+    from typing import Callable
     from typing import Hashable
+    from typing import Iterable
+
+    from glotaran.analysis.residual_pool import ResidualProcessPool
 
 
 class ParameterError(ValueError):
@@ -41,6 +55,16 @@ class GroupedProblemDescriptor(NamedTuple):
     axis: dict[str, np.ndarray]
 
 
+class PreparedData(NamedTuple):
+    """The arrays of a dataset, prepared once and shared by all filled dataset models."""
+
+    data: np.ndarray
+    """The weighted data in Fortran order and read-only."""
+    weight: np.ndarray | None
+    """The weight in Fortran order and read-only."""
+    coords: dict[Hashable, np.ndarray]
+
+
 class ProblemGroup(NamedTuple):
     data: np.ndarray
     weight: np.ndarray
@@ -55,9 +79,72 @@ class ProblemGroup(NamedTuple):
 
 UngroupedBag = Dict[str, UngroupedProblemDescriptor]
 
+
+def _limit_blas_threads(number_of_threads: int) -> contextlib.AbstractContextManager:
+    """Limits the threads of the BLAS libraries, if ``threadpoolctl`` is installed."""
+    try:
+        from threadpoolctl import threadpool_limits
+    except ImportError:
+        return contextlib.nullcontext()
+    return threadpool_limits(limits=number_of_threads, user_api="blas")
+
+
 XrDataContainer = TypeVar("XrDataContainer", xr.DataArray, xr.Dataset)
 
 
+def _read_only(array: np.ndarray) -> np.ndarray:
+    """Returns a read-only view of an array, leaving the array itself writeable."""
+    view = array.view()
+    view.flags.writeable = False
+    return view
+
+
+class ProblemWorkspace:
+    """Reusable buffers for the evaluations of a :class:`Problem`.
+
+    The shapes of the matrices, residuals and penalties do not change between evaluations, so
+    the buffers are allocated on first use and handed out again on every following evaluation.
+    A buffer is only reallocated if it is requested with a different shape.
+    """
+
+    def __init__(self):
+        self._buffers = {}
+
+    def get(self, name: Hashable, shape: tuple[int, ...], order: str = "C") -> np.ndarray:
+        """Returns the buffer with the given name.
+
+        The content of the buffer is the one of the previous evaluation, so it is up to the
+        caller to overwrite it completely.
+
+        Parameters
+        ----------
+        name : Hashable
+            The name of the buffer.
+        shape : tuple[int, ...]
+            The shape of the buffer.
+        order : str
+            The memory layout of the buffer, either ``"C"`` or ``"F"``.
+
+        Returns
+        -------
+        np.ndarray
+            The buffer.
+        """
+        buffer = self._buffers.get(name)
+        if buffer is None or buffer.shape != shape:
+            buffer = self._buffers[name] = np.empty(shape, order=order)
+        return buffer
+
+    def get_scratch(self, name: Hashable, shape: tuple[int, ...]) -> np.ndarray:
+        """Returns a scratch buffer in Fortran order, e.g. for a matrix to factorize in place.
+
+        Scratch buffers are only valid until the next request from the same thread, they are
+        kept per thread and shape, so that the threads of the residual pool (see
+        :meth:`Problem._map_global_indices`) never share one.
+        """
+        return self.get((threading.get_ident(), name, shape), shape, order="F")
+
+
 class Problem:
     """A Problem class"""
 
@@ -78,16 +165,34 @@ class Problem:
         self._residual_function = (
             residual_nnls if scheme.non_negative_least_squares else residual_variable_projection
         )
+        # The passive sets of the nnls are kept across evaluations to warm start the next solve.
+        self._nnls_passive_sets = {}
+        self._number_of_residual_threads = scheme.number_of_residual_threads
+        self._residual_executor = None
+        self._workspace = ProblemWorkspace()
+        # The pool of worker processes calculating the residual results, if any.
+        self._residual_pool = None
         self._parameters = None
         self._dataset_models = None
+        # The parameter instances of the filled dataset models by label, used to update the
+        # dataset models in place instead of filling them again on every reset.
+        self._filled_parameters = None
 
-        self._overwrite_index_dependent = self.model.need_index_dependent()
+        self._overwrite_index_dependent = self._needs_index_dependent_datasets()
         self._parameters = scheme.parameters.copy()
-        self._parameter_history = []
+        # The history is created on the first record, so that the problems of worker processes
+        # never open the spill file.
+        self._parameter_history = None
 
         self._model.validate(raise_exception=True)
+        self._clp_label_registry = ClpLabelRegistry(self._model)
 
         self._prepare_data(scheme.data)
+        if len(self.model.relations) != 0 or len(self.model.constraints) != 0:
+            for dataset_model in self._dataset_models.values():
+                self._clp_label_registry.precompute_applicability(
+                    self.model, dataset_model.get_global_axis()
+                )
 
         # all of the above are always not None
 
@@ -140,13 +245,28 @@ class Problem:
         self.reset()
 
     @property
-    def parameter_history(self) -> list[ParameterGroup]:
+    def parameter_history(self) -> ParameterHistory:
+        """The history of the free parameters, see :attr:`Scheme.parameter_history`."""
+        if self._parameter_history is None:
+            options = self._scheme.parameter_history
+            self._parameter_history = ParameterHistory.from_parameters(
+                self._parameters,
+                keep_last=options.keep_last,
+                keep_every=options.keep_every,
+                spill_path=options.spill_path,
+            )
         return self._parameter_history
 
     @property
     def dataset_models(self) -> dict[str, DatasetModel]:
         return self._dataset_models
 
+    @property
+    def clp_label_registry(self) -> ClpLabelRegistry:
+        """The registry of the clp labels and of the relations and constraints applying at the
+        global indices of the problem."""
+        return self._clp_label_registry
+
     @property
     def matrices(
         self,
@@ -205,6 +325,11 @@ class Problem:
 
     @property
     def full_penalty(self) -> np.ndarray:
+        """The weighted residuals and the additional penalty concatenated.
+
+        The penalty is a buffer of the workspace, which is overwritten by the next evaluation.
+        It has to be copied if it is kept beyond that.
+        """
         raise NotImplementedError
 
     @property
@@ -212,19 +337,44 @@ class Problem:
         return 0.5 * np.dot(self.full_penalty, self.full_penalty)
 
     def save_parameters_for_history(self):
-        self._parameter_history.append(self._parameters)
+        """Records the current parameters in the :attr:`parameter_history`."""
+        self.parameter_history.append_parameters(self._parameters)
 
     def reset(self):
         """Resets all results and `DatasetModels`. Use after updating parameters."""
-        self._dataset_models = {
-            label: dataset_model.fill(self._model, self._parameters).set_data(self.data[label])
-            for label, dataset_model in self._model.dataset.items()
-        }
-        if self._overwrite_index_dependent:
-            for d in self._dataset_models.values():
-                d.overwrite_index_dependent(self._overwrite_index_dependent)
+        if self._filled_parameters is None:
+            self._dataset_models = {
+                label: dataset_model.fill(self._model, self._parameters).bind_data(
+                    *self._prepared_data[label]
+                )
+                for label, dataset_model in self._model.dataset.items()
+            }
+            if self._overwrite_index_dependent:
+                for d in self._dataset_models.values():
+                    d.overwrite_index_dependent(self._overwrite_index_dependent)
+            self._filled_parameters = self._get_filled_parameters()
+        else:
+            self._update_filled_parameters()
         self._reset_results()
 
+    def _get_filled_parameters(self) -> dict[str, list[Parameter]]:
+        """Returns the distinct parameter instances of the filled dataset models by label."""
+        filled_parameters = {}
+        for dataset_model in self._dataset_models.values():
+            for parameter in dataset_model.get_parameters():
+                instances = filled_parameters.setdefault(parameter.full_label, [])
+                if all(parameter is not instance for instance in instances):
+                    instances.append(parameter)
+        return filled_parameters
+
+    def _update_filled_parameters(self):
+        """Updates the parameters of the filled dataset models which changed values."""
+        for label, instances in self._filled_parameters.items():
+            value = self._parameters.get(label).value
+            for parameter in instances:
+                if parameter.value != value:
+                    parameter.set_from_group(self._parameters)
+
     def _reset_results(self):
         self._matrices = None
         self._reduced_matrices = None
@@ -235,8 +385,114 @@ class Problem:
         self._additional_penalty = None
         self._full_penalty = None
 
+    def _calculate_clps_and_residual(
+        self,
+        matrix: np.ndarray,
+        data: np.ndarray,
+        key: Hashable,
+        overwrite_matrix: bool = False,
+        residual_buffer: np.ndarray | None = None,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Calls the residual function.
+
+        For the nnls the solve is warm started from the passive set found for the same
+        ``key`` (e.g. a global index) in the previous evaluation.
+
+        For the variable projection the matrix is factorized in place if ``overwrite_matrix``
+        is set, and the residual is calculated in place of the ``residual_buffer`` if given, which
+        may be the data itself.
+        """
+        if self._residual_function is not residual_nnls:
+            if residual_buffer is None:
+                return residual_variable_projection(
+                    matrix, data, overwrite_matrix=overwrite_matrix
+                )
+            if residual_buffer is not data:
+                np.copyto(residual_buffer, data)
+            return residual_variable_projection(
+                matrix, residual_buffer, overwrite_matrix=overwrite_matrix, overwrite_data=True
+            )
+        clps, residual = residual_nnls(matrix, data, self._nnls_passive_sets.get(key))
+        self._nnls_passive_sets[key] = clps > 0
+        return clps, residual
+
+    def _concatenate_penalty(
+        self, residuals: list[np.ndarray], additional_penalty: np.ndarray | list | None
+    ) -> np.ndarray:
+        """Concatenates residuals and the additional penalty into the penalty buffer."""
+        parts = list(residuals)
+        if additional_penalty is not None and len(additional_penalty) != 0:
+            parts.append(np.asarray(additional_penalty))
+        size = sum(part.size for part in parts)
+        return np.concatenate(parts, out=self._workspace.get("full_penalty", (size,)))
+
+    def _needs_index_dependent_datasets(self) -> bool:
+        """Indicates if all datasets have to be treated as index dependent.
+
+        This is the case if relations or constraints are restricted to intervals of the
+        global axis.
+        """
+        return self.model.need_index_dependent()
+
+    def _map_global_indices(self, function: Callable, *iterables: Iterable) -> list[Any]:
+        """Maps a function over the global indices, like :func:`map` but returning a list.
+
+        If :attr:`Scheme.number_of_residual_threads` is larger than one, the indices are
+        partitioned into contiguous chunks which are mapped concurrently by a thread pool. The
+        threads of numba are reduced for the time being and the threads of the BLAS by
+        :meth:`limit_blas_threads`, so that the threads of the pool do not oversubscribe the
+        cores.
+        """
+        arguments = list(zip(*iterables))
+        number_of_threads = min(self._number_of_residual_threads or 1, len(arguments))
+        if number_of_threads <= 1:
+            return [function(*argument) for argument in arguments]
+
+        if self._residual_executor is None:
+            self._residual_executor = ThreadPoolExecutor(
+                max_workers=self._number_of_residual_threads
+            )
+        threads_per_worker = max(1, (os.cpu_count() or 1) // number_of_threads)
+        chunks = np.array_split(np.arange(len(arguments)), number_of_threads)
+
+        def map_chunk(chunk: np.ndarray) -> list[Any]:
+            nb.set_num_threads(min(threads_per_worker, nb.config.NUMBA_NUM_THREADS))
+            return [function(*arguments[i]) for i in chunk]
+
+        futures = [self._residual_executor.submit(map_chunk, chunk) for chunk in chunks]
+        return [result for future in futures for result in future.result()]
+
+    def limit_blas_threads(self) -> contextlib.AbstractContextManager:
+        """Returns a context manager limiting the threads of the BLAS libraries to the share of
+        the cores of every residual thread, see :meth:`_map_global_indices`.
+
+        Setting the limit inspects the loaded libraries, so it is entered once around all
+        evaluations, e.g. by :func:`glotaran.analysis.optimize.optimize_problem`.
+        """
+        number_of_threads = self._number_of_residual_threads or 1
+        if number_of_threads <= 1:
+            return contextlib.nullcontext()
+        return _limit_blas_threads(max(1, (os.cpu_count() or 1) // number_of_threads))
+
+    def shutdown_residual_executor(self):
+        """Stops the threads mapping over the global indices, see :meth:`_map_global_indices`.
+
+        The threads are started again if the residual is calculated again.
+        """
+        if self._residual_executor is not None:
+            self._residual_executor.shutdown()
+            self._residual_executor = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_residual_executor"] = None
+        # the history may hold an open spill file
+        state["_parameter_history"] = None
+        return state
+
     def _prepare_data(self, data: dict[str, xr.DataArray | xr.Dataset]):
         self._data = {}
+        self._prepared_data = {}
         self._dataset_models = {}
         for label, dataset in data.items():
             if isinstance(dataset, xr.DataArray):
@@ -244,7 +500,10 @@ class Problem:
 
             dataset_model = self._model.dataset[label]
             dataset_model = dataset_model.fill(self.model, self.parameters)
-            dataset_model.set_data(dataset)
+            # the coordinates are sufficient to determine the dimensions
+            dataset_model.set_coordinates(
+                {name: dim.values for name, dim in dataset.coords.items()}
+            )
             if self._overwrite_index_dependent:
                 dataset_model.overwrite_index_dependent(self._overwrite_index_dependent)
             self._dataset_models[label] = dataset_model
@@ -260,6 +519,29 @@ class Problem:
 
             self._add_weight(label, dataset)
             self._data[label] = dataset
+            self._prepared_data[label] = self._prepare_arrays(dataset)
+            dataset_model.bind_data(*self._prepared_data[label])
+
+    def _prepare_arrays(self, dataset: xr.Dataset) -> PreparedData:
+        """Prepares the arrays of a dataset for the dataset models.
+
+        The weighted data is calculated only once and the arrays are made read-only, so that
+        they can be shared by the dataset models filled on every reset.
+
+        The data is accessed per global index, i.e. by column, so the arrays are stored in
+        Fortran order. This way every column is contiguous and can be passed to LAPACK without
+        a copy.
+        """
+        weight = dataset.weight.values if "weight" in dataset else None
+        data = dataset.data.values
+        if weight is not None:
+            weight = _read_only(np.asfortranarray(weight))
+            data = np.multiply(data, weight, order="F")
+        return PreparedData(
+            data=_read_only(np.asfortranarray(data)),
+            weight=weight,
+            coords={name: _read_only(dim.values) for name, dim in dataset.coords.items()},
+        )
 
     def _transpose_dataset(
         self, datacontainer: XrDataContainer, ordered_dims: list[Hashable]
@@ -293,7 +575,6 @@ class Problem:
                 )
             return
         dataset_model = self.dataset_models[label]
-        dataset_model.set_data(dataset)
         global_dimension = dataset_model.get_global_dimension()
         model_dimension = dataset_model.get_model_dimension()
 
@@ -323,7 +604,8 @@ class Problem:
     ) -> dict[str, xr.Dataset]:
 
         if history_index is not None and history_index != -1:
-            self.parameters = self.parameter_history[history_index]
+            self.parameter_history.set_parameters(history_index, self._parameters)
+            self.reset()
 
         self.prepare_result_creation()
         result_data = {}
@@ -399,5 +681,108 @@ class Problem:
     def calculate_residual(self):
         raise NotImplementedError
 
+    def set_residual_pool(self, residual_pool: ResidualProcessPool | None):
+        """Sets the pool of worker processes calculating the residual results.
+
+        Parameters
+        ----------
+        residual_pool : ResidualProcessPool | None
+            The pool, or ``None`` to calculate the residual results in this process.
+        """
+        self._residual_pool = residual_pool
+
+    def _get_residual_results(self) -> Any:
+        """Returns the residual results, calculated by the residual pool if one is set."""
+        if self._residual_pool is not None:
+            return self._residual_pool.calculate_residual_results(self.parameters)
+        return self._calculate_residual_results()
+
+    def _calculate_residual_results(self) -> Any:
+        """Calculates the clps and residuals of every global index of the problem."""
+        raise NotImplementedError
+
+    def _merge_residual_results(self, results: list[Any]) -> Any:
+        """Merges the residual results of the partitions of the global indices."""
+        raise NotImplementedError
+
+    def _get_global_index_partitions(
+        self, number_of_partitions: int
+    ) -> list[dict[str, np.ndarray]] | None:
+        """Partitions the global indices of the datasets for the residual pool.
+
+        Parameters
+        ----------
+        number_of_partitions : int
+            The requested number of partitions, fewer may be returned.
+
+        Returns
+        -------
+        list[dict[str, np.ndarray]] | None
+            The global indices of every partition by dataset label, or ``None`` if the problem
+            can not be partitioned.
+        """
+        raise NotImplementedError
+
+    def supports_analytic_jacobian(self, free_parameter_labels: list[str]) -> bool:
+        """Indicates if :meth:`calculate_jacobian` can be used for the free parameters.
+
+        This is the case if the variable projection is used, no dataset has a global model,
+        there are no clp area penalties and the megacomplexes provide the derivatives for all
+        free parameters their matrices depend on.
+        """
+        free_parameter_labels = set(free_parameter_labels)
+        if (
+            self._residual_function is not residual_variable_projection
+            or len(self.model.clp_area_penalties) != 0
+            or any(
+                relation.get_parameter_labels(self.model) & free_parameter_labels
+                for relation in self.model.relations
+            )
+        ):
+            return False
+
+        for dataset_model in self.dataset_models.values():
+            if dataset_model.has_global_model():
+                return False
+
+            parameter_labels = dataset_model.get_parameter_labels(self.model)
+            if any(
+                self.parameters.get(label).expression is not None for label in parameter_labels
+            ):
+                return False
+
+            required_labels = parameter_labels & free_parameter_labels
+            if len(required_labels) == 0:
+                continue
+
+            scale_labels = set()
+            for name in ["scale", "megacomplex_scale"]:
+                scale_labels |= getattr(dataset_model.__class__, name).get_parameter_labels(
+                    getattr(dataset_model, name), self.model
+                )
+            if required_labels & scale_labels:
+                return False
+
+            indices = (
+                {dataset_model.get_global_dimension(): 0}
+                if dataset_model.is_index_dependent()
+                else {}
+            )
+            derivatives = calculate_matrix_derivatives(dataset_model, indices, [])
+            if not required_labels.issubset(derivatives):
+                return False
+
+        return True
+
+    def calculate_jacobian(self, free_parameter_labels: list[str]) -> np.ndarray:
+        """Calculates the jacobian of :attr:`full_penalty` with respect to the free parameters.
+
+        Parameters
+        ----------
+        free_parameter_labels : list[str]
+            The labels of the free parameters, one per column of the jacobian.
+        """
+        raise NotImplementedError
+
     def prepare_result_creation(self):
         pass
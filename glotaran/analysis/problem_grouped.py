@@ -1,8 +1,7 @@
 from __future__ import annotations
 
 import collections
-import itertools
-from typing import Deque
+from typing import Iterator
 
 import numpy as np
 import xarray as xr
@@ -12,17 +11,151 @@ from glotaran.analysis.problem import ParameterError
 from glotaran.analysis.problem import Problem
 from glotaran.analysis.problem import ProblemGroup
 from glotaran.analysis.util import CalculatedMatrix
+from glotaran.analysis.util import align_axes
 from glotaran.analysis.util import apply_weight
 from glotaran.analysis.util import calculate_clp_penalties
+from glotaran.analysis.util import calculate_index_dependent_matrices
 from glotaran.analysis.util import calculate_matrix
-from glotaran.analysis.util import find_closest_index
-from glotaran.analysis.util import find_overlap
+from glotaran.analysis.util import calculate_matrix_derivatives
+from glotaran.analysis.util import get_clp_label_union
+from glotaran.analysis.util import get_clp_penalty_indices
 from glotaran.analysis.util import reduce_matrix
 from glotaran.analysis.util import retrieve_clps
-from glotaran.model import DatasetModel
+from glotaran.analysis.variable_projection import jacobian_variable_projection
 from glotaran.project import Scheme
 
-Bag = Deque[ProblemGroup]
+
+class GroupedBag:
+    """The grouped problems of a :class:`GroupedProblem` as a struct of arrays.
+
+    The data (and weight) of all groups is packed into one contiguous buffer. Every group
+    consists of members, which are single global indices of a dataset. The members are stored
+    ordered by group, so that the members of group ``i`` are in
+    ``member_offsets[i]:member_offsets[i+1]`` and its data in
+    ``data[data_offsets[i]:data_offsets[i+1]]``.
+
+    Indexing or iterating the bag yields :class:`ProblemGroup` instances, whose data and weight
+    are views into the packed buffers.
+    """
+
+    def __init__(
+        self,
+        problem: GroupedProblem,
+        labels: list[str],
+        number_of_groups: int,
+        member_group: np.ndarray,
+        member_dataset: np.ndarray,
+        member_global_index: np.ndarray,
+    ):
+        """
+
+        Parameters
+        ----------
+        problem : GroupedProblem
+            The problem providing the dataset models.
+        labels : list[str]
+            The labels of the datasets.
+        number_of_groups : int
+            The number of groups.
+        member_group : np.ndarray
+            The group of every member, sorted ascending.
+        member_dataset : np.ndarray
+            The index of the dataset in ``labels`` of every member.
+        member_global_index : np.ndarray
+            The index on the global axis of its dataset of every member.
+        """
+        dataset_models = [problem.dataset_models[label] for label in labels]
+        has_weights = any(
+            dataset_model.get_weight() is not None for dataset_model in dataset_models
+        )
+        model_axis_sizes = np.asarray(
+            [dataset_model.get_model_axis().size for dataset_model in dataset_models]
+        )
+
+        self.labels = labels
+        self.member_dataset = member_dataset
+        self.member_global_index = member_global_index
+        self.member_offsets = np.searchsorted(member_group, np.arange(number_of_groups + 1))
+        self.member_sizes = model_axis_sizes[member_dataset]
+        member_data_offsets = np.concatenate([[0], np.cumsum(self.member_sizes)])
+        self.data_offsets = member_data_offsets[self.member_offsets]
+
+        self.data = np.empty(member_data_offsets[-1], dtype=np.float64)
+        self.weight = np.empty_like(self.data) if has_weights else None
+        for i, dataset_model in enumerate(dataset_models):
+            is_member = member_dataset == i
+            indices = member_data_offsets[:-1][is_member, np.newaxis] + np.arange(
+                model_axis_sizes[i]
+            )
+            global_indices = member_global_index[is_member]
+            self.data[indices] = dataset_model.get_data()[:, global_indices].T
+            if self.weight is not None:
+                weight = dataset_model.get_weight()
+                self.weight[indices] = weight[:, global_indices].T if weight is not None else 1
+
+        has_scaling = np.asarray(
+            [dataset_model.scale is not None for dataset_model in dataset_models]
+        )
+        has_weight = np.asarray(
+            [dataset_model.get_weight() is not None for dataset_model in dataset_models]
+        )
+        self.has_scaling = (
+            np.logical_or.reduceat(has_scaling[member_dataset], self.member_offsets[:-1])
+            if number_of_groups
+            else np.zeros(0, dtype=bool)
+        )
+        self.has_weight = (
+            np.logical_or.reduceat(has_weight[member_dataset], self.member_offsets[:-1])
+            if number_of_groups
+            else np.zeros(0, dtype=bool)
+        )
+        self.group_labels = [
+            "".join(labels[i] for i in member_dataset[start:end])
+            for start, end in zip(self.member_offsets[:-1], self.member_offsets[1:])
+        ]
+
+        global_dimension = problem._global_dimension
+        model_dimension = problem._model_dimension
+        axes = [
+            {
+                model_dimension: dataset_model.get_model_axis(),
+                global_dimension: dataset_model.get_global_axis(),
+            }
+            for dataset_model in dataset_models
+        ]
+        self._problems = [
+            ProblemGroup(
+                data=self.data[self.data_offsets[i] : self.data_offsets[i + 1]],
+                weight=self.weight[self.data_offsets[i] : self.data_offsets[i + 1]]
+                if self.weight is not None
+                else None,
+                has_scaling=bool(self.has_scaling[i]),
+                group=self.group_labels[i],
+                data_sizes=self.member_sizes[start:end].tolist(),
+                descriptor=[
+                    GroupedProblemDescriptor(
+                        labels[dataset_index],
+                        {global_dimension: global_index},
+                        axes[dataset_index],
+                    )
+                    for dataset_index, global_index in zip(
+                        member_dataset[start:end].tolist(), member_global_index[start:end].tolist()
+                    )
+                ],
+            )
+            for i, (start, end) in enumerate(
+                zip(self.member_offsets[:-1], self.member_offsets[1:])
+            )
+        ]
+
+    def __len__(self) -> int:
+        return len(self._problems)
+
+    def __getitem__(self, index: int) -> ProblemGroup:
+        return self._problems[index]
+
+    def __iter__(self) -> Iterator[ProblemGroup]:
+        return iter(self._problems)
 
 
 class GroupedProblem(Problem):
@@ -48,141 +181,66 @@ class GroupedProblem(Problem):
             raise ValueError(
                 f"Cannot group datasets. Model dimension '{model_dimensions}' do not match."
             )
-        self._index_dependent = any(d.is_index_dependent() for d in self.dataset_models.values())
+        self._index_dependent = self.model.need_index_dependent() or any(
+            d.is_index_dependent() for d in self.dataset_models.values()
+        )
         self._global_dimension = global_dimensions.pop()
         self._model_dimension = model_dimensions.pop()
         self._group_clp_labels = None
         self._groups = None
+        self._global_index_maps = None
+        self._combined_matrices = None
+        self._clp_penalty_indices = None
         self._has_weights = any("weight" in d for d in self._data.values())
 
     @property
-    def bag(self) -> Bag:
-        if not self._bag:
+    def bag(self) -> GroupedBag:
+        if self._bag is None:
             self.init_bag()
         return self._bag
 
     def init_bag(self):
-        """Initializes a grouped problem bag."""
-        self._bag = None
-        datasets = None
-        for label, dataset_model in self.dataset_models.items():
+        """Initializes a grouped problem bag.
 
-            data = dataset_model.get_data()
-            weight = dataset_model.get_weight()
-            if weight is None and self._has_weights:
-                weight = np.ones_like(data)
-
-            global_axis = dataset_model.get_global_axis()
-            model_axis = dataset_model.get_model_axis()
-            has_scaling = dataset_model.scale is not None
-
-            if self._bag is None:
-                self._bag = collections.deque(
-                    ProblemGroup(
-                        data=data[:, i],
-                        weight=weight[:, i] if weight is not None else None,
-                        has_scaling=has_scaling,
-                        group=label,
-                        data_sizes=[model_axis.size],
-                        descriptor=[
-                            GroupedProblemDescriptor(
-                                label,
-                                {
-                                    self._global_dimension: i,
-                                },
-                                {
-                                    self._model_dimension: model_axis,
-                                    self._global_dimension: global_axis,
-                                },
-                            )
-                        ],
-                    )
-                    for i, value in enumerate(global_axis)
-                )
-                datasets = collections.deque([label] for _, _ in enumerate(global_axis))
-                self._full_axis = collections.deque(global_axis)
-            else:
-                self._append_to_grouped_bag(
-                    label, datasets, global_axis, model_axis, data, weight, has_scaling
-                )
-        self._full_axis = np.asarray(self._full_axis)
-        self._groups = {"".join(d): d for d in datasets}
+        The global axes of the datasets are aligned on the full axis first, recording for
+        every dataset which group each of its global indices belongs to. The data of all groups
+        is then packed into one contiguous buffer in a single pass per dataset.
+        """
+        labels = list(self.dataset_models)
+        global_axes = [self.dataset_models[label].get_global_axis() for label in labels]
 
-    def _append_to_grouped_bag(
-        self,
-        label: str,
-        datasets: Deque[str],
-        global_axis: np.ndarray,
-        model_axis: np.ndarray,
-        data: xr.DataArray,
-        weight: xr.DataArray,
-        has_scaling: bool,
-    ):
-        i1, i2 = find_overlap(self._full_axis, global_axis, atol=self._scheme.group_tolerance)
+        full_axis, index_maps = align_axes(global_axes, atol=self._scheme.group_tolerance)
+        self._global_index_maps = dict(zip(labels, index_maps))
 
-        for i, j in enumerate(i1):
-            datasets[j].append(label)
-            data_stripe = data[:, i2[i]]
-            self._bag[j] = ProblemGroup(
-                data=np.concatenate(
-                    [
-                        self._bag[j].data,
-                        data_stripe,
-                    ]
-                ),
-                weight=np.concatenate([self._bag[j].weight, weight[:, i2[i]]])
-                if weight is not None
-                else None,
-                has_scaling=has_scaling or self._bag[j].has_scaling,
-                group=self._bag[j].group + label,
-                data_sizes=self._bag[j].data_sizes + [data_stripe.size],
-                descriptor=self._bag[j].descriptor
-                + [
-                    GroupedProblemDescriptor(
-                        label,
-                        {
-                            self._global_dimension: i2[i],
-                        },
-                        {
-                            self._model_dimension: model_axis,
-                            self._global_dimension: global_axis,
-                        },
-                    )
-                ],
-            )
-
-        # Add non-overlaping regions
-        begin_overlap = i2[0] if len(i2) != 0 else 0
-        end_overlap = i2[-1] + 1 if len(i2) != 0 else 0
-        for i in itertools.chain(range(begin_overlap), range(end_overlap, len(global_axis))):
-            data_stripe = data[:, i]
-            problem = ProblemGroup(
-                data=data_stripe,
-                weight=weight[:, i] if weight is not None else None,
-                has_scaling=has_scaling,
-                group=label,
-                data_sizes=[data_stripe.size],
-                descriptor=[
-                    GroupedProblemDescriptor(
-                        label,
-                        {
-                            self._global_dimension: i,
-                        },
-                        {
-                            self._model_dimension: model_axis,
-                            self._global_dimension: global_axis,
-                        },
-                    )
-                ],
+        member_group = np.concatenate(index_maps)
+        member_dataset = np.concatenate(
+            [np.full(index_map.size, i) for i, index_map in enumerate(index_maps)]
+        )
+        member_global_index = np.concatenate(
+            [np.arange(index_map.size) for index_map in index_maps]
+        )
+        order = np.lexsort((member_dataset, member_group))
+        member_group = member_group[order]
+        member_dataset = member_dataset[order]
+        member_global_index = member_global_index[order]
+
+        self._bag = GroupedBag(
+            self,
+            labels,
+            full_axis.size,
+            member_group,
+            member_dataset,
+            member_global_index,
+        )
+        self._full_axis = full_axis
+        self._groups = {
+            group: [labels[i] for i in member_dataset[start:end]]
+            for group, start, end in zip(
+                self._bag.group_labels,
+                self._bag.member_offsets[:-1],
+                self._bag.member_offsets[1:],
             )
-            if i < end_overlap:
-                datasets.appendleft([label])
-                self._full_axis.appendleft(global_axis[i])
-                self._bag.appendleft(problem)
-            else:
-                datasets.append([label])
-                self._full_axis.append(global_axis[i])
-                self._bag.append(problem)
+        }
 
     @property
     def groups(self) -> dict[str, list[str]]:
@@ -198,44 +256,92 @@ class GroupedProblem(Problem):
         else:
             self.calculate_index_independent_matrices()
 
+    def _needs_index_dependent_datasets(self) -> bool:
+        """Datasets of grouped problems keep their own index dependency.
+
+        Interval restricted relations and constraints are applied when reducing the combined
+        matrix of each group, so the matrices of index independent datasets only need to be
+        calculated once.
+        """
+        return False
+
     def calculate_index_dependent_matrices(
         self,
-    ) -> tuple[dict[str, list[CalculatedMatrix]], list[CalculatedMatrix],]:
-        """Calculates the index dependent model matrices."""
+    ) -> tuple[dict[str, list[CalculatedMatrix] | CalculatedMatrix], list[CalculatedMatrix],]:
+        """Calculates the index dependent model matrices.
+
+        The matrices of index dependent datasets are calculated for all indices at once, so that
+        megacomplexes can vectorize over the global axis. Index independent datasets are
+        calculated once and combined with the other datasets of each group.
+        """
 
         def calculate_group(
-            group: ProblemGroup, descriptors: dict[str, DatasetModel]
-        ) -> tuple[list[CalculatedMatrix], list[str], CalculatedMatrix]:
-            matrices = [
-                calculate_matrix(
-                    descriptors[problem.label],
-                    problem.indices,
-                )
-                for problem in group.descriptor
-            ]
+            group: ProblemGroup, buffer: np.ndarray | None
+        ) -> tuple[list[str], CalculatedMatrix, np.ndarray]:
             global_index = group.descriptor[0].indices[self._global_dimension]
             global_index = group.descriptor[0].axis[self._global_dimension][global_index]
-            combined_matrix = combine_matrices(matrices)
-            group_clp_labels = combined_matrix.clp_labels
+            combined_matrix = combine_matrices(
+                [self._get_dataset_matrix(descriptor) for descriptor in group.descriptor],
+                out=buffer,
+            )
             reduced_matrix = reduce_matrix(
-                combined_matrix, self.model, self.parameters, global_index
+                combined_matrix,
+                self.model,
+                self.parameters,
+                global_index,
+                self._clp_label_registry,
             )
-            return matrices, group_clp_labels, reduced_matrix
+            return combined_matrix.clp_labels, reduced_matrix, combined_matrix.matrix
+
+        self._matrices = {
+            label: calculate_index_dependent_matrices(dataset_model)
+            if dataset_model.is_index_dependent()
+            else calculate_matrix(dataset_model, {})
+            for label, dataset_model in self.dataset_models.items()
+        }
+        # The combined matrices of the previous evaluation are reused as buffers.
+        buffers = self._combined_matrices or [None] * len(self.bag)
+        results = []
+        previous_segment_key = None
+        for group, buffer in zip(self.bag, buffers):
+            # Consecutive groups of index independent datasets where the same relations and
+            # constraints apply form a segment, which shares one reduced matrix.
+            segment_key = self._get_segment_key(group)
+            if segment_key is not None and segment_key == previous_segment_key:
+                clp_labels, reduced_matrix, _ = results[-1]
+                results.append((clp_labels, reduced_matrix, None))
+            else:
+                results.append(calculate_group(group, buffer))
+            previous_segment_key = segment_key
 
-        results = list(map(lambda group: calculate_group(group, self.dataset_models), self.bag))
+        self._group_clp_labels = list(map(lambda result: result[0], results))
+        self._reduced_matrices = list(map(lambda result: result[1], results))
+        self._combined_matrices = list(map(lambda result: result[2], results))
+        return self._matrices, self._reduced_matrices
 
-        matrices = list(map(lambda result: result[0], results))
+    def _get_segment_key(self, group: ProblemGroup) -> tuple[str, bytes, bytes] | None:
+        """Returns a key identifying the reduced matrix of a group of index independent datasets.
 
-        self._matrices = {}
-        for i, grouped_problem in enumerate(self._bag):
-            for j, descriptor in enumerate(grouped_problem.descriptor):
-                if descriptor.label not in self._matrices:
-                    self._matrices[descriptor.label] = []
-                self._matrices[descriptor.label].append(matrices[i][j])
-
-        self._group_clp_labels = list(map(lambda result: result[1], results))
-        self._reduced_matrices = list(map(lambda result: result[2], results))
-        return self._matrices, self._reduced_matrices
+        Returns ``None`` if any dataset of the group is index dependent.
+        """
+        if any(
+            self.dataset_models[descriptor.label].is_index_dependent()
+            for descriptor in group.descriptor
+        ):
+            return None
+        global_index = group.descriptor[0].indices[self._global_dimension]
+        global_index = group.descriptor[0].axis[self._global_dimension][global_index]
+        relation_applies, constraint_applies = self._clp_label_registry.get_applicability(
+            self.model, global_index
+        )
+        return group.group, relation_applies.tobytes(), constraint_applies.tobytes()
+
+    def _get_dataset_matrix(self, descriptor: GroupedProblemDescriptor) -> CalculatedMatrix:
+        """Returns the matrix of a dataset at the global index of a group member."""
+        matrix = self._matrices[descriptor.label]
+        if self.dataset_models[descriptor.label].is_index_dependent():
+            return matrix[descriptor.indices[self._global_dimension]]
+        return matrix
 
     def calculate_index_independent_matrices(
         self,
@@ -256,6 +362,7 @@ class GroupedProblem(Problem):
                 self.model,
                 self.parameters,
                 None,
+                self._clp_label_registry,
             )
 
         for group_label, group in self.groups.items():
@@ -273,25 +380,18 @@ class GroupedProblem(Problem):
         return self._matrices, self._reduced_matrices
 
     def calculate_residual(self):
-        results = (
-            list(
-                map(
-                    self._index_dependent_residual,
-                    self.bag,
-                    self.reduced_matrices,
-                    self._group_clp_labels,
-                    self._full_axis,
-                )
-            )
-            if self._index_dependent
-            else list(map(self._index_independent_residual, self.bag, self._full_axis))
-        )
+        results = self._get_residual_results()
 
         self._clp_labels = list(map(lambda result: result[0], results))
         self._grouped_clps = list(map(lambda result: result[1], results))
+        self._reduced_clps = list(map(lambda result: result[4], results))
 
         self._weighted_residuals = list(map(lambda result: result[2], results))
         self._residuals = list(map(lambda result: result[3], results))
+        if self._clp_penalty_indices is None:
+            self._clp_penalty_indices = get_clp_penalty_indices(
+                self.model, self._full_axis, self.dataset_models
+            )
         self._additional_penalty = calculate_clp_penalties(
             self.model,
             self.parameters,
@@ -299,32 +399,214 @@ class GroupedProblem(Problem):
             self._grouped_clps,
             self._full_axis,
             self.dataset_models,
+            self._clp_penalty_indices,
+            self._clp_label_registry,
         )
 
         return self._reduced_clps, self._clps, self._weighted_residuals, self._residuals
 
-    def _index_dependent_residual(
+    def _calculate_residual_results(
         self,
-        problem: ProblemGroup,
-        matrix: CalculatedMatrix,
-        clp_labels: str,
-        index: any,
-    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    ) -> list[tuple[list[str], np.ndarray, np.ndarray, np.ndarray, np.ndarray]]:
+        """Calculates the results of every group.
 
+        Returns
+        -------
+        list[tuple[list[str], np.ndarray, np.ndarray, np.ndarray, np.ndarray]]
+            The clp labels, clps, weighted residual, residual and reduced clps of every group.
+        """
+        if self._index_dependent:
+            return self._map_global_indices(
+                self._index_dependent_residual,
+                self.bag,
+                self.reduced_matrices,
+                self._group_clp_labels,
+                self._full_axis,
+            )
+        return self._calculate_index_independent_residuals()
+
+    def _merge_residual_results(
+        self, results: list[list[tuple[list[str], np.ndarray, np.ndarray, np.ndarray, np.ndarray]]]
+    ) -> list[tuple[list[str], np.ndarray, np.ndarray, np.ndarray, np.ndarray]]:
+        return [result for partition in results for result in partition]
+
+    def _get_global_index_partitions(
+        self, number_of_partitions: int
+    ) -> list[dict[str, np.ndarray]] | None:
+        """Splits the groups into contiguous partitions of the full axis.
+
+        A partition contains the global indices of every dataset which belong to its groups.
+        Partitions are extended until they contain every dataset.
+        """
+        if self._bag is None:
+            self.init_bag()
+        size = self._full_axis.size
+        boundaries = [
+            split[-1] + 1
+            for split in np.array_split(np.arange(size), number_of_partitions)
+            if split.size != 0
+        ]
+        partitions = []
+        start = 0
+        for end in boundaries:
+            if all(
+                np.any((index_map >= start) & (index_map < end))
+                for index_map in self._global_index_maps.values()
+            ):
+                partitions.append((start, end))
+                start = end
+        if start != size:
+            partitions[-1:] = [(partitions[-1][0] if len(partitions) != 0 else 0, size)]
+        return [
+            {
+                label: np.flatnonzero((index_map >= start) & (index_map < end))
+                for label, index_map in self._global_index_maps.items()
+            }
+            for start, end in partitions
+        ]
+
+    def _calculate_index_independent_residuals(
+        self,
+    ) -> list[tuple[list[str], np.ndarray, np.ndarray, np.ndarray, np.ndarray]]:
+        """Calculates the residuals of all groups for index independent matrices.
+
+        All groups with the same label share the same reduced matrix. Unless they are weighted,
+        they are solved together as one least-squares problem with multiple columns.
+        """
+        bag = self.bag
+        weighted_indices = []
+        batches = collections.defaultdict(list)
+        for i, (group, has_weight) in enumerate(zip(bag.group_labels, bag.has_weight)):
+            if has_weight:
+                weighted_indices.append(i)
+            else:
+                batches[group].append(i)
+
+        # the matrices are calculated before the groups are mapped over by the threads
+        reduced_matrices = self.reduced_matrices
+        results = [None] * len(bag)
+        weighted_results = self._map_global_indices(
+            self._index_independent_residual,
+            [bag[i] for i in weighted_indices],
+            [reduced_matrices[bag.group_labels[i]] for i in weighted_indices],
+            [self._full_axis[i] for i in weighted_indices],
+        )
+        for i, result in zip(weighted_indices, weighted_results):
+            results[i] = result
+        batch_results = self._map_global_indices(
+            self._batched_index_independent_residual,
+            batches.keys(),
+            batches.values(),
+            [reduced_matrices[group] for group in batches.keys()],
+        )
+        for indices, batch_result in zip(batches.values(), batch_results):
+            for i, result in zip(indices, batch_result):
+                results[i] = result
+        return results
+
+    def _batched_index_independent_residual(
+        self, group: str, indices: list[int], matrix: CalculatedMatrix
+    ) -> list[tuple[list[str], np.ndarray, np.ndarray, np.ndarray, np.ndarray]]:
+        """Calculates the residuals of unweighted groups with the same label at once."""
+        bag = self.bag
+        indices = np.asarray(indices)
+        problem = bag[indices[0]]
         reduced_clp_labels = matrix.clp_labels
-        matrix = matrix.matrix
-        if problem.weight is not None:
-            apply_weight(matrix, problem.weight)
-        data = problem.data
+        matrix = self._get_scaled_matrix(problem, matrix.matrix)
+        # the data of the groups are gathered into the columns of one fortran ordered buffer,
+        # in which the residuals are calculated
+        residuals = self._workspace.get(
+            ("batched_residual", group), (indices.size, problem.data.size)
+        ).T
+        np.take(
+            bag.data,
+            bag.data_offsets[indices, np.newaxis] + np.arange(problem.data.size),
+            out=residuals.T,
+        )
+        reduced_clps, residuals = self._calculate_clps_and_residual(
+            matrix, residuals, group, overwrite_matrix=True, residual_buffer=residuals
+        )
+
+        clp_labels = self._group_clp_labels[group]
+        results = []
+        for column, i in enumerate(indices):
+            clps = retrieve_clps(
+                self.model,
+                self.parameters,
+                clp_labels,
+                reduced_clp_labels,
+                reduced_clps[:, column],
+                self._full_axis[i],
+                self._clp_label_registry,
+            )
+            results.append(
+                (
+                    clp_labels,
+                    clps,
+                    residuals[:, column],
+                    residuals[:, column],
+                    reduced_clps[:, column],
+                )
+            )
+        return results
+
+    def _get_scaled_matrix(self, problem: ProblemGroup, matrix: np.ndarray) -> np.ndarray:
+        """Returns a copy of a group matrix with the rows of every dataset scaled.
+
+        The copy is a scratch buffer of the workspace, which may be factorized in place.
+        """
+        scaled_matrix = self._workspace.get_scratch("matrix", matrix.shape)
+        np.copyto(scaled_matrix, matrix)
+        matrix = scaled_matrix
         if problem.has_scaling:
             for i, descriptor in enumerate(problem.descriptor):
-                label = descriptor.label
-                if self.dataset_models[label] is not None:
+                scale = self.dataset_models[descriptor.label].scale
+                if scale is not None:
                     start = sum(problem.data_sizes[0:i])
                     end = start + problem.data_sizes[i]
-                    matrix[start:end, :] *= self.dataset_models[label].scale
+                    matrix[start:end, :] *= scale
+        return matrix
+
+    def _calculate_group_residual(
+        self, problem: ProblemGroup, matrix: np.ndarray, index: any
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Calculates the reduced clps, weighted residual and residual of a single group.
+
+        The weighted residual and residual are calculated in buffers of the workspace, which
+        are kept per global index.
+        """
+        matrix = self._get_scaled_matrix(problem, matrix)
+        if problem.weight is not None:
+            apply_weight(matrix, problem.weight)
 
-        reduced_clps, weighted_residual = self._residual_function(matrix, data)
+        reduced_clps, weighted_residual = self._calculate_clps_and_residual(
+            matrix,
+            problem.data,
+            (problem.group, index),
+            overwrite_matrix=True,
+            residual_buffer=self._workspace.get(("weighted_residual", index), problem.data.shape),
+        )
+        if problem.weight is None:
+            return reduced_clps, weighted_residual, weighted_residual
+        residual = np.divide(
+            weighted_residual,
+            problem.weight,
+            out=self._workspace.get(("residual", index), problem.data.shape),
+        )
+        return reduced_clps, weighted_residual, residual
+
+    def _index_dependent_residual(
+        self,
+        problem: ProblemGroup,
+        matrix: CalculatedMatrix,
+        clp_labels: str,
+        index: any,
+    ) -> tuple[list[str], np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+
+        reduced_clp_labels = matrix.clp_labels
+        reduced_clps, weighted_residual, residual = self._calculate_group_residual(
+            problem, matrix.matrix, index
+        )
         clps = retrieve_clps(
             self.model,
             self.parameters,
@@ -332,27 +614,17 @@ class GroupedProblem(Problem):
             reduced_clp_labels,
             reduced_clps,
             index,
+            self._clp_label_registry,
         )
-        residual = (
-            weighted_residual / problem.weight if problem.weight is not None else weighted_residual
-        )
-        return clp_labels, clps, weighted_residual, residual
+        return clp_labels, clps, weighted_residual, residual, reduced_clps
 
-    def _index_independent_residual(self, problem: ProblemGroup, index: any):
-        matrix = self.reduced_matrices[problem.group]
+    def _index_independent_residual(
+        self, problem: ProblemGroup, matrix: CalculatedMatrix, index: any
+    ) -> tuple[list[str], np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
         reduced_clp_labels = matrix.clp_labels
-        matrix = matrix.matrix.copy()
-        if problem.weight is not None:
-            apply_weight(matrix, problem.weight)
-        data = problem.data
-        if problem.has_scaling:
-            for i, descriptor in enumerate(problem.descriptor):
-                label = descriptor.label
-                if self.dataset_models[label] is not None:
-                    start = sum(problem.data_sizes[0:i])
-                    end = start + problem.data_sizes[i]
-                    matrix[start:end, :] *= self.dataset_models[label].scale
-        reduced_clps, weighted_residual = self._residual_function(matrix, data)
+        reduced_clps, weighted_residual, residual = self._calculate_group_residual(
+            problem, matrix.matrix, index
+        )
         clp_labels = self._group_clp_labels[problem.group]
         clps = retrieve_clps(
             self.model,
@@ -361,32 +633,178 @@ class GroupedProblem(Problem):
             reduced_clp_labels,
             reduced_clps,
             index,
+            self._clp_label_registry,
+        )
+        return clp_labels, clps, weighted_residual, residual, reduced_clps
+
+    def calculate_jacobian(self, free_parameter_labels: list[str]) -> np.ndarray:
+        """Calculates the jacobian of :attr:`full_penalty` with respect to the free parameters.
+
+        The jacobian is calculated with Kaufman's approximation of the variable projection
+        from the matrix derivatives provided by the megacomplexes.
+
+        Parameters
+        ----------
+        free_parameter_labels : list[str]
+            The labels of the free parameters, one per column of the jacobian.
+        """
+        if self._reduced_clps is None:
+            self.calculate_residual()
+
+        # The derivatives of index independent datasets are the same for all groups.
+        dataset_derivatives = {
+            label: calculate_matrix_derivatives(dataset_model, {}, self.matrices[label].clp_labels)
+            for label, dataset_model in self.dataset_models.items()
+            if not dataset_model.is_index_dependent()
+        }
+
+        if self._index_dependent:
+            return np.concatenate(
+                [
+                    self._calculate_index_dependent_group_jacobian(
+                        i, problem, matrices, dataset_derivatives, free_parameter_labels
+                    )
+                    for i, (problem, matrices) in enumerate(
+                        zip(self.bag, self._get_group_matrices())
+                    )
+                ]
+            )
+
+        return np.concatenate(
+            [
+                self._calculate_index_independent_group_jacobian(
+                    i, problem, dataset_derivatives, free_parameter_labels
+                )
+                for i, problem in enumerate(self.bag)
+            ]
+        )
+
+    def _get_group_matrices(self) -> list[list[CalculatedMatrix]]:
+        """Returns the dataset matrices of each group."""
+        if self._matrices is None:
+            self.calculate_matrices()
+        return [
+            [self._get_dataset_matrix(descriptor) for descriptor in problem.descriptor]
+            for problem in self.bag
+        ]
+
+    def _calculate_index_dependent_group_jacobian(
+        self,
+        group_index: int,
+        problem: ProblemGroup,
+        matrices: list[CalculatedMatrix],
+        dataset_derivatives: dict[str, dict[str, CalculatedMatrix]],
+        free_parameter_labels: list[str],
+    ) -> np.ndarray:
+        global_index = problem.descriptor[0].indices[self._global_dimension]
+        global_index = problem.descriptor[0].axis[self._global_dimension][global_index]
+        reduced_matrix = self.reduced_matrices[group_index].matrix.copy()
+        derivatives = [
+            dataset_derivatives[descriptor.label]
+            if descriptor.label in dataset_derivatives
+            else calculate_matrix_derivatives(
+                self.dataset_models[descriptor.label], descriptor.indices, matrix.clp_labels
+            )
+            for descriptor, matrix in zip(problem.descriptor, matrices)
+        ]
+        reduced_derivatives = [
+            reduce_matrix(
+                combine_matrices(
+                    [
+                        dataset_derivatives.get(
+                            parameter_label,
+                            CalculatedMatrix(matrix.clp_labels, np.zeros_like(matrix.matrix)),
+                        )
+                        for dataset_derivatives, matrix in zip(derivatives, matrices)
+                    ]
+                ),
+                self.model,
+                self.parameters,
+                global_index,
+                self._clp_label_registry,
+            ).matrix
+            for parameter_label in free_parameter_labels
+        ]
+        return self._calculate_group_jacobian(
+            group_index, problem, reduced_matrix, reduced_derivatives
+        )
+
+    def _calculate_index_independent_group_jacobian(
+        self,
+        group_index: int,
+        problem: ProblemGroup,
+        dataset_derivatives: dict[str, dict[str, CalculatedMatrix]],
+        free_parameter_labels: list[str],
+    ) -> np.ndarray:
+        reduced_matrix = self.reduced_matrices[problem.group].matrix.copy()
+        reduced_derivatives = []
+        for parameter_label in free_parameter_labels:
+            derivatives = []
+            for descriptor in problem.descriptor:
+                reduced_dataset_matrix = self.reduced_matrices[descriptor.label]
+                derivative = dataset_derivatives[descriptor.label].get(parameter_label)
+                derivatives.append(
+                    reduce_matrix(
+                        derivative, self.model, self.parameters, None, self._clp_label_registry
+                    )
+                    if derivative is not None
+                    else CalculatedMatrix(
+                        reduced_dataset_matrix.clp_labels,
+                        np.zeros_like(reduced_dataset_matrix.matrix),
+                    )
+                )
+            reduced_derivatives.append(combine_matrices(derivatives).matrix)
+        return self._calculate_group_jacobian(
+            group_index, problem, reduced_matrix, reduced_derivatives
         )
-        residual = (
-            weighted_residual / problem.weight if problem.weight is not None else weighted_residual
+
+    def _calculate_group_jacobian(
+        self,
+        group_index: int,
+        problem: ProblemGroup,
+        reduced_matrix: np.ndarray,
+        reduced_derivatives: list[np.ndarray],
+    ) -> np.ndarray:
+        if problem.weight is not None:
+            reduced_matrix *= problem.weight[:, np.newaxis]
+            for derivative in reduced_derivatives:
+                derivative *= problem.weight[:, np.newaxis]
+        if problem.has_scaling:
+            for i, descriptor in enumerate(problem.descriptor):
+                scale = self.dataset_models[descriptor.label].scale
+                if scale is not None:
+                    start = sum(problem.data_sizes[0:i])
+                    end = start + problem.data_sizes[i]
+                    reduced_matrix[start:end, :] *= scale
+                    for derivative in reduced_derivatives:
+                        derivative[start:end, :] *= scale
+
+        return jacobian_variable_projection(
+            reduced_matrix, reduced_derivatives, self.reduced_clps[group_index]
         )
-        return clp_labels, clps, weighted_residual, residual
 
     def prepare_result_creation(self):
         if self._residuals is None:
             self.calculate_residual()
         full_clp_labels = self._clp_labels
         full_clps = self._grouped_clps
+        registry = self._clp_label_registry
         self._clps = {}
         for label, matrix in self.matrices.items():
             # TODO deal with different clps at indices
-            clp_labels = matrix[0].clp_labels if self._index_dependent else matrix.clp_labels
+            clp_labels = (
+                matrix[0].clp_labels
+                if self.dataset_models[label].is_index_dependent()
+                else matrix.clp_labels
+            )
 
-            # find offset in the full axis
             global_axis = self.dataset_models[label].get_global_axis()
-            offset = find_closest_index(global_axis[0], self._full_axis)
 
+            clp_ids = registry.encode(clp_labels).ids
             clps = []
-            for i in range(global_axis.size):
-                full_index_clp_labels = full_clp_labels[i + offset]
-                index_clps = full_clps[i + offset]
-                mask = [full_index_clp_labels.index(clp_label) for clp_label in clp_labels]
-                clps.append(index_clps[mask])
+            for full_index in self._global_index_maps[label]:
+                positions = registry.encode(full_clp_labels[full_index]).positions
+                clps.append(full_clps[full_index][positions[clp_ids]])
 
             self._clps[label] = xr.DataArray(
                 clps,
@@ -488,43 +906,41 @@ class GroupedProblem(Problem):
     @property
     def full_penalty(self) -> np.ndarray:
         if self._full_penalty is None:
-            residuals = self.weighted_residuals
-            additional_penalty = self.additional_penalty
-
-            self._full_penalty = (
-                np.concatenate((np.concatenate(residuals), additional_penalty))
-                if additional_penalty is not None
-                else np.concatenate(residuals)
+            self._full_penalty = self._concatenate_penalty(
+                self.weighted_residuals, self.additional_penalty
             )
         return self._full_penalty
 
 
-def combine_matrices(matrices: list[CalculatedMatrix]) -> CalculatedMatrix:
-    masks = []
-    full_clp_labels = None
-    sizes = []
-    dim1 = 0
-    for matrix in matrices:
-        clp_labels = matrix.clp_labels
-        model_axis_size = matrix.matrix.shape[0]
-        sizes.append(model_axis_size)
-        dim1 += model_axis_size
-        if full_clp_labels is None:
-            full_clp_labels = clp_labels.copy()
-            masks.append([i for i, _ in enumerate(clp_labels)])
-        else:
-            mask = []
-            for c in clp_labels:
-                if c not in full_clp_labels:
-                    full_clp_labels.append(c)
-                mask.append(full_clp_labels.index(c))
-            masks.append(mask)
-    dim2 = len(full_clp_labels)
-    full_matrix = np.zeros((dim1, dim2), dtype=np.float64)
+def combine_matrices(
+    matrices: list[CalculatedMatrix], out: np.ndarray | None = None
+) -> CalculatedMatrix:
+    """Stacks the matrices of the datasets of a group on the union of their clp labels.
+
+    Parameters
+    ----------
+    matrices : list[CalculatedMatrix]
+        The matrices to combine.
+    out : np.ndarray | None
+        A buffer for the combined matrix, which is used if it has the right shape.
+
+    Returns
+    -------
+    CalculatedMatrix
+        The combined matrix.
+    """
+    clp_label_union = get_clp_label_union([matrix.clp_labels for matrix in matrices])
+    shape = (sum(matrix.matrix.shape[0] for matrix in matrices), len(clp_label_union.clp_labels))
+    if out is not None and out.shape == shape:
+        full_matrix = out
+        full_matrix.fill(0)
+    else:
+        full_matrix = np.zeros(shape, dtype=np.float64)
+
     start = 0
-    for i, m in enumerate(matrices):
-        end = start + sizes[i]
-        full_matrix[start:end, masks[i]] = m.matrix
+    for matrix, columns in zip(matrices, clp_label_union.columns):
+        end = start + matrix.matrix.shape[0]
+        full_matrix[start:end, columns] = matrix.matrix
         start = end
 
-    return CalculatedMatrix(full_clp_labels, full_matrix)
+    return CalculatedMatrix(list(clp_label_union.clp_labels), full_matrix)
@@ -1,5 +1,7 @@
 from __future__ import annotations
 
+from typing import Any
+
 import numpy as np
 import xarray as xr
 
@@ -8,9 +10,15 @@ from glotaran.analysis.problem import Problem
 from glotaran.analysis.util import CalculatedMatrix
 from glotaran.analysis.util import apply_weight
 from glotaran.analysis.util import calculate_clp_penalties
+from glotaran.analysis.util import calculate_index_dependent_matrices
 from glotaran.analysis.util import calculate_matrix
+from glotaran.analysis.util import calculate_matrix_derivatives
+from glotaran.analysis.util import get_clp_penalty_indices
 from glotaran.analysis.util import reduce_matrix
 from glotaran.analysis.util import retrieve_clps
+from glotaran.analysis.variable_projection import jacobian_variable_projection
+from glotaran.analysis.variable_projection import residual_variable_projection
+from glotaran.analysis.variable_projection import residual_variable_projection_kronecker
 from glotaran.model import DatasetModel
 from glotaran.project import Scheme
 
@@ -28,16 +36,17 @@ class UngroupedProblem(Problem):
         super().__init__(scheme=scheme)
 
         self._global_matrices = {}
+        # The global indices of the clp penalty areas by dataset label.
+        self._clp_penalty_indices = {}
         self._flattened_data = {}
         self._flattened_weights = {}
         for label, dataset_model in self.dataset_models.items():
             if dataset_model.has_global_model():
+                # the data of the dataset model is already weighted
                 self._flattened_data[label] = dataset_model.get_data().T.flatten()
                 weight = dataset_model.get_weight()
                 if weight is not None:
-                    weight = weight.T.flatten()
-                    self._flattened_data[label] *= weight
-                    self._flattened_weight[label] = weight
+                    self._flattened_weights[label] = weight.T.flatten()
 
     @property
     def global_matrices(self) -> dict[str, CalculatedMatrix]:
@@ -70,23 +79,22 @@ class UngroupedProblem(Problem):
         return self._matrices, self._reduced_matrices
 
     def _calculate_index_dependent_matrix(self, label: str, dataset_model: DatasetModel):
-        self._matrices[label] = []
+        self._matrices[label] = calculate_index_dependent_matrices(dataset_model)
         self._reduced_matrices[label] = []
-        for i, index in enumerate(dataset_model.get_global_axis()):
-            matrix = calculate_matrix(
-                dataset_model,
-                {dataset_model.get_global_dimension(): i},
-            )
-            self._matrices[label].append(matrix)
-            if not dataset_model.has_global_model():
-                reduced_matrix = reduce_matrix(matrix, self.model, self.parameters, index)
+        if not dataset_model.has_global_model():
+            for matrix, index in zip(self._matrices[label], dataset_model.get_global_axis()):
+                reduced_matrix = reduce_matrix(
+                    matrix, self.model, self.parameters, index, self._clp_label_registry
+                )
                 self._reduced_matrices[label].append(reduced_matrix)
 
     def _calculate_index_independent_matrix(self, label: str, dataset_model: DatasetModel):
         matrix = calculate_matrix(dataset_model, {})
         self._matrices[label] = matrix
         if not dataset_model.has_global_model():
-            reduced_matrix = reduce_matrix(matrix, self.model, self.parameters, None)
+            reduced_matrix = reduce_matrix(
+                matrix, self.model, self.parameters, None, self._clp_label_registry
+            )
             self._reduced_matrices[label] = reduced_matrix
 
     def _calculate_global_matrix(self, label: str, dataset_model: DatasetModel):
@@ -109,79 +117,230 @@ class UngroupedProblem(Problem):
         self._residuals = {}
         self._additional_penalty = []
 
+        results = self._get_residual_results()
         for label, dataset_model in self._dataset_models.items():
             if dataset_model.has_global_model():
                 self._calculate_full_model_residual(label, dataset_model)
             else:
-                self._calculate_residual(label, dataset_model)
+                self._set_residual_results(label, dataset_model, results[label])
 
         self._additional_penalty = (
             np.concatenate(self._additional_penalty) if len(self._additional_penalty) != 0 else []
         )
         return self._reduced_clps, self._clps, self._weighted_residuals, self._residuals
 
-    def _calculate_residual(self, label: str, dataset_model: DatasetModel):
-        self._reduced_clps[label] = []
-        self._clps[label] = []
-        self._weighted_residuals[label] = []
-        self._residuals[label] = []
+    def _calculate_residual_results(
+        self,
+    ) -> dict[str, list[tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, list[str]]]]:
+        """Calculates the results of every global index of the datasets without global model.
+
+        Returns
+        -------
+        dict[str, list[tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, list[str]]]]
+            The reduced clps, clps, weighted residual, residual and clp labels of every global
+            index by dataset label.
+        """
+        return {
+            label: self._calculate_dataset_residual_results(label, dataset_model)
+            for label, dataset_model in self._dataset_models.items()
+            if not dataset_model.has_global_model()
+        }
 
+    def _merge_residual_results(
+        self,
+        results: list[
+            dict[str, list[tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, list[str]]]]
+        ],
+    ) -> dict[str, list[tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, list[str]]]]:
+        return {
+            label: [result for partition in results for result in partition[label]]
+            for label in results[0]
+        }
+
+    def _get_global_index_partitions(
+        self, number_of_partitions: int
+    ) -> list[dict[str, np.ndarray]] | None:
+        """Splits the global indices of every dataset into contiguous partitions.
+
+        Datasets with a global model are solved as a whole, so they can not be partitioned.
+        """
+        if any(dataset_model.has_global_model() for dataset_model in self.dataset_models.values()):
+            return None
+        number_of_partitions = min(
+            [number_of_partitions]
+            + [
+                dataset_model.get_global_axis().size
+                for dataset_model in self.dataset_models.values()
+            ]
+        )
+        splits = {
+            label: np.array_split(
+                np.arange(dataset_model.get_global_axis().size), number_of_partitions
+            )
+            for label, dataset_model in self.dataset_models.items()
+        }
+        return [
+            {label: split[i] for label, split in splits.items()}
+            for i in range(number_of_partitions)
+        ]
+
+    def _calculate_dataset_residual_results(
+        self, label: str, dataset_model: DatasetModel
+    ) -> list[tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, list[str]]]:
         data = dataset_model.get_data()
         global_axis = dataset_model.get_global_axis()
+        weight = dataset_model.get_weight()
 
-        for i, index in enumerate(global_axis):
-            reduced_clp_labels, reduced_matrix = (
-                self.reduced_matrices[label][i]
-                if dataset_model.is_index_dependent()
-                else self.reduced_matrices[label]
-            )
-            if not dataset_model.is_index_dependent():
-                reduced_matrix = reduced_matrix.copy()
-
-            if dataset_model.scale is not None:
-                reduced_matrix *= dataset_model.scale
-
-            weight = dataset_model.get_weight()
-            if weight is not None:
-                apply_weight(reduced_matrix, weight[:, i])
+        batched_clps, batched_residuals = (
+            self._calculate_batched_residual(label, dataset_model)
+            if self._can_batch_residual(dataset_model)
+            else (None, None)
+        )
+        # the residuals are calculated in the columns of fortran ordered buffers
+        weighted_residuals = self._workspace.get(("weighted_residual", label), data.shape, "F")
+        residuals = (
+            self._workspace.get(("residual", label), data.shape, "F")
+            if weight is not None
+            else None
+        )
 
-            reduced_clps, residual = self._residual_function(reduced_matrix, data[:, i])
+        # the matrices are calculated before the indices are mapped over by the threads
+        if dataset_model.is_index_dependent():
+            reduced_matrices = self.reduced_matrices[label]
+            clp_labels = [matrix.clp_labels for matrix in self.matrices[label]]
+        else:
+            reduced_matrices = [self.reduced_matrices[label]] * global_axis.size
+            clp_labels = [self.matrices[label].clp_labels] * global_axis.size
+
+        def calculate_index_residual(
+            i: int, index: Any, reduced_matrix: CalculatedMatrix, clp_labels: list[str]
+        ) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, list[str]]:
+            reduced_clp_labels, reduced_matrix = reduced_matrix
+            if batched_clps is not None:
+                reduced_clps, residual = batched_clps[:, i], batched_residuals[:, i]
+            else:
+                scaled_matrix = self._workspace.get_scratch("matrix", reduced_matrix.shape)
+                np.copyto(scaled_matrix, reduced_matrix)
+                reduced_matrix = scaled_matrix
 
-            self._reduced_clps[label].append(reduced_clps)
+                if dataset_model.scale is not None:
+                    reduced_matrix *= dataset_model.scale
 
-            clp_labels = self._get_clp_labels(label, i)
-            self._clps[label].append(
-                retrieve_clps(
-                    self.model,
-                    self.parameters,
-                    clp_labels,
-                    reduced_clp_labels,
-                    reduced_clps,
-                    index,
+                if weight is not None:
+                    apply_weight(reduced_matrix, weight[:, i])
+
+                reduced_clps, residual = self._calculate_clps_and_residual(
+                    reduced_matrix,
+                    data[:, i],
+                    (label, i),
+                    overwrite_matrix=True,
+                    residual_buffer=weighted_residuals[:, i],
                 )
+
+            clps = retrieve_clps(
+                self.model,
+                self.parameters,
+                clp_labels,
+                reduced_clp_labels,
+                reduced_clps,
+                index,
+                self._clp_label_registry,
             )
-            self._weighted_residuals[label].append(residual)
-            if weight is not None:
-                self._residuals[label].append(residual / weight[:, i])
-            else:
-                self._residuals[label].append(residual)
+            return (
+                reduced_clps,
+                clps,
+                residual,
+                np.divide(residual, weight[:, i], out=residuals[:, i])
+                if weight is not None
+                else residual,
+                clp_labels,
+            )
+
+        return self._map_global_indices(
+            calculate_index_residual,
+            range(global_axis.size),
+            global_axis,
+            reduced_matrices,
+            clp_labels,
+        )
 
-        clp_labels = self._get_clp_labels(label)
+    def _set_residual_results(
+        self,
+        label: str,
+        dataset_model: DatasetModel,
+        results: list[tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, list[str]]],
+    ):
+        """Sets the results of a dataset and calculates its clp penalties."""
+        global_axis = dataset_model.get_global_axis()
+        self._reduced_clps[label] = [result[0] for result in results]
+        self._clps[label] = [result[1] for result in results]
+        self._weighted_residuals[label] = [result[2] for result in results]
+        self._residuals[label] = [result[3] for result in results]
+
+        if label not in self._clp_penalty_indices:
+            self._clp_penalty_indices[label] = get_clp_penalty_indices(
+                self.model, global_axis, self.dataset_models
+            )
         additional_penalty = calculate_clp_penalties(
             self.model,
             self.parameters,
-            clp_labels,
+            results[0][4],
             self._clps[label],
             global_axis,
             self.dataset_models,
+            self._clp_penalty_indices[label],
+            self._clp_label_registry,
         )
         if additional_penalty.size != 0:
             self._additional_penalty.append(additional_penalty)
 
+    def _can_batch_residual(self, dataset_model: DatasetModel) -> bool:
+        """Indicates if the residual of a dataset can be calculated for all indices at once.
+
+        This is the case if all global indices share the same reduced matrix, i.e. the dataset
+        is index independent and has no weight.
+        """
+        return not dataset_model.is_index_dependent() and dataset_model.get_weight() is None
+
+    def _calculate_batched_residual(
+        self, label: str, dataset_model: DatasetModel
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Calculates the reduced clps and residuals of all global indices with a single
+        factorization of the reduced matrix, respectively a batched nnls."""
+        reduced_matrix = self.reduced_matrices[label].matrix
+        scaled_matrix = self._workspace.get_scratch("matrix", reduced_matrix.shape)
+        np.copyto(scaled_matrix, reduced_matrix)
+        if dataset_model.scale is not None:
+            scaled_matrix *= dataset_model.scale
+        data = dataset_model.get_data()
+        return self._calculate_clps_and_residual(
+            scaled_matrix,
+            data,
+            label,
+            overwrite_matrix=True,
+            residual_buffer=self._workspace.get(("batched_residual", label), data.shape, "F"),
+        )
+
     def _calculate_full_model_residual(self, label: str, dataset_model: DatasetModel):
 
         model_matrix = self.matrices[label]
         global_matrix = self.global_matrices[label].matrix
+        weight = self._flattened_weights.get(label)
+
+        if (
+            self._residual_function is residual_variable_projection
+            and not dataset_model.is_index_dependent()
+            and weight is None
+        ):
+            # The full matrix is the kronecker product of the global and the model matrix,
+            # which can be solved without ever calculating it.
+            clps, residual = residual_variable_projection_kronecker(
+                model_matrix.matrix, global_matrix, dataset_model.get_data()
+            )
+            self._clps[label] = clps.T.flatten()
+            self._weighted_residuals[label] = residual.T.flatten()
+            self._residuals[label] = self._weighted_residuals[label]
+            return
 
         if dataset_model.is_index_dependent():
             matrix = np.concatenate(
@@ -192,15 +351,115 @@ class UngroupedProblem(Problem):
             )
         else:
             matrix = np.kron(global_matrix, model_matrix.matrix)
-        weight = self._flattened_weights.get(label)
         if weight is not None:
             apply_weight(matrix, weight)
         data = self._flattened_data[label]
-        self._clps[label], self._weighted_residuals[label] = self._residual_function(matrix, data)
+        self._clps[label], self._weighted_residuals[label] = self._calculate_clps_and_residual(
+            matrix, data, label, overwrite_matrix=True
+        )
 
-        self._residuals[label] = self._weighted_residuals[label]
-        if weight is not None:
-            self._residuals[label] /= weight
+        self._residuals[label] = (
+            np.divide(
+                self._weighted_residuals[label],
+                weight,
+                out=self._workspace.get(("residual", label), weight.shape),
+            )
+            if weight is not None
+            else self._weighted_residuals[label]
+        )
+
+    def calculate_jacobian(self, free_parameter_labels: list[str]) -> np.ndarray:
+        """Calculates the jacobian of :attr:`full_penalty` with respect to the free parameters.
+
+        The jacobian is calculated with Kaufman's approximation of the variable projection
+        from the matrix derivatives provided by the megacomplexes.
+
+        Parameters
+        ----------
+        free_parameter_labels : list[str]
+            The labels of the free parameters, one per column of the jacobian.
+        """
+        if self._reduced_clps is None:
+            self.calculate_residual()
+
+        return np.concatenate(
+            [
+                self._calculate_dataset_jacobian(label, dataset_model, free_parameter_labels)
+                for label, dataset_model in self.dataset_models.items()
+            ]
+        )
+
+    def _calculate_dataset_jacobian(
+        self, label: str, dataset_model: DatasetModel, free_parameter_labels: list[str]
+    ) -> np.ndarray:
+        weight = dataset_model.get_weight()
+
+        if not dataset_model.is_index_dependent():
+            derivatives = calculate_matrix_derivatives(
+                dataset_model, {}, self.matrices[label].clp_labels
+            )
+
+        if self._can_batch_residual(dataset_model):
+            reduced_matrix = self.reduced_matrices[label].matrix
+            reduced_derivatives = self._reduce_matrix_derivatives(
+                derivatives, reduced_matrix, free_parameter_labels, None
+            )
+            if dataset_model.scale is not None:
+                reduced_matrix = reduced_matrix * dataset_model.scale
+                reduced_derivatives = [d * dataset_model.scale for d in reduced_derivatives]
+            return jacobian_variable_projection(
+                reduced_matrix, reduced_derivatives, np.asarray(self.reduced_clps[label]).T
+            )
+
+        jacobians = []
+        for i, index in enumerate(dataset_model.get_global_axis()):
+            if dataset_model.is_index_dependent():
+                reduced_matrix = self.reduced_matrices[label][i].matrix
+                derivatives = calculate_matrix_derivatives(
+                    dataset_model,
+                    {dataset_model.get_global_dimension(): i},
+                    self.matrices[label][i].clp_labels,
+                )
+            else:
+                reduced_matrix = self.reduced_matrices[label].matrix
+            reduced_derivatives = self._reduce_matrix_derivatives(
+                derivatives, reduced_matrix, free_parameter_labels, index
+            )
+
+            if dataset_model.scale is not None:
+                reduced_matrix = reduced_matrix * dataset_model.scale
+                reduced_derivatives = [d * dataset_model.scale for d in reduced_derivatives]
+
+            if weight is not None:
+                reduced_matrix = reduced_matrix * weight[:, i, np.newaxis]
+                reduced_derivatives = [d * weight[:, i, np.newaxis] for d in reduced_derivatives]
+
+            jacobians.append(
+                jacobian_variable_projection(
+                    reduced_matrix, reduced_derivatives, self.reduced_clps[label][i]
+                )
+            )
+        return np.concatenate(jacobians)
+
+    def _reduce_matrix_derivatives(
+        self,
+        derivatives: dict[str, CalculatedMatrix],
+        reduced_matrix: np.ndarray,
+        free_parameter_labels: list[str],
+        index: Any | None,
+    ) -> list[np.ndarray]:
+        return [
+            reduce_matrix(
+                derivatives[label],
+                self.model,
+                self.parameters,
+                index,
+                self._clp_label_registry,
+            ).matrix
+            if label in derivatives
+            else np.zeros_like(reduced_matrix)
+            for label in free_parameter_labels
+        ]
 
     def _get_clp_labels(self, label: str, index: int = 0):
         return (
@@ -324,18 +583,14 @@ class UngroupedProblem(Problem):
     @property
     def full_penalty(self) -> np.ndarray:
         if self._full_penalty is None:
-            residuals = self.weighted_residuals
-            additional_penalty = self.additional_penalty
             residuals = [
-                np.concatenate(residuals[label])
-                if isinstance(residuals[label], list)
-                else residuals[label]
-                for label in residuals.keys()
+                residual
+                for dataset_residuals in self.weighted_residuals.values()
+                for residual in (
+                    dataset_residuals
+                    if isinstance(dataset_residuals, list)
+                    else [dataset_residuals]
+                )
             ]
-
-            self._full_penalty = (
-                np.concatenate((np.concatenate(residuals), additional_penalty))
-                if additional_penalty is not None
-                else np.concatenate(residuals)
-            )
+            self._full_penalty = self._concatenate_penalty(residuals, self.additional_penalty)
         return self._full_penalty
@@ -0,0 +1,262 @@
+"""A pool of worker processes calculating the residuals of partitions of the global indices."""
+from __future__ import annotations
+
+import dataclasses
+import gc
+import multiprocessing
+import sys
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+from multiprocessing.util import Finalize
+from typing import TYPE_CHECKING
+from typing import NamedTuple
+
+import numpy as np
+import xarray as xr
+
+if TYPE_CHECKING:
+    from typing import Any
+    from typing import Hashable
+
+    from glotaran.analysis.problem import Problem
+    from glotaran.parameter import ParameterGroup
+    from glotaran.project import Scheme
+
+
+class SharedArray(NamedTuple):
+    """An array of ``float64`` in Fortran order, placed in shared memory."""
+
+    name: str
+    """The name of the shared memory block."""
+    shape: tuple[int, ...]
+
+
+class SharedDataset(NamedTuple):
+    """A dataset whose data and weight are placed in shared memory."""
+
+    dims: tuple[Hashable, ...]
+    """The dimensions of the data and weight, model dimension first."""
+    coords: dict[Hashable, tuple[tuple[Hashable, ...], np.ndarray]]
+    data: SharedArray
+    weight: SharedArray | None
+
+
+_worker_problem: Problem | None = None
+"""The problem of a worker process of the residual pool."""
+
+_worker_parameter_labels: list[str] = []
+"""The labels of the free parameters of the problem of a worker process."""
+
+_worker_shared_memory: list[SharedMemory] = []
+"""The shared memory blocks attached by a worker process."""
+
+
+class ResidualProcessPool:
+    """A pool of worker processes, each calculating the residual results of one partition of
+    the global indices.
+
+    The data and weight of the problem are placed in shared memory once. Every worker creates a
+    problem for its partition on start up, so per evaluation only the values of the free
+    parameters are sent to the workers. The results of the partitions are merged into the
+    results of the whole problem, from which the problem calculates its penalty.
+    """
+
+    def __init__(
+        self,
+        problem: Problem,
+        number_of_workers: int,
+        free_parameter_labels: list[str],
+        start_method: str = "spawn",
+    ):
+        """
+
+        Parameters
+        ----------
+        problem : Problem
+            The problem to calculate the residual results for.
+        number_of_workers : int
+            The number of worker processes. Fewer are started if the global indices can not be
+            split into as many partitions.
+        free_parameter_labels : list[str]
+            The labels of the parameters which change between evaluations.
+        start_method : str
+            The start method of the worker processes. Forking is unsafe once numba's OpenMP
+            threads are running, so the workers are spawned by default.
+
+        Raises
+        ------
+        ValueError
+            If the global indices of the problem can not be partitioned.
+        """
+        partitions = problem._get_global_index_partitions(number_of_workers)
+        if partitions is None:
+            raise ValueError(
+                "The global indices of datasets with a global model can not be partitioned."
+            )
+
+        self._merge_residual_results = problem._merge_residual_results
+        self._free_parameter_labels = free_parameter_labels
+        self._parameters = None
+        self._shared_memory = []
+        datasets = {label: self._share_dataset(dataset) for label, dataset in problem.data.items()}
+        scheme = dataclasses.replace(
+            problem.scheme,
+            data={},
+            add_svd=False,
+            number_of_residual_threads=None,
+            number_of_residual_workers=None,
+        )
+        context = multiprocessing.get_context(start_method)
+        self._executors = [
+            ProcessPoolExecutor(
+                max_workers=1,
+                mp_context=context,
+                initializer=_initialize_worker,
+                initargs=(type(problem), scheme, datasets, partition, free_parameter_labels),
+            )
+            for partition in partitions
+        ]
+
+    @property
+    def number_of_workers(self) -> int:
+        """The number of worker processes."""
+        return len(self._executors)
+
+    def calculate_residual_results(self, parameters: ParameterGroup) -> Any:
+        """Calculates the residual results of all partitions concurrently.
+
+        Parameters
+        ----------
+        parameters : ParameterGroup
+            The parameters to calculate the results for.
+
+        Returns
+        -------
+        Any
+            The merged results, like the problem would calculate them itself.
+        """
+        if self._parameters is None or self._parameters[0] is not parameters:
+            self._parameters = (
+                parameters,
+                [parameters.get(label) for label in self._free_parameter_labels],
+            )
+        # the values are sent as passed to the optimizer, so that the workers set them like the
+        # problem sets the values of the optimizer
+        values = np.fromiter(
+            (
+                parameter.get_value_and_bounds_for_optimization()[0]
+                for parameter in self._parameters[1]
+            ),
+            dtype=np.float64,
+            count=len(self._parameters[1]),
+        )
+        futures = [
+            executor.submit(_calculate_worker_residual_results, values)
+            for executor in self._executors
+        ]
+        return self._merge_residual_results([future.result() for future in futures])
+
+    def shutdown(self):
+        """Stops the worker processes and releases the shared memory."""
+        for executor in self._executors:
+            executor.shutdown()
+        for shared_memory in self._shared_memory:
+            shared_memory.close()
+            shared_memory.unlink()
+        self._shared_memory = []
+
+    def _share_dataset(self, dataset: xr.Dataset) -> SharedDataset:
+        return SharedDataset(
+            dims=dataset.data.dims,
+            coords={
+                name: (coord.dims, coord.values) for name, coord in dataset.data.coords.items()
+            },
+            data=self._share_array(dataset.data.values),
+            weight=self._share_array(dataset.weight.values) if "weight" in dataset else None,
+        )
+
+    def _share_array(self, array: np.ndarray) -> SharedArray:
+        shared_memory = SharedMemory(create=True, size=max(1, array.size * 8))
+        self._shared_memory.append(shared_memory)
+        shared_array = SharedArray(name=shared_memory.name, shape=array.shape)
+        _attach_array(shared_array, shared_memory)[...] = array
+        return shared_array
+
+
+def _attach_array(shared_array: SharedArray, shared_memory: SharedMemory) -> np.ndarray:
+    return np.ndarray(shared_array.shape, dtype=np.float64, buffer=shared_memory.buf, order="F")
+
+
+def _attach_shared_memory(name: str) -> SharedMemory:
+    """Attaches to a shared memory block of the pool, so that only the pool unlinks it.
+
+    Before Python 3.13 attaching registers the block with the resource tracker like creating
+    it. Since the workers share the resource tracker of the pool, which keeps a set of names,
+    this registration coincides with the one of the pool and is dropped once the pool unlinks
+    the block. Unregistering it in the worker would drop the registration of the pool instead.
+    """
+    if sys.version_info >= (3, 13):
+        return SharedMemory(name=name, track=False)
+    return SharedMemory(name=name)
+
+
+def _attach_dataset(shared_dataset: SharedDataset, indices: np.ndarray) -> xr.Dataset:
+    """Creates a dataset of the global indices from the shared memory of a shared dataset."""
+    variables = {}
+    for name, shared_array in (("data", shared_dataset.data), ("weight", shared_dataset.weight)):
+        if shared_array is not None:
+            shared_memory = _attach_shared_memory(shared_array.name)
+            _worker_shared_memory.append(shared_memory)
+            variables[name] = (
+                shared_dataset.dims,
+                _attach_array(shared_array, shared_memory),
+            )
+    dataset = xr.Dataset(variables, coords=shared_dataset.coords)
+    # contiguous indices are selected by a slice, which keeps the data in shared memory
+    if indices.size != 0 and indices[-1] - indices[0] + 1 == indices.size:
+        indices = slice(indices[0], indices[-1] + 1)
+    return dataset.isel({shared_dataset.dims[1]: indices})
+
+
+def _initialize_worker(
+    problem_type: type[Problem],
+    scheme: Scheme,
+    datasets: dict[str, SharedDataset],
+    partition: dict[str, np.ndarray],
+    free_parameter_labels: list[str],
+):
+    global _worker_problem, _worker_parameter_labels
+    Finalize(None, _close_worker_shared_memory, exitpriority=0)
+    data = {
+        label: _attach_dataset(shared_dataset, partition[label])
+        for label, shared_dataset in datasets.items()
+    }
+    with warnings.catch_warnings():
+        # the weights of the model are already applied to the shared weight
+        warnings.filterwarnings(
+            "ignore", message="Ignoring model weight for dataset", category=UserWarning
+        )
+        _worker_problem = problem_type(dataclasses.replace(scheme, data=data))
+    _worker_parameter_labels = free_parameter_labels
+
+
+def _calculate_worker_residual_results(values: np.ndarray) -> Any:
+    """Calculates the residual results of the partition of a worker for the values of the free
+    parameters, as passed to the optimizer."""
+    problem = _worker_problem
+    problem.parameters.set_from_label_and_value_arrays(_worker_parameter_labels, values)
+    problem.reset()
+    return problem._calculate_residual_results()
+
+
+def _close_worker_shared_memory():
+    """Closes the shared memory blocks of a worker process, once it exits."""
+    global _worker_problem, _worker_parameter_labels
+    # the arrays of the problem have to be released before the memory can be closed
+    _worker_problem = None
+    _worker_parameter_labels = []
+    gc.collect()
+    for shared_memory in _worker_shared_memory:
+        shared_memory.close()
+    _worker_shared_memory.clear()
@@ -2,7 +2,12 @@ import numpy as np
 import xarray as xr
 
 from glotaran.analysis.problem_grouped import GroupedProblem
+from glotaran.analysis.problem_grouped import combine_matrices
 from glotaran.analysis.test.models import SimpleTestModel
+from glotaran.analysis.util import CalculatedMatrix
+from glotaran.analysis.util import align_axes
+from glotaran.analysis.util import find_overlap
+from glotaran.analysis.util import get_clp_label_union
 from glotaran.parameter import ParameterGroup
 from glotaran.project import Scheme
 
@@ -166,3 +171,171 @@ def test_multi_dataset_overlap():
     assert np.array_equal(bag[4].descriptor[0].axis["model"], model_axis_1)
     assert np.array_equal(bag[5].descriptor[0].axis["model"], model_axis_2)
     assert [p.descriptor[0].indices["global"] for p in bag[1:4]] == [0, 1, 2]
+
+
+def test_multi_dataset_packed_bag():
+    model = SimpleTestModel.from_dict(
+        {
+            "megacomplex": {"m1": {"is_index_dependent": False}},
+            "dataset": {
+                "dataset1": {
+                    "megacomplex": ["m1"],
+                },
+                "dataset2": {
+                    "megacomplex": ["m1"],
+                },
+            },
+        }
+    )
+    model.grouped = lambda: True
+    parameters = ParameterGroup.from_list([1, 10])
+
+    global_axis_1 = [2, 3, 4]
+    model_axis_1 = [5, 7]
+    global_axis_2 = [0, 1, 2, 3]
+    model_axis_2 = [5, 7, 9]
+    data = {
+        "dataset1": xr.DataArray(
+            np.arange(6.0).reshape((3, 2)),
+            coords=[("global", global_axis_1), ("model", model_axis_1)],
+        ).to_dataset(name="data"),
+        "dataset2": xr.DataArray(
+            10 + np.arange(12.0).reshape((4, 3)),
+            coords=[("global", global_axis_2), ("model", model_axis_2)],
+        ).to_dataset(name="data"),
+    }
+
+    problem = GroupedProblem(Scheme(model, parameters, data))
+    bag = problem.bag
+    assert np.array_equal(problem._full_axis, [0, 1, 2, 3, 4])
+    assert [p.group for p in bag] == [
+        "dataset2",
+        "dataset2",
+        "dataset1dataset2",
+        "dataset1dataset2",
+        "dataset1",
+    ]
+    assert np.array_equal(bag.data_offsets, [0, 3, 6, 11, 16, 18])
+    assert np.array_equal(bag[2].data, [0, 1, 16, 17, 18])
+    assert np.array_equal(bag[4].data, [4, 5])
+    assert all(np.shares_memory(p.data, bag.data) for p in bag)
+
+
+def test_find_overlap():
+    a = np.asarray([3.0, 1.0, 2.0, 5.0])
+    b = np.asarray([2.1, 0.0, 1.02, 0.95, 4.0])
+    ovr_a, ovr_b = find_overlap(a, b, atol=0.2)
+    assert ovr_a.tolist() == [1, 2]
+    assert ovr_b.tolist() == [2, 0]
+
+
+def test_align_axes_unsorted():
+    full_axis, index_maps = align_axes([[3, 1, 2], [2.1, 4, 0.9]], atol=0.2)
+    assert np.array_equal(full_axis, [1, 2, 3, 4])
+    assert index_maps[0].tolist() == [2, 0, 1]
+    assert index_maps[1].tolist() == [1, 3, 0]
+
+
+def test_mixed_index_dependency():
+    def create_problem(is_index_dependent: bool) -> GroupedProblem:
+        model = SimpleTestModel.from_dict(
+            {
+                "megacomplex": {
+                    "m1": {"is_index_dependent": True},
+                    "m2": {"is_index_dependent": is_index_dependent},
+                },
+                "dataset": {
+                    "dataset1": {
+                        "megacomplex": ["m1"],
+                    },
+                    "dataset2": {
+                        "megacomplex": ["m2"],
+                    },
+                },
+            }
+        )
+        model.grouped = lambda: True
+        parameters = ParameterGroup.from_list([1, 10])
+        data = {
+            "dataset1": xr.DataArray(
+                np.arange(6.0).reshape((3, 2)),
+                coords=[("global", [1, 2, 3]), ("model", [5, 7])],
+            ).to_dataset(name="data"),
+            "dataset2": xr.DataArray(
+                np.arange(12.0).reshape((4, 3)),
+                coords=[("global", [2, 3, 4, 5]), ("model", [5, 7, 9])],
+            ).to_dataset(name="data"),
+        }
+        return GroupedProblem(Scheme(model, parameters, data))
+
+    problem = create_problem(False)
+    assert not problem.dataset_models["dataset2"].is_index_dependent()
+    problem.calculate_matrices()
+    assert len(problem.matrices["dataset1"]) == 3
+    assert isinstance(problem.matrices["dataset2"], CalculatedMatrix)
+
+    reference = create_problem(True)
+    assert np.allclose(problem.full_penalty, reference.full_penalty)
+    problem.prepare_result_creation()
+    result_dataset = problem.create_result_dataset("dataset2")
+    assert result_dataset.matrix.dims == ("model", "clp_label")
+
+
+def test_combine_matrices():
+    matrices = [
+        CalculatedMatrix(["s1", "s2"], np.ones((2, 2))),
+        CalculatedMatrix(["s3", "s1"], 2 * np.ones((3, 2))),
+    ]
+    union = get_clp_label_union([m.clp_labels for m in matrices])
+    assert union.clp_labels == ("s1", "s2", "s3")
+    assert [c.tolist() for c in union.columns] == [[0, 1], [2, 0]]
+    assert get_clp_label_union([m.clp_labels for m in matrices]) is union
+
+    buffer = np.full((5, 3), np.nan)
+    combined = combine_matrices(matrices, out=buffer)
+    assert combined.clp_labels == ["s1", "s2", "s3"]
+    assert combined.matrix is buffer
+    assert np.array_equal(
+        combined.matrix,
+        [[1, 1, 0], [1, 1, 0], [2, 0, 2], [2, 0, 2], [2, 0, 2]],
+    )
+    assert combine_matrices(matrices, out=np.zeros((2, 2))).matrix.shape == (5, 3)
+
+
+def test_global_index_partitions():
+    model = SimpleTestModel.from_dict(
+        {
+            "megacomplex": {"m1": {"is_index_dependent": False}},
+            "dataset": {
+                "dataset1": {"megacomplex": ["m1"]},
+                "dataset2": {"megacomplex": ["m1"]},
+            },
+        }
+    )
+    parameters = ParameterGroup.from_list([1, 10])
+
+    def create_problem(global_axis_2):
+        data = {
+            "dataset1": xr.DataArray(
+                np.ones((6, 3)), coords=[("global", [1, 2, 3, 4, 5, 6]), ("model", [5, 7, 9])]
+            ).to_dataset(name="data"),
+            "dataset2": xr.DataArray(
+                np.ones((6, 3)), coords=[("global", global_axis_2), ("model", [5, 7, 9])]
+            ).to_dataset(name="data"),
+        }
+        return GroupedProblem(Scheme(model, parameters, data))
+
+    partitions = create_problem([2, 3, 4, 5, 6, 7])._get_global_index_partitions(2)
+    assert [partition["dataset1"].tolist() for partition in partitions] == [
+        [0, 1, 2, 3],
+        [4, 5],
+    ]
+    assert [partition["dataset2"].tolist() for partition in partitions] == [
+        [0, 1, 2],
+        [3, 4, 5],
+    ]
+
+    # partitions without every dataset are extended
+    partitions = create_problem([4, 5, 6, 7, 8, 9])._get_global_index_partitions(3)
+    assert len(partitions) == 1
+    assert partitions[0]["dataset2"].tolist() == list(range(6))
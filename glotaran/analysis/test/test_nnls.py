@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+from scipy.optimize import nnls as scipy_nnls
+
+from glotaran.analysis.nnls import nnls
+from glotaran.analysis.nnls import residual_nnls
+
+
+def _create_problem(seed):
+    rng = np.random.default_rng(seed)
+    matrix = rng.random((50, 6))
+    data = rng.random((50, 8)) - 0.3
+    return matrix, data
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_nnls(seed):
+    matrix, data = _create_problem(seed)
+    for column in data.T:
+        expected, _ = scipy_nnls(matrix, column)
+        clp, passive_set = nnls(matrix, column)
+        assert np.allclose(clp, expected)
+        assert np.all(clp[~passive_set] == 0)
+
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("warm_start", ["none", "exact", "wrong"])
+def test_residual_nnls_batched(seed, warm_start):
+    matrix, data = _create_problem(seed)
+    expected = np.asarray([scipy_nnls(matrix, column)[0] for column in data.T]).T
+
+    passive_set = None
+    if warm_start == "exact":
+        passive_set = expected > 0
+    elif warm_start == "wrong":
+        passive_set = np.random.default_rng(seed).random(expected.shape) > 0.5
+
+    clps, residual = residual_nnls(matrix, data, passive_set)
+
+    assert clps.shape == expected.shape
+    assert np.allclose(clps, expected)
+    assert np.allclose(residual, data - matrix @ expected)
+
+    clp, column_residual = residual_nnls(matrix, data[:, 0], clps[:, 0] > 0)
+    assert np.allclose(clp, expected[:, 0])
+    assert np.allclose(column_residual, residual[:, 0])
@@ -1,14 +1,28 @@
+import contextlib
+import copy
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import replace
+
 import numpy as np
 import pytest
 import xarray as xr
 
+from glotaran.analysis import optimize as optimize_module
+from glotaran.analysis import problem as problem_module
+from glotaran.analysis.optimize import _adjust_steps_to_bounds
+from glotaran.analysis.optimize import _calculate_parallel_finite_difference_jacobian
+from glotaran.analysis.optimize import _calculate_penalty
+from glotaran.analysis.optimize import _initialize_jacobian_worker
 from glotaran.analysis.optimize import optimize
+from glotaran.analysis.optimize import optimize_problem
+from glotaran.analysis.problem_ungrouped import UngroupedProblem
 from glotaran.analysis.simulation import simulate
 from glotaran.analysis.test.models import FullModel
 from glotaran.analysis.test.models import MultichannelMulticomponentDecay
 from glotaran.analysis.test.models import OneCompartmentDecay
 from glotaran.analysis.test.models import ThreeDatasetDecay
 from glotaran.analysis.test.models import TwoCompartmentDecay
+from glotaran.project import ParameterHistoryOptions
 from glotaran.project import Scheme
 
 
@@ -27,16 +41,16 @@ from glotaran.project import Scheme
     "suite",
     [OneCompartmentDecay, TwoCompartmentDecay, ThreeDatasetDecay, MultichannelMulticomponentDecay],
 )
-def test_optimization(suite, is_index_dependent, grouped, weight, method):
+def test_optimization(monkeypatch, suite, is_index_dependent, grouped, weight, method):
     model = suite.model
 
-    model.megacomplex["m1"].is_index_dependent = is_index_dependent
+    monkeypatch.setattr(model.megacomplex["m1"], "is_index_dependent", is_index_dependent)
 
     print("Grouped:", grouped)
     print("Index dependent:", is_index_dependent)
 
     sim_model = suite.sim_model
-    sim_model.megacomplex["m1"].is_index_dependent = is_index_dependent
+    monkeypatch.setattr(sim_model.megacomplex["m1"], "is_index_dependent", is_index_dependent)
 
     print(model.validate())
     assert model.valid()
@@ -132,9 +146,9 @@ def test_optimization(suite, is_index_dependent, grouped, weight, method):
 
 
 @pytest.mark.parametrize("index_dependent", [True, False])
-def test_optimization_full_model(index_dependent):
+def test_optimization_full_model(monkeypatch, index_dependent):
     model = FullModel.model
-    model.megacomplex["m1"].is_index_dependent = index_dependent
+    monkeypatch.setattr(model.megacomplex["m1"], "is_index_dependent", index_dependent)
 
     print(model.validate())
     assert model.valid()
@@ -167,3 +181,187 @@ def test_optimization_full_model(index_dependent):
     print(clp)
     assert clp.shape == (4, 4)
     assert all(np.isclose(1.0, c) for c in np.diagonal(clp))
+
+
+def create_suite_scheme(suite, weight=None, **kwargs) -> Scheme:
+    """Creates a scheme of an index independent suite with simulated data."""
+    dataset = simulate(
+        suite.sim_model,
+        "dataset1",
+        suite.wanted_parameters,
+        {"global": suite.global_axis, "model": suite.model_axis},
+    )
+    if weight is not None:
+        dataset["weight"] = xr.full_like(dataset.data, weight)
+    return Scheme(
+        model=suite.model,
+        parameters=suite.initial_parameters,
+        data={"dataset1": dataset},
+        **kwargs,
+    )
+
+
+def test_optimization_parallel_finite_difference():
+    scheme = create_suite_scheme(TwoCompartmentDecay, maximum_number_function_evaluations=10)
+    parallel_scheme = replace(
+        scheme,
+        jacobian_method="ParallelFiniteDifference",
+        number_of_jacobian_workers=2,
+    )
+
+    result = optimize(scheme, raise_exception=True)
+    parallel_result = optimize(parallel_scheme, raise_exception=True)
+
+    assert parallel_result.success
+    assert np.allclose(parallel_result.jacobian, result.jacobian)
+    for label, param in parallel_result.optimized_parameters.all():
+        assert np.allclose(param.value, result.optimized_parameters.get(label).value)
+
+    with pytest.warns(UserWarning, match="'fork' is not supported"):
+        replace(parallel_scheme, jacobian_start_method="fork")
+
+
+def test_optimization_residual_threads(monkeypatch):
+    problem = UngroupedProblem(
+        create_suite_scheme(
+            MultichannelMulticomponentDecay,
+            maximum_number_function_evaluations=5,
+            number_of_residual_threads=2,
+        )
+    )
+
+    problem.reset()
+    problem.full_penalty
+    assert problem._residual_executor is not None
+
+    limits = []
+    monkeypatch.setattr(
+        problem_module,
+        "_limit_blas_threads",
+        lambda number_of_threads: limits.append(number_of_threads) or contextlib.nullcontext(),
+    )
+    result = optimize_problem(problem, raise_exception=True)
+
+    assert result.success
+    # the threads of the BLAS are limited once for all evaluations
+    assert len(limits) == 1
+    # the threads are stopped once the result is created
+    assert problem._residual_executor is None
+
+
+def test_parallel_finite_difference_reuses_last_penalty(monkeypatch):
+    scheme = create_suite_scheme(TwoCompartmentDecay)
+    problem = UngroupedProblem(scheme)
+    (
+        labels,
+        parameters,
+        lower_bounds,
+        upper_bounds,
+    ) = problem.parameters.get_label_value_and_bounds_arrays(exclude_non_vary=True)
+    last_penalty = {}
+    penalty = _calculate_penalty(parameters, labels, problem, last_penalty)
+
+    resets = []
+    reset = problem.reset
+    monkeypatch.setattr(problem, "reset", lambda: resets.append(1) or reset())
+    # the worker thread shares the module of this process, but not the parameters
+    with ThreadPoolExecutor(
+        1,
+        initializer=_initialize_jacobian_worker,
+        initargs=(UngroupedProblem, copy.deepcopy(scheme)),
+    ) as executor:
+        jacobian = _calculate_parallel_finite_difference_jacobian(
+            parameters, labels, problem, executor, lower_bounds, upper_bounds, last_penalty
+        )
+        assert resets == []
+        assert jacobian.shape == (penalty.size, len(labels))
+
+        # the penalty is calculated if it was calculated for other parameters
+        other_jacobian = _calculate_parallel_finite_difference_jacobian(
+            parameters, labels, problem, executor, lower_bounds, upper_bounds, {}
+        )
+        assert len(resets) == 1
+        assert np.allclose(jacobian, other_jacobian)
+
+
+def test_parallel_finite_difference_steps_within_bounds():
+    step = np.sqrt(np.finfo(np.float64).eps)
+    parameters = np.array([1.0, 1.0, 1.0, 0.5, 1.0])
+    steps = np.full(parameters.shape, step)
+    lower_bounds = np.array([-np.inf, 1.0 - step / 2, 0.0, 0.5 - step / 4, 1.0 - step / 4])
+    upper_bounds = np.array([np.inf, np.inf, 1.0 + step / 2, 0.5 + step / 2, 1.0 + step / 8])
+
+    adjusted_steps = _adjust_steps_to_bounds(parameters, steps, lower_bounds, upper_bounds)
+
+    # unbounded, close to the lower bound, close to the upper bound
+    assert adjusted_steps[:3].tolist() == [step, step, -step]
+    # the bounds are narrower than the step, which is shrunk to the farther bound
+    assert adjusted_steps[3] == step / 2
+    assert adjusted_steps[4] == -step / 4
+    perturbed_parameters = parameters + adjusted_steps
+    assert np.all(perturbed_parameters >= lower_bounds)
+    assert np.all(perturbed_parameters <= upper_bounds)
+
+
+@pytest.mark.parametrize("grouped", [True, False])
+def test_optimization_residual_pool(grouped):
+    scheme = create_suite_scheme(
+        TwoCompartmentDecay, weight=0.5, maximum_number_function_evaluations=10, group=grouped
+    )
+    pool_scheme = replace(scheme, number_of_residual_workers=2)
+
+    result = optimize(scheme, raise_exception=True)
+    pool_result = optimize(pool_scheme, raise_exception=True)
+
+    assert pool_result.success
+    assert pool_result.number_of_function_evaluations == result.number_of_function_evaluations
+    for label, param in pool_result.optimized_parameters.all():
+        assert np.allclose(param.value, result.optimized_parameters.get(label).value)
+    assert np.allclose(pool_result.data["dataset1"].residual, result.data["dataset1"].residual)
+
+
+def test_optimization_parameter_history(tmp_path):
+    spill_path = str(tmp_path / "history.npy")
+    scheme = create_suite_scheme(
+        TwoCompartmentDecay,
+        maximum_number_function_evaluations=10,
+        parameter_history=ParameterHistoryOptions(keep_last=2, spill_path=spill_path),
+    )
+    problem = UngroupedProblem(scheme)
+    result = optimize_problem(problem, raise_exception=True)
+
+    history = problem.parameter_history
+    # the evaluations of the finite difference jacobian are recorded as well
+    assert history.number_of_records >= result.number_of_function_evaluations
+    assert len(history) == 2
+    assert np.all(np.isfinite(history.costs))
+    spilled = np.load(spill_path)
+    assert spilled.shape == (history.number_of_records, len(history.labels) + 2)
+    assert np.array_equal(spilled[-2:, 2:], history.values)
+    # the history holds the evaluated values, not a reference to the mutated parameters
+    assert not np.array_equal(spilled[0, 2:], spilled[-1, 2:])
+
+    assert result.get_scheme().parameter_history == scheme.parameter_history
+    # the history and its spill file are not copied with the problem
+    problem = copy.deepcopy(problem)
+    assert problem._parameter_history is None
+
+
+def test_optimization_parameter_history_not_created(tmp_path, monkeypatch):
+    spill_path = tmp_path / "history.npy"
+    scheme = create_suite_scheme(
+        TwoCompartmentDecay,
+        parameter_history=ParameterHistoryOptions(spill_path=str(spill_path)),
+    )
+    problem = UngroupedProblem(scheme)
+
+    def failing_least_squares(*args, **kwargs):
+        raise ValueError("failed")
+
+    monkeypatch.setattr(optimize_module, "least_squares", failing_least_squares)
+    with pytest.raises(ValueError, match="failed"):
+        optimize_problem(problem, raise_exception=True)
+
+    # nothing was recorded, so neither the history nor its spill file are created
+    assert problem._parameter_history is None
+    assert not spill_path.exists()
@@ -51,3 +51,8 @@ def test_penalties(index_dependent, grouped):
         problem.full_penalty.size
         == (suite.model_axis.size * global_axis.size) + problem.additional_penalty.size
     )
+
+    clps = problem.create_result_data()["dataset1"].clp
+    source_area = clps.sel({"clp_label": "s1", "global": slice(1, 20)}).sum()
+    target_area = clps.sel({"clp_label": "s2", "global": slice(20, 45)}).sum()
+    assert np.isclose(problem.additional_penalty[0], 10 * abs(source_area - 2 * target_area))
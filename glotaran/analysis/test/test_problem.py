@@ -1,17 +1,28 @@
-import collections
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from copy import deepcopy
+from dataclasses import replace
+from multiprocessing import resource_tracker
 
 import numpy as np
 import pytest
 import xarray as xr
 
+from glotaran.analysis import residual_pool as residual_pool_module
+from glotaran.analysis import util as util_module
 from glotaran.analysis.problem import Problem
+from glotaran.analysis.problem_grouped import GroupedBag
 from glotaran.analysis.problem_grouped import GroupedProblem
 from glotaran.analysis.problem_ungrouped import UngroupedProblem
+from glotaran.analysis.residual_pool import ResidualProcessPool
 from glotaran.analysis.simulation import simulate
 from glotaran.analysis.test.models import FullModel
 from glotaran.analysis.test.models import MultichannelMulticomponentDecay as suite
+from glotaran.analysis.test.models import SimpleKineticMegacomplex
 from glotaran.analysis.test.models import SimpleTestModel
 from glotaran.analysis.util import CalculatedMatrix
+from glotaran.analysis.util import calculate_megacomplex_matrix
+from glotaran.analysis.variable_projection import residual_variable_projection
 from glotaran.parameter import ParameterGroup
 from glotaran.project import Scheme
 
@@ -20,27 +31,48 @@ from glotaran.project import Scheme
     scope="module", params=[[True, True], [True, False], [False, True], [False, False]]
 )
 def problem(request) -> Problem:
-    model = suite.model
-    model.megacomplex["m1"].is_index_dependent = request.param[1]
-    model.is_index_dependent = request.param[1]
+    scheme = create_suite_scheme(index_dependent=request.param[1])
+    problem = GroupedProblem(scheme) if request.param[0] else UngroupedProblem(scheme)
+    problem.grouped = request.param[0]
+    return problem
+
+
+def create_suite_scheme(
+    index_dependent=None, global_axis=suite.global_axis, weight=None, **kwargs
+) -> Scheme:
+    """Creates a scheme of the suite with simulated data.
 
+    If the index dependence is given, it is set on a copy of the suite model.
+    """
+    model = suite.model
+    if index_dependent is not None:
+        model = deepcopy(model)
+        model.megacomplex["m1"].is_index_dependent = index_dependent
+        model.is_index_dependent = index_dependent
     dataset = simulate(
         suite.sim_model,
         "dataset1",
         suite.wanted_parameters,
-        {"global": suite.global_axis, "model": suite.model_axis},
+        {"global": global_axis, "model": suite.model_axis},
     )
-    scheme = Scheme(model=model, parameters=suite.initial_parameters, data={"dataset1": dataset})
-    problem = GroupedProblem(scheme) if request.param[0] else UngroupedProblem(scheme)
-    problem.grouped = request.param[0]
-    return problem
+    if weight is not None:
+        dataset["weight"] = xr.full_like(dataset.data, weight)
+    return Scheme(
+        model=model, parameters=suite.initial_parameters, data={"dataset1": dataset}, **kwargs
+    )
+
+
+@pytest.fixture
+def suite_scheme() -> Scheme:
+    return create_suite_scheme()
 
 
 def test_problem_bag(problem: Problem):
 
     if problem.grouped:
         bag = problem.bag
-        assert isinstance(bag, collections.deque)
+        assert isinstance(bag, GroupedBag)
+        assert bag.data.size == suite.global_axis.size * suite.model_axis.size
         assert len(bag) == suite.global_axis.size
         assert problem.groups == {"dataset1": ["dataset1"]}
 
@@ -216,3 +248,289 @@ def test_full_model_problem():
     assert clp.shape == (4, 4)
     print(np.diagonal(clp))
     assert all(np.isclose(1.0, c) for c in np.diagonal(clp))
+
+
+@pytest.mark.parametrize("index_dependent", [True, False])
+@pytest.mark.parametrize("weighted", [True, False])
+def test_full_model_problem_residual(monkeypatch, index_dependent, weighted):
+    model = FullModel.model
+    monkeypatch.setattr(model.megacomplex["m1"], "is_index_dependent", index_dependent)
+    dataset = simulate(model, "dataset1", FullModel.parameters, FullModel.coordinates)
+    if weighted:
+        weight = np.ones_like(dataset.data)
+        weight[: weight.shape[0] // 2, :] = 0.2
+        weight[:, ::3] *= 5.0
+        dataset["weight"] = (dataset.data.dims, weight)
+    problem = UngroupedProblem(
+        Scheme(model=model, parameters=FullModel.parameters, data={"dataset1": dataset})
+    )
+    # unweighted index independent datasets are solved without the kronecker product
+    assert np.allclose(problem.weighted_residuals["dataset1"], 0, atol=1e-8)
+    assert np.allclose(problem.residuals["dataset1"], 0, atol=1e-8)
+    clp = np.reshape(problem.clps["dataset1"], (4, 4))
+    assert np.allclose(clp, np.eye(4))
+
+
+def test_ungrouped_batched_residual():
+    problem = UngroupedProblem(create_suite_scheme(index_dependent=False))
+    dataset_model = problem.dataset_models["dataset1"]
+    assert problem._can_batch_residual(dataset_model)
+
+    problem.calculate_residual()
+    reduced_matrix = problem.reduced_matrices["dataset1"].matrix
+    data = dataset_model.get_data()
+    for i in range(suite.global_axis.size):
+        clps, residual = residual_variable_projection(reduced_matrix, data[:, i])
+        assert np.allclose(problem.reduced_clps["dataset1"][i], clps)
+        assert np.allclose(problem.weighted_residuals["dataset1"][i], residual)
+
+
+def test_grouped_batched_residual():
+    problem = GroupedProblem(create_suite_scheme(index_dependent=False))
+
+    problem.calculate_residual()
+    for i, group in enumerate(problem.bag):
+        _, clps, weighted_residual, _, _ = problem._index_independent_residual(
+            group, problem.reduced_matrices[group.group], problem._full_axis[i]
+        )
+        assert np.allclose(problem.reduced_clps[i], clps)
+        assert np.allclose(problem.weighted_residuals[i], weighted_residual)
+
+
+@pytest.mark.parametrize("grouped", [True, False])
+@pytest.mark.parametrize("index_dependent", [True, False])
+def test_threaded_residual(grouped: bool, index_dependent: bool):
+    problem_type = GroupedProblem if grouped else UngroupedProblem
+    scheme = create_suite_scheme(index_dependent=index_dependent)
+    problem = problem_type(scheme)
+    threaded_problem = problem_type(replace(scheme, number_of_residual_threads=8))
+
+    switch_interval = sys.getswitchinterval()
+    # switching threads often exposes state the threads share while it is calculated
+    sys.setswitchinterval(1e-6)
+    try:
+        for _ in range(10):
+            threaded_problem.reset()
+            assert np.allclose(problem.full_penalty, threaded_problem.full_penalty)
+    finally:
+        sys.setswitchinterval(switch_interval)
+
+    # a grouped index independent problem with a single dataset is one batch
+    if index_dependent or not grouped:
+        assert threaded_problem._residual_executor is not None
+    threaded_problem.shutdown_residual_executor()
+    assert threaded_problem._residual_executor is None
+
+
+def test_full_penalty_workspace(problem: Problem):
+    problem.reset()
+    penalty = problem.full_penalty
+    residuals = (
+        problem.weighted_residuals
+        if problem.grouped
+        else [r for residuals in problem.weighted_residuals.values() for r in residuals]
+    )
+    assert np.array_equal(penalty, np.concatenate(residuals))
+    expected = penalty.copy()
+
+    problem.reset()
+    assert problem.full_penalty is penalty
+    assert np.array_equal(problem.full_penalty, expected)
+
+
+@pytest.mark.parametrize("grouped", [True, False])
+def test_residual_pool(grouped: bool):
+    scheme = create_suite_scheme(index_dependent=True)
+    problem = GroupedProblem(scheme) if grouped else UngroupedProblem(scheme)
+    free_parameter_labels = problem.parameters.get_label_value_and_bounds_arrays(
+        exclude_non_vary=True
+    )[0]
+    problem.parameters.get("k.1").value = 0.5
+    problem.reset()
+    expected = problem.full_penalty.copy()
+    problem.parameters.get("k.1").value = 0.05
+
+    residual_pool = ResidualProcessPool(problem, 2, free_parameter_labels)
+    try:
+        problem.set_residual_pool(residual_pool)
+        problem.reset()
+        assert residual_pool.number_of_workers == 2
+        assert not np.allclose(problem.full_penalty, expected)
+
+        problem.parameters.get("k.1").value = 0.5
+        problem.reset()
+        assert np.allclose(problem.full_penalty, expected)
+    finally:
+        problem.set_residual_pool(None)
+        residual_pool.shutdown()
+
+
+def test_residual_pool_worker_shared_memory(monkeypatch, suite_scheme: Scheme):
+    scheme = suite_scheme
+    problem = UngroupedProblem(scheme)
+    free_parameter_labels = problem.parameters.get_label_value_and_bounds_arrays(
+        exclude_non_vary=True
+    )[0]
+
+    # the data is shared without starting workers, which are initialized in this process
+    residual_pool = ResidualProcessPool.__new__(ResidualProcessPool)
+    residual_pool._executors = []
+    residual_pool._shared_memory = []
+    datasets = {"dataset1": residual_pool._share_dataset(problem.data["dataset1"])}
+
+    registered = []
+    monkeypatch.setattr(resource_tracker, "register", lambda name, rtype: registered.append(name))
+    try:
+        residual_pool_module._initialize_worker(
+            UngroupedProblem,
+            replace(scheme, data={}),
+            datasets,
+            {"dataset1": np.arange(suite.global_axis.size)},
+            free_parameter_labels,
+        )
+        shared_memory = list(residual_pool_module._worker_shared_memory)
+        assert len(shared_memory) == 1
+        # attaching registers no other blocks than the ones of the pool, which unlinks them
+        assert set(registered) <= {block._name for block in residual_pool._shared_memory}
+
+        values = problem.parameters.get_label_value_and_bounds_arrays(exclude_non_vary=True)[1]
+        results = residual_pool_module._calculate_worker_residual_results(values)
+        assert np.allclose(
+            np.concatenate([result[2] for result in results["dataset1"]]),
+            np.concatenate(problem.weighted_residuals["dataset1"]),
+        )
+
+        del results
+        residual_pool_module._close_worker_shared_memory()
+        assert residual_pool_module._worker_problem is None
+        assert residual_pool_module._worker_shared_memory == []
+        assert all(block.buf is None for block in shared_memory)
+    finally:
+        residual_pool.shutdown()
+
+
+def test_reset_updates_filled_dataset_models(suite_scheme: Scheme):
+    problem = UngroupedProblem(suite_scheme)
+    problem.reset()
+    dataset_model = problem.dataset_models["dataset1"]
+    kinetic_parameters = [
+        parameter for parameter in dataset_model.get_parameters() if parameter.full_label == "k.1"
+    ]
+    assert len(kinetic_parameters) > 0
+
+    problem.parameters.get("k.1").value = 42
+    problem.reset()
+
+    # the dataset models are updated in place
+    assert problem.dataset_models["dataset1"] is dataset_model
+    assert all(parameter.value == 42 for parameter in kinetic_parameters)
+
+
+def test_prepared_data_is_shared():
+    scheme = create_suite_scheme(weight=0.5)
+    dataset = scheme.data["dataset1"]
+    problem = UngroupedProblem(scheme)
+    data = problem.dataset_models["dataset1"].get_data()
+
+    assert data.flags.f_contiguous
+    assert data[:, 0].flags.contiguous
+    assert not data.flags.writeable
+    assert np.array_equal(data, problem.data["dataset1"].data.values * 0.5)
+    # the user supplied dataset stays writeable
+    assert dataset.data.values.flags.writeable
+
+    problem.reset()
+    problem.parameters.get("k.1").value = 42
+    problem.reset()
+    assert problem.dataset_models["dataset1"].get_data() is data
+    assert (
+        problem.dataset_models["dataset1"].get_weight()
+        is problem._prepared_data["dataset1"].weight
+    )
+
+
+def test_megacomplex_matrix_cache(monkeypatch, suite_scheme: Scheme):
+    problem = UngroupedProblem(suite_scheme)
+
+    calls = []
+    calculate_matrix = SimpleKineticMegacomplex.calculate_matrix
+
+    def counting_calculate_matrix(self, dataset_model, indices, **kwargs):
+        calls.append(indices)
+        return calculate_matrix(self, dataset_model, indices, **kwargs)
+
+    monkeypatch.setattr(SimpleKineticMegacomplex, "calculate_matrix", counting_calculate_matrix)
+
+    problem.reset()
+    problem.calculate_matrices()
+    number_of_calls = len(calls)
+    assert number_of_calls > 0
+
+    # unchanged parameters are served from the cache
+    problem.reset()
+    problem.calculate_matrices()
+    assert len(calls) == number_of_calls
+
+    problem.parameters.get("k.1").value = 0.007
+    problem.reset()
+    problem.calculate_matrices()
+    assert len(calls) == 2 * number_of_calls
+
+    matrix = problem.matrices["dataset1"]
+    matrix = matrix[0] if isinstance(matrix, list) else matrix
+    assert not matrix.matrix.flags.writeable
+
+
+def test_megacomplex_matrix_cache_nbytes(monkeypatch, suite_scheme: Scheme):
+    problem = UngroupedProblem(suite_scheme)
+    monkeypatch.setattr(util_module, "MATRIX_CACHE_NBYTES", 1)
+
+    # the matrices of the current parameter values are kept, however large they are
+    for value in [0.007, 0.008]:
+        problem.parameters.get("k.1").value = value
+        problem.reset()
+        problem.calculate_matrices()
+        megacomplex = problem.dataset_models["dataset1"].megacomplex[0]
+        cache = util_module._matrix_caches[megacomplex]
+        assert len(cache.entries) == 1
+        assert cache.nbytes == util_module._get_nbytes(next(iter(cache.entries.values())))
+        assert cache.nbytes > 0
+
+
+def test_megacomplex_matrix_cache_index_dependent(monkeypatch):
+    global_axis = np.linspace(12820, 15120, 300)
+    scheme = create_suite_scheme(index_dependent=True, global_axis=global_axis)
+    problem = UngroupedProblem(scheme)
+    megacomplex = scheme.model.megacomplex["m1"]
+    dataset_model = problem.dataset_models["dataset1"]
+
+    calls = []
+    calculate_matrix = SimpleKineticMegacomplex.calculate_matrix
+
+    def counting_calculate_matrix(self, dataset_model, indices, **kwargs):
+        calls.append(indices)
+        return calculate_matrix(self, dataset_model, indices, **kwargs)
+
+    monkeypatch.setattr(SimpleKineticMegacomplex, "calculate_matrix", counting_calculate_matrix)
+
+    def calculate_matrices():
+        with ThreadPoolExecutor(8) as executor:
+            return list(
+                executor.map(
+                    lambda i: calculate_megacomplex_matrix(
+                        megacomplex, dataset_model, {"global": i}
+                    ),
+                    range(global_axis.size),
+                )
+            )
+
+    # the matrices of all indices are cached for the parameter values, however many there are
+    for value in [0.007, 0.008]:
+        problem.parameters.get("k.1").value = value
+        problem.reset()
+        number_of_calls = len(calls)
+        matrices = calculate_matrices()
+        assert len(calls) - number_of_calls >= global_axis.size
+        number_of_calls = len(calls)
+        assert all(a is b for a, b in zip(calculate_matrices(), matrices))
+        assert len(calls) == number_of_calls
@@ -1,11 +1,14 @@
 from copy import deepcopy
 
+import numpy as np
 import pytest
 
+from glotaran.analysis import util as util_module
 from glotaran.analysis.problem_grouped import GroupedProblem
 from glotaran.analysis.problem_ungrouped import UngroupedProblem
 from glotaran.analysis.simulation import simulate
 from glotaran.analysis.test.models import TwoCompartmentDecay as suite
+from glotaran.analysis.util import ClpLabelRegistry
 from glotaran.model import Relation
 from glotaran.parameter import ParameterGroup
 from glotaran.project import Scheme
@@ -45,3 +48,91 @@ def test_relations(index_dependent, grouped):
     assert "s2" in clps.coords["clp_label"]
     assert clps.sel(clp_label="s2") == clps.sel(clp_label="s1") * 2
     assert "s2" in matrix.clp_labels
+
+
+def test_clp_label_registry():
+    model = deepcopy(suite.model)
+    model.relations.append(Relation.from_dict({"source": "s1", "target": "s2", "parameter": "3"}))
+    registry = ClpLabelRegistry(model)
+
+    encoded = registry.encode(["s3", "s2", "s1"])
+    assert registry.encode(["s3", "s2", "s1"]) is encoded
+    assert registry.decode(encoded.ids) == ["s3", "s2", "s1"]
+    assert encoded.positions[registry.relation_sources].tolist() == [2]
+    assert encoded.positions[registry.relation_targets].tolist() == [1]
+    assert registry.encode(["s4"]).positions[registry.relation_targets].tolist() == [-1]
+
+
+def test_clp_label_registry_reductions(monkeypatch):
+    model = deepcopy(suite.model)
+    model.relations.append(Relation.from_dict({"source": "s1", "target": "s2", "parameter": "3"}))
+    registry = ClpLabelRegistry(model)
+    monkeypatch.setattr(util_module, "REDUCTION_CACHE_SIZE", 2)
+
+    first = registry.get_reduction(("first",), object)
+    second = registry.get_reduction(("second",), object)
+    assert registry.get_reduction(("first",), object) is first
+    # the least recently used reduction is evicted
+    registry.get_reduction(("third",), object)
+    assert registry.get_reduction(("first",), object) is first
+    assert registry.get_reduction(("second",), object) is not second
+
+
+def test_clp_label_registry_per_problem():
+    model = deepcopy(suite.model)
+    model.relations.append(Relation.from_dict({"source": "s1", "target": "s2", "parameter": "3"}))
+    parameters = ParameterGroup.from_list([11e-4, 22e-5, 2])
+    problems = []
+    for global_axis in [suite.global_axis, suite.global_axis + 0.5]:
+        dataset = simulate(
+            suite.sim_model,
+            "dataset1",
+            parameters,
+            {"global": global_axis, "model": suite.model_axis},
+        )
+        scheme = Scheme(model=model, parameters=parameters, data={"dataset1": dataset})
+        problems.append(UngroupedProblem(scheme))
+
+    # the applicability of the relations is only kept for the global indices of a problem
+    registries = [problem.clp_label_registry for problem in problems]
+    assert registries[0] is not registries[1]
+    assert set(registries[0]._applicability) == set(suite.global_axis.tolist())
+    assert deepcopy(registries[0]).decode(registries[0].encode(["s1"]).ids) == ["s1"]
+
+
+def test_relation_interval_segments():
+    model = deepcopy(suite.model)
+    model.megacomplex["m1"].is_index_dependent = False
+    model.relations.append(
+        Relation.from_dict(
+            {"source": "s1", "target": "s2", "parameter": "3", "interval": [(2, 3)]}
+        )
+    )
+    parameters = ParameterGroup.from_list([11e-4, 22e-5, 2])
+    dataset = simulate(
+        suite.sim_model,
+        "dataset1",
+        parameters,
+        {"global": np.arange(1.0, 6.0), "model": suite.model_axis},
+    )
+    scheme = Scheme(model=model, parameters=parameters, data={"dataset1": dataset})
+    problem = GroupedProblem(scheme)
+
+    reduced_matrices = problem.reduced_matrices
+    assert [m.clp_labels for m in reduced_matrices] == [
+        ["s1", "s2"],
+        ["s1"],
+        ["s1"],
+        ["s1", "s2"],
+        ["s1", "s2"],
+    ]
+    assert reduced_matrices[1] is reduced_matrices[2]
+    assert reduced_matrices[3] is reduced_matrices[4]
+    assert reduced_matrices[0] is not reduced_matrices[3]
+
+    matrix = problem.matrices["dataset1"].matrix
+    assert np.allclose(reduced_matrices[1].matrix[:, 0], matrix[:, 0] + 2 * matrix[:, 1])
+
+    parameters.get("3").value = 4
+    problem.parameters = parameters
+    assert np.allclose(problem.reduced_matrices[1].matrix[:, 0], matrix[:, 0] + 4 * matrix[:, 1])
@@ -0,0 +1,22 @@
+import numpy as np
+
+from glotaran.analysis.variable_projection import residual_variable_projection
+from glotaran.analysis.variable_projection import residual_variable_projection_kronecker
+
+
+def test_residual_variable_projection_kronecker():
+    rng = np.random.default_rng(42)
+    model_matrix = rng.random((40, 3))
+    global_matrix = rng.random((30, 2))
+    data = rng.random((40, 30))
+
+    clps, residual = residual_variable_projection_kronecker(model_matrix, global_matrix, data)
+
+    # the flattened layout of the full model
+    full_matrix = np.kron(global_matrix, model_matrix)
+    expected_clps, expected_residual = residual_variable_projection(full_matrix, data.T.flatten())
+
+    assert clps.shape == (3, 2)
+    assert residual.shape == data.shape
+    assert np.allclose(clps.T.flatten(), expected_clps)
+    assert np.allclose(residual.T.flatten(), expected_residual)
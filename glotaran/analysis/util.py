@@ -1,7 +1,11 @@
 from __future__ import annotations
 
-import itertools
+import collections
+import functools
+import threading
+import weakref
 from typing import Any
+from typing import Callable
 from typing import NamedTuple
 
 import numba as nb
@@ -9,7 +13,9 @@ import numpy as np
 import xarray as xr
 
 from glotaran.model import DatasetModel
+from glotaran.model import Megacomplex
 from glotaran.model import Model
+from glotaran.parameter import Parameter
 from glotaran.parameter import ParameterGroup
 
 
@@ -18,20 +24,89 @@ class CalculatedMatrix(NamedTuple):
     matrix: np.ndarray
 
 
-def find_overlap(a, b, rtol=1e-05, atol=1e-08):
-    ovr_a = []
-    ovr_b = []
-    start_b = 0
-    for i, ai in enumerate(a):
-        for j, bj in itertools.islice(enumerate(b), start_b, None):
-            if np.isclose(ai, bj, rtol=rtol, atol=atol, equal_nan=False):
-                ovr_a.append(i)
-                ovr_b.append(j)
-            elif bj > ai:  # (more than tolerance)
-                break  # all the rest will be farther away
-            else:  # bj < ai (more than tolerance)
-                start_b += 1  # ignore further tests of this item
-    return (ovr_a, ovr_b)
+def find_overlap(
+    a: np.ndarray, b: np.ndarray, rtol: float = 1e-05, atol: float = 1e-08
+) -> tuple[np.ndarray, np.ndarray]:
+    """Find the overlapping points of two axes.
+
+    Every point of ``b`` is matched with the closest point of ``a`` if they are close in the
+    sense of :func:`numpy.isclose`. Every point is matched at most once, if several points of
+    ``b`` are close to the same point of ``a`` the closest one is used. The axes do not need to
+    be sorted.
+
+    Parameters
+    ----------
+    a : np.ndarray
+        The first axis.
+    b : np.ndarray
+        The second axis.
+    rtol : float
+        The relative tolerance.
+    atol : float
+        The absolute tolerance.
+
+    Returns
+    -------
+    tuple[np.ndarray, np.ndarray]
+        The indices of the overlapping points in ``a`` and ``b``, ordered by the index in ``a``.
+    """
+    a, b = np.asarray(a), np.asarray(b)
+    if a.size == 0 or b.size == 0:
+        return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+
+    order_a = np.argsort(a, kind="stable")
+    sorted_a = a[order_a]
+    position = np.searchsorted(sorted_a, b)
+    left = np.clip(position - 1, 0, a.size - 1)
+    right = np.clip(position, 0, a.size - 1)
+    closest = np.where(np.abs(sorted_a[right] - b) < np.abs(sorted_a[left] - b), right, left)
+    distance = np.abs(sorted_a[closest] - b)
+
+    ovr_b = np.flatnonzero(distance <= atol + rtol * np.abs(b))
+    ovr_b = ovr_b[np.lexsort((distance[ovr_b], closest[ovr_b]))]
+    _, first = np.unique(closest[ovr_b], return_index=True)
+    ovr_b = ovr_b[first]
+    return order_a[closest[ovr_b]], ovr_b
+
+
+def align_axes(
+    axes: list[np.ndarray], rtol: float = 1e-05, atol: float = 1e-08
+) -> tuple[np.ndarray, list[np.ndarray]]:
+    """Align axes on a common sorted axis.
+
+    Points of different axes which overlap (see :func:`find_overlap`) are mapped onto the same
+    point of the common axis, which takes the value of the first axis containing it.
+
+    Parameters
+    ----------
+    axes : list[np.ndarray]
+        The axes to align, they do not need to be sorted.
+    rtol : float
+        The relative tolerance.
+    atol : float
+        The absolute tolerance.
+
+    Returns
+    -------
+    tuple[np.ndarray, list[np.ndarray]]
+        The common axis and for every axis the indices of its points on the common axis.
+    """
+    full_axis = np.zeros(0, dtype=np.float64)
+    index_maps = []
+    for axis in axes:
+        axis = np.asarray(axis)
+        index_map = np.full(axis.size, -1)
+        ovr_full, ovr_axis = find_overlap(full_axis, axis, rtol=rtol, atol=atol)
+        index_map[ovr_axis] = ovr_full
+        new_points = np.flatnonzero(index_map < 0)
+        index_map[new_points] = full_axis.size + np.arange(new_points.size)
+        full_axis = np.concatenate([full_axis, axis[new_points]])
+        index_maps.append(index_map)
+
+    order = np.argsort(full_axis, kind="stable")
+    rank = np.empty_like(order)
+    rank[order] = np.arange(order.size)
+    return full_axis[order], [rank[index_map] for index_map in index_maps]
 
 
 def find_closest_index(index: float, axis: np.ndarray):
@@ -46,6 +121,167 @@ def get_min_max_from_interval(interval, axis):
     return slice(minimum, maximum)
 
 
+MATRIX_CACHE_SIZE = 16
+"""The maximum number of parameter values whose matrices are cached per megacomplex."""
+
+MATRIX_CACHE_NBYTES = 2 ** 27
+"""The maximum number of bytes of the matrices cached per megacomplex.
+
+The matrices of the most recently used parameter values are kept regardless of their size.
+"""
+
+_matrix_cache_lock = threading.Lock()
+"""Guards the matrix caches of all megacomplexes against concurrent residual threads."""
+
+
+class _CachedMatrices(NamedTuple):
+    axes: tuple[np.ndarray, np.ndarray]
+    matrices: dict[Any, CalculatedMatrix]
+    """The matrices by index."""
+
+
+class _MatrixCache:
+    """The matrix cache of a megacomplex."""
+
+    def __init__(self):
+        self.entries: collections.OrderedDict[Any, _CachedMatrices] = collections.OrderedDict()
+        """The cached matrices by parameter values, the least recently used first."""
+        self.nbytes = 0
+        """The number of bytes of all cached matrices."""
+        self.parameters: dict[str, tuple[list[Parameter], list[str]]] = {}
+        """The parameters and dataset properties the megacomplex depends on by dataset."""
+
+    def evict(self, key: Any):
+        """Evicts the least recently used entries beyond the limits, except the one of ``key``."""
+        while len(self.entries) > 1 and (
+            len(self.entries) > MATRIX_CACHE_SIZE or self.nbytes > MATRIX_CACHE_NBYTES
+        ):
+            oldest = next(iter(self.entries))
+            if oldest == key:
+                self.entries.move_to_end(key)
+                continue
+            self.nbytes -= _get_nbytes(self.entries.pop(oldest))
+
+
+def _get_nbytes(entry: _CachedMatrices) -> int:
+    return sum(matrix.matrix.nbytes for matrix in entry.matrices.values())
+
+
+_matrix_caches: weakref.WeakKeyDictionary[Megacomplex, _MatrixCache] = weakref.WeakKeyDictionary()
+"""The matrix caches by megacomplex."""
+
+
+def calculate_megacomplex_matrix(
+    megacomplex: Megacomplex,
+    dataset_model: DatasetModel,
+    indices: dict[str, int],
+) -> CalculatedMatrix:
+    """Calculates the matrix of a megacomplex, using its matrix cache.
+
+    The cached matrices are read only.
+    """
+    return _cached_megacomplex_matrix(
+        megacomplex,
+        dataset_model,
+        tuple(
+            (dimension, tuple(index) if isinstance(index, (list, np.ndarray)) else index)
+            for dimension, index in sorted(indices.items())
+        ),
+        lambda: megacomplex.calculate_matrix(dataset_model, indices),
+    )
+
+
+def calculate_megacomplex_index_dependent_matrices(
+    megacomplex: Megacomplex,
+    dataset_model: DatasetModel,
+) -> CalculatedMatrix:
+    """Calculates the matrices of a megacomplex for all global indices, using its matrix cache.
+
+    The cached matrices are read only.
+    """
+    return _cached_megacomplex_matrix(
+        megacomplex,
+        dataset_model,
+        "index_dependent",
+        lambda: megacomplex.calculate_index_dependent_matrices(dataset_model),
+    )
+
+
+def _cached_megacomplex_matrix(
+    megacomplex: Megacomplex,
+    dataset_model: DatasetModel,
+    index_key: Any,
+    calculate: Callable[[], tuple[list[str], np.ndarray]],
+) -> CalculatedMatrix:
+    """Returns the matrix from the cache of the megacomplex or calculates and caches it.
+
+    The matrices of all indices are cached in one entry, whose key consists of the dataset, the
+    dimensions and the values of the parameters referenced by the megacomplex and by the dataset
+    properties it declares. The axes are compared by identity. The cache evicts the entries of the
+    least recently used parameter values beyond :data:`MATRIX_CACHE_SIZE` entries or
+    :data:`MATRIX_CACHE_NBYTES` bytes.
+    """
+    with _matrix_cache_lock:
+        cache = _matrix_caches.get(megacomplex)
+        if cache is None:
+            cache = _matrix_caches[megacomplex] = _MatrixCache()
+
+        if dataset_model.label not in cache.parameters:
+            cache.parameters[dataset_model.label] = _get_megacomplex_parameters(
+                megacomplex, dataset_model
+            )
+        parameters, properties = cache.parameters[dataset_model.label]
+
+        axes = (dataset_model.get_model_axis(), dataset_model.get_global_axis())
+        key = (
+            dataset_model.label,
+            dataset_model.get_model_dimension(),
+            dataset_model.get_global_dimension(),
+            tuple(parameter.value for parameter in parameters),
+            tuple(getattr(dataset_model, name) for name in properties),
+        )
+
+        entry = cache.entries.get(key)
+        if entry is None or not all(a is b for a, b in zip(entry.axes, axes)):
+            if entry is not None:
+                cache.nbytes -= _get_nbytes(entry)
+            entry = _CachedMatrices(axes, {})
+            cache.entries[key] = entry
+        cache.entries.move_to_end(key)
+        cache.evict(key)
+        cached_matrix = entry.matrices.get(index_key)
+
+    if cached_matrix is not None:
+        return cached_matrix
+
+    clp_labels, matrix = calculate()
+    matrix.flags.writeable = False
+    cached_matrix = CalculatedMatrix(clp_labels, matrix)
+    with _matrix_cache_lock:
+        # the entry may have been evicted or filled by another thread in the meantime
+        if cache.entries.get(key) is entry and index_key not in entry.matrices:
+            entry.matrices[index_key] = cached_matrix
+            cache.nbytes += matrix.nbytes
+            cache.evict(key)
+    return cached_matrix
+
+
+def _get_megacomplex_parameters(
+    megacomplex: Megacomplex, dataset_model: DatasetModel
+) -> tuple[list[Parameter], list[str]]:
+    """Returns the parameters a megacomplex depends on and the names of the plain dataset
+    properties it declares."""
+    parameters = megacomplex.get_parameters()
+    properties = []
+    for name in megacomplex.glotaran_dataset_properties():
+        value = getattr(dataset_model, name)
+        if isinstance(value, (bool, int, float, str)):
+            properties.append(name)
+        else:
+            parameters += getattr(dataset_model.__class__, name).get_parameters(value)
+    return parameters, properties
+
+
 def calculate_matrix(
     dataset_model: DatasetModel,
     indices: dict[str, int],
@@ -62,10 +298,12 @@ def calculate_matrix(
         dataset_model.swap_dimensions()
 
     for scale, megacomplex in megacomplex_iterator():
-        this_clp_labels, this_matrix = megacomplex.calculate_matrix(dataset_model, indices)
+        this_clp_labels, this_matrix = calculate_megacomplex_matrix(
+            megacomplex, dataset_model, indices
+        )
 
         if scale is not None:
-            this_matrix *= scale
+            this_matrix = this_matrix * scale
 
         if matrix is None:
             clp_labels = this_clp_labels
@@ -79,15 +317,337 @@ def calculate_matrix(
     return CalculatedMatrix(clp_labels, matrix)
 
 
+def calculate_index_dependent_matrices(dataset_model: DatasetModel) -> list[CalculatedMatrix]:
+    """Calculates the matrices of a dataset model for all indices of the global axis.
+
+    Megacomplexes which implement
+    :meth:`glotaran.model.Megacomplex.calculate_index_dependent_matrices` calculate the
+    matrices for all indices in a single call, for all others the matrix is calculated for
+    each index separately.
+    """
+    global_dimension = dataset_model.get_global_dimension()
+    global_axis_size = dataset_model.get_global_axis().size
+
+    matrices = None
+
+    for scale, megacomplex in dataset_model.iterate_megacomplexes():
+        try:
+            this_clp_labels, these_matrices = calculate_megacomplex_index_dependent_matrices(
+                megacomplex, dataset_model
+            )
+            if scale is not None:
+                these_matrices = these_matrices * scale
+            this_matrices = [
+                CalculatedMatrix(this_clp_labels, this_matrix) for this_matrix in these_matrices
+            ]
+        except NotImplementedError:
+            this_matrices = []
+            for i in range(global_axis_size):
+                this_clp_labels, this_matrix = calculate_megacomplex_matrix(
+                    megacomplex, dataset_model, {global_dimension: i}
+                )
+                if scale is not None:
+                    this_matrix = this_matrix * scale
+                this_matrices.append(CalculatedMatrix(this_clp_labels, this_matrix))
+
+        if matrices is None:
+            matrices = this_matrices
+        else:
+            matrices = [
+                CalculatedMatrix(
+                    *combine_matrix(
+                        matrix.matrix,
+                        this_matrix.matrix,
+                        matrix.clp_labels,
+                        this_matrix.clp_labels,
+                    )
+                )
+                for matrix, this_matrix in zip(matrices, this_matrices)
+            ]
+
+    return matrices
+
+
+def calculate_matrix_derivatives(
+    dataset_model: DatasetModel,
+    indices: dict[str, int],
+    clp_labels: list[str],
+) -> dict[str, CalculatedMatrix]:
+    """Calculates the derivatives of the matrix of a dataset model with respect to the parameters.
+
+    The derivatives are arranged in the clp layout of the matrix calculated by
+    :func:`calculate_matrix`. Megacomplexes which do not implement derivatives are skipped.
+    """
+    derivatives = {}
+
+    for scale, megacomplex in dataset_model.iterate_megacomplexes():
+        try:
+            this_clp_labels, this_derivatives = megacomplex.calculate_matrix_derivatives(
+                dataset_model, indices
+            )
+        except NotImplementedError:
+            continue
+
+        for parameter_label, this_derivative in this_derivatives.items():
+            if scale is not None:
+                this_derivative = this_derivative * scale
+            derivative = derivatives.get(
+                parameter_label,
+                CalculatedMatrix(
+                    clp_labels, np.zeros((this_derivative.shape[0], len(clp_labels)))
+                ),
+            )
+            derivatives[parameter_label] = CalculatedMatrix(
+                *combine_matrix(
+                    derivative.matrix, this_derivative, derivative.clp_labels, this_clp_labels
+                )
+            )
+
+    return derivatives
+
+
+class ClpLabelUnion(NamedTuple):
+    clp_labels: tuple[str, ...]
+    """The union of the clp labels in order of appearance."""
+    columns: tuple[np.ndarray, ...]
+    """The columns of the clp labels of every matrix in the union."""
+
+
+CLP_LABEL_UNION_CACHE_SIZE = 1024
+"""The maximum number of cached clp label unions."""
+
+
+def get_clp_label_union(clp_labels: list[list[str]]) -> ClpLabelUnion:
+    """Returns the union of the clp labels of several matrices and their columns in it.
+
+    The clp labels of a model rarely change, so the unions are cached and the columns can be
+    used as scatter indices when combining the matrices.
+
+    Parameters
+    ----------
+    clp_labels : list[list[str]]
+        The clp labels of the matrices.
+
+    Returns
+    -------
+    ClpLabelUnion
+        The union of the clp labels and the column indices of every matrix in the union.
+    """
+    return _get_clp_label_union(tuple(map(tuple, clp_labels)))
+
+
+@functools.lru_cache(maxsize=CLP_LABEL_UNION_CACHE_SIZE)
+def _get_clp_label_union(clp_labels: tuple[tuple[str, ...], ...]) -> ClpLabelUnion:
+    label_indices = {}
+    columns = []
+    for labels in clp_labels:
+        matrix_columns = np.asarray(
+            [label_indices.setdefault(label, len(label_indices)) for label in labels], dtype=int
+        )
+        matrix_columns.flags.writeable = False
+        columns.append(matrix_columns)
+    return ClpLabelUnion(tuple(label_indices), tuple(columns))
+
+
 def combine_matrix(matrix, this_matrix, clp_labels, this_clp_labels):
-    tmp_clp_labels = clp_labels + [c for c in this_clp_labels if c not in clp_labels]
-    tmp_matrix = np.zeros((matrix.shape[0], len(tmp_clp_labels)), dtype=np.float64)
-    for idx, label in enumerate(tmp_clp_labels):
-        if label in clp_labels:
-            tmp_matrix[:, idx] += matrix[:, clp_labels.index(label)]
-        if label in this_clp_labels:
-            tmp_matrix[:, idx] += this_matrix[:, this_clp_labels.index(label)]
-    return tmp_clp_labels, tmp_matrix
+    clp_label_union = get_clp_label_union([clp_labels, this_clp_labels])
+    columns, this_columns = clp_label_union.columns
+    tmp_matrix = np.zeros((matrix.shape[0], len(clp_label_union.clp_labels)), dtype=np.float64)
+    tmp_matrix[:, columns] = matrix
+    tmp_matrix[:, this_columns] += this_matrix
+    return list(clp_label_union.clp_labels), tmp_matrix
+
+
+class EncodedClpLabels(NamedTuple):
+    ids: np.ndarray
+    """The ids of the clp labels."""
+    positions: np.ndarray
+    """The position of every registered id in the clp labels, ``-1`` if it is not contained."""
+
+
+class ClpLabelRegistry:
+    """Interns clp labels to integer ids.
+
+    The encodings of clp label lists are cached, so that lookups of clp labels reduce to
+    indexing integer arrays. The ids of the targets and sources of the relations and the
+    targets of the constraints of the model are registered on creation.
+
+    The registry also caches which relations and constraints apply at a global index and the
+    relation matrices and constraint masks used to reduce matrices. Since the global indices
+    depend on the data, every problem has its own registry.
+    """
+
+    def __init__(self, model: Model):
+        """
+
+        Parameters
+        ----------
+        model : Model
+            The model providing the relations and constraints.
+        """
+        self._ids = {}
+        self._labels = []
+        self._lock = threading.Lock()
+        self._encodings = {}
+        self._applicability = {}
+        self._relation_parameters = None
+        self._reductions = collections.OrderedDict()
+        self.relation_targets = self._register([r.target for r in model.relations])
+        self.relation_sources = self._register([r.source for r in model.relations])
+        self.constraint_targets = self._register([c.target for c in model.constraints])
+
+    def __len__(self) -> int:
+        return len(self._labels)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def precompute_applicability(self, model: Model, axis: np.ndarray):
+        """Precomputes which relations and constraints apply at every point of an axis.
+
+        Parameters
+        ----------
+        model : Model
+            The model providing the relations and constraints.
+        axis : np.ndarray
+            The global axis.
+        """
+        axis = np.asarray(axis)
+        relations = np.asarray(
+            [_interval_mask(relation.interval, axis) for relation in model.relations]
+        ).reshape((len(model.relations), axis.size))
+        constraints = np.asarray(
+            [_interval_mask(constraint.interval, axis) for constraint in model.constraints]
+        ).reshape((len(model.constraints), axis.size))
+        for i, index in enumerate(axis.tolist()):
+            if index not in self._applicability:
+                self._applicability[index] = self._read_only(relations[:, i], constraints[:, i])
+
+    def get_applicability(self, model: Model, index: Any | None) -> tuple[np.ndarray, np.ndarray]:
+        """Returns which relations and constraints apply at a global index.
+
+        Parameters
+        ----------
+        model : Model
+            The model providing the relations and constraints.
+        index : Any | None
+            The value of the global index, ``None`` if the matrix is index independent.
+
+        Returns
+        -------
+        tuple[np.ndarray, np.ndarray]
+            Boolean masks of the applying relations and constraints.
+        """
+        applicability = self._applicability.get(index)
+        if applicability is None:
+            applicability = self._read_only(
+                np.asarray([relation.applies(index) for relation in model.relations], dtype=bool),
+                np.asarray(
+                    [constraint.applies(index) for constraint in model.constraints], dtype=bool
+                ),
+            )
+            self._applicability[index] = applicability
+        return applicability
+
+    def get_relation_values(self, model: Model, parameters: ParameterGroup) -> np.ndarray:
+        """Returns the current values of the relation parameters.
+
+        The parameters are resolved once per parameter group.
+        """
+        if self._relation_parameters is None or self._relation_parameters[0] is not parameters:
+            self._relation_parameters = (
+                parameters,
+                [parameters.get(relation.parameter.full_label) for relation in model.relations],
+            )
+        return np.asarray(
+            [parameter.value for parameter in self._relation_parameters[1]], dtype=np.float64
+        )
+
+    def get_reduction(self, key: tuple, create: Callable[[], Any]) -> Any:
+        """Returns a cached relation matrix or constraint mask or creates it.
+
+        The least recently used reductions beyond :data:`REDUCTION_CACHE_SIZE` are evicted.
+        """
+        # reductions are requested by the residual threads too
+        with self._lock:
+            reduction = self._reductions.get(key)
+            if reduction is not None:
+                self._reductions.move_to_end(key)
+                return reduction
+        reduction = create()
+        with self._lock:
+            self._reductions[key] = reduction
+            if len(self._reductions) > REDUCTION_CACHE_SIZE:
+                self._reductions.popitem(last=False)
+        return reduction
+
+    @staticmethod
+    def _read_only(*arrays: np.ndarray) -> tuple[np.ndarray, ...]:
+        for array in arrays:
+            array.flags.writeable = False
+        return arrays
+
+    def encode(self, clp_labels: list[str]) -> EncodedClpLabels:
+        """Encodes clp labels.
+
+        Parameters
+        ----------
+        clp_labels : list[str]
+            The clp labels.
+
+        Returns
+        -------
+        EncodedClpLabels
+            The ids of the clp labels and the positions of all registered ids in them.
+        """
+        key = tuple(clp_labels)
+        encoded = self._encodings.get(key)
+        if encoded is None:
+            # labels are registered by the residual threads too
+            with self._lock:
+                ids = self._register(key)
+                positions = np.full(len(self._labels), -1)
+                positions[ids] = np.arange(ids.size)
+                positions.flags.writeable = False
+                encoded = EncodedClpLabels(ids, positions)
+                self._encodings[key] = encoded
+        return encoded
+
+    def decode(self, ids: np.ndarray) -> list[str]:
+        """Returns the clp labels of ids."""
+        return [self._labels[i] for i in ids]
+
+    def _register(self, clp_labels: tuple[str, ...] | list[str]) -> np.ndarray:
+        for label in clp_labels:
+            if label not in self._ids:
+                self._ids[label] = len(self._labels)
+                self._labels.append(label)
+                # The positions of cached encodings do not cover the new id.
+                self._encodings.clear()
+        ids = np.asarray([self._ids[label] for label in clp_labels], dtype=int)
+        ids.flags.writeable = False
+        return ids
+
+
+REDUCTION_CACHE_SIZE = 1024
+"""The maximum number of cached relation matrices and constraint masks per registry."""
+
+
+def _interval_mask(interval: Any, axis: np.ndarray) -> np.ndarray:
+    """Returns a mask of the points of an axis in an interval property's intervals."""
+    if interval is None:
+        return np.ones(axis.size, dtype=bool)
+    intervals = [interval] if isinstance(interval, tuple) else interval
+    mask = np.zeros(axis.size, dtype=bool)
+    for minimum, maximum in intervals:
+        mask |= (minimum <= axis) & (axis <= maximum)
+    return mask
 
 
 @nb.jit(nopython=True, parallel=True)
@@ -101,9 +661,12 @@ def reduce_matrix(
     model: Model,
     parameters: ParameterGroup,
     index: Any | None,
+    registry: ClpLabelRegistry | None = None,
 ) -> CalculatedMatrix:
-    matrix = apply_relations(matrix, model, parameters, index)
-    matrix = apply_constraints(matrix, model, index)
+    if registry is None and (len(model.relations) != 0 or len(model.constraints) != 0):
+        registry = ClpLabelRegistry(model)
+    matrix = apply_relations(matrix, model, parameters, index, registry)
+    matrix = apply_constraints(matrix, model, index, registry)
     return matrix
 
 
@@ -111,19 +674,30 @@ def apply_constraints(
     matrix: CalculatedMatrix,
     model: Model,
     index: Any | None,
+    registry: ClpLabelRegistry | None = None,
 ) -> CalculatedMatrix:
 
     if len(model.constraints) == 0:
         return matrix
 
-    clp_labels = matrix.clp_labels
-    removed_clp_labels = [
-        c.target for c in model.constraints if c.target in clp_labels and c.applies(index)
-    ]
-    reduced_clp_labels = [c for c in clp_labels if c not in removed_clp_labels]
-    mask = [label in reduced_clp_labels for label in clp_labels]
-    reduced_matrix = matrix.matrix[:, mask]
-    return CalculatedMatrix(reduced_clp_labels, reduced_matrix)
+    if registry is None:
+        registry = ClpLabelRegistry(model)
+    encoded = registry.encode(matrix.clp_labels)
+    _, constraint_applies = registry.get_applicability(model, index)
+    targets = encoded.positions[registry.constraint_targets]
+    removed = targets[(targets >= 0) & constraint_applies]
+    if removed.size == 0:
+        return matrix
+
+    def create_mask() -> tuple[list[str], np.ndarray]:
+        mask = np.ones(len(encoded.ids), dtype=bool)
+        mask[removed] = False
+        return registry.decode(encoded.ids[mask]), mask
+
+    reduced_clp_labels, mask = registry.get_reduction(
+        ("constraints", encoded.ids.tobytes(), removed.tobytes()), create_mask
+    )
+    return CalculatedMatrix(list(reduced_clp_labels), matrix.matrix[:, mask])
 
 
 def apply_relations(
@@ -131,31 +705,39 @@ def apply_relations(
     model: Model,
     parameters: ParameterGroup,
     index: Any | None,
+    registry: ClpLabelRegistry | None = None,
 ) -> CalculatedMatrix:
 
     if len(model.relations) == 0:
         return matrix
 
-    clp_labels = matrix.clp_labels
-    relation_matrix = np.diagflat([1.0 for _ in clp_labels])
-
-    idx_to_delete = []
-    for relation in model.relations:
-        if relation.target in clp_labels and relation.applies(index):
-
-            if relation.source not in clp_labels:
-                continue
-
-            relation = relation.fill(model, parameters)
-            source_idx = clp_labels.index(relation.source)
-            target_idx = clp_labels.index(relation.target)
-            relation_matrix[target_idx, source_idx] = relation.parameter
-            idx_to_delete.append(target_idx)
+    if registry is None:
+        registry = ClpLabelRegistry(model)
+    encoded = registry.encode(matrix.clp_labels)
+    relation_applies, _ = registry.get_applicability(model, index)
+    targets = encoded.positions[registry.relation_targets]
+    sources = encoded.positions[registry.relation_sources]
+    applied = np.flatnonzero((targets >= 0) & (sources >= 0) & relation_applies)
+    if applied.size == 0:
+        return matrix
 
-    reduced_clp_labels = [label for i, label in enumerate(clp_labels) if i not in idx_to_delete]
-    relation_matrix = np.delete(relation_matrix, idx_to_delete, axis=1)
-    reduced_matrix = matrix.matrix @ relation_matrix
-    return CalculatedMatrix(reduced_clp_labels, reduced_matrix)
+    values = registry.get_relation_values(model, parameters)[applied]
+
+    def create_relation_matrix() -> tuple[list[str], np.ndarray]:
+        relation_matrix = np.eye(len(encoded.ids))
+        for i, value in zip(applied, values):
+            relation_matrix[targets[i], sources[i]] = value
+        mask = np.ones(len(encoded.ids), dtype=bool)
+        mask[targets[applied]] = False
+        return registry.decode(encoded.ids[mask]), relation_matrix[:, mask]
+
+    # The relation matrix is only rebuilt if the labels, the applying relations or the
+    # values of their parameters change.
+    reduced_clp_labels, relation_matrix = registry.get_reduction(
+        ("relations", encoded.ids.tobytes(), applied.tobytes(), values.tobytes()),
+        create_relation_matrix,
+    )
+    return CalculatedMatrix(list(reduced_clp_labels), matrix.matrix @ relation_matrix)
 
 
 def retrieve_clps(
@@ -165,29 +747,94 @@ def retrieve_clps(
     reduced_clp_labels: xr.DataArray,
     reduced_clps: xr.DataArray,
     index: Any | None,
+    registry: ClpLabelRegistry | None = None,
 ) -> xr.DataArray:
     if len(model.relations) == 0 and len(model.constraints) == 0:
         return reduced_clps
 
-    clps = np.zeros(len(clp_labels))
+    if registry is None:
+        registry = ClpLabelRegistry(model)
+    encoded = registry.encode(clp_labels)
 
-    for i, label in enumerate(reduced_clp_labels):
-        idx = clp_labels.index(label)
-        clps[idx] = reduced_clps[i]
+    clps = np.zeros(len(clp_labels))
+    clps[encoded.positions[registry.encode(reduced_clp_labels).ids]] = reduced_clps
 
-    for relation in model.relations:
-        relation = relation.fill(model, parameters)
-        if (
-            relation.target in clp_labels
-            and relation.applies(index)
-            and relation.source in clp_labels
-        ):
-            source_idx = clp_labels.index(relation.source)
-            target_idx = clp_labels.index(relation.target)
-            clps[target_idx] = relation.parameter * clps[source_idx]
+    if len(model.relations) == 0:
+        return clps
+
+    relation_applies, _ = registry.get_applicability(model, index)
+    targets = encoded.positions[registry.relation_targets]
+    sources = encoded.positions[registry.relation_sources]
+    applied = np.flatnonzero((targets >= 0) & (sources >= 0) & relation_applies)
+    if applied.size != 0:
+        values = registry.get_relation_values(model, parameters)
+        for i in applied:
+            clps[targets[i]] = values[i] * clps[sources[i]]
     return clps
 
 
+class ClpPenaltyIndices(NamedTuple):
+    source: np.ndarray
+    """The global indices of the source area, with repetitions."""
+    target: np.ndarray
+    """The global indices of the target area, with repetitions."""
+
+
+def get_clp_penalty_indices(
+    model: Model, global_axis: np.ndarray, dataset_models: dict[str, DatasetModel]
+) -> list[ClpPenaltyIndices]:
+    """Calculates the global indices of the areas of the clp penalties of a model.
+
+    The indices only depend on the axes, so they can be calculated once for a problem and
+    passed to :func:`calculate_clp_penalties`.
+
+    Parameters
+    ----------
+    model : Model
+        The model providing the penalties.
+    global_axis : np.ndarray
+        The global axis the clps are given on.
+    dataset_models : dict[str, DatasetModel]
+        The dataset models, the intervals are bounded to each of their global axes.
+
+    Returns
+    -------
+    list[ClpPenaltyIndices]
+        The indices of the source and target area of each penalty.
+    """
+    dataset_axes = [dataset_model.get_global_axis() for dataset_model in dataset_models.values()]
+    return [
+        ClpPenaltyIndices(
+            _get_area_indices(penalty.source_intervals, global_axis, dataset_axes),
+            _get_area_indices(penalty.target_intervals, global_axis, dataset_axes),
+        )
+        for penalty in model.clp_area_penalties
+    ]
+
+
+def _get_area_indices(
+    intervals: list[tuple[float, float]], global_axis: np.ndarray, dataset_axes: list[np.ndarray]
+) -> np.ndarray:
+    # TODO: make a decision on how to handle clp_penalties per dataset
+    # 1. sum up contributions per dataset on each dataset_axis (v0.4.1)
+    # 2. sum up contributions on the global_axis (future?)
+    indices = [np.zeros(0, dtype=int)]
+    for dataset_axis in dataset_axes:
+        dataset_minimum, dataset_maximum = np.min(dataset_axis), np.max(dataset_axis)
+        for interval in intervals:
+            if interval[0] > global_axis[-1]:
+                continue
+            bounded_interval = (
+                max(interval[0], dataset_minimum),
+                min(interval[1], dataset_maximum),
+            )
+            start_idx, end_idx = get_idx_from_interval(bounded_interval, global_axis)
+            indices.append(np.arange(start_idx, end_idx + 1))
+    indices = np.concatenate(indices)
+    indices.flags.writeable = False
+    return indices
+
+
 def calculate_clp_penalties(
     model: Model,
     parameters: ParameterGroup,
@@ -195,78 +842,87 @@ def calculate_clp_penalties(
     clps: list[np.ndarray],
     global_axis: np.ndarray,
     dataset_models: dict[str, DatasetModel],
+    penalty_indices: list[ClpPenaltyIndices] | None = None,
+    registry: ClpLabelRegistry | None = None,
 ) -> np.ndarray:
+    """Calculates the equal area penalties.
 
-    # TODO: make a decision on how to handle clp_penalties per dataset
-    # 1. sum up contributions per dataset on each dataset_axis (v0.4.1)
-    # 2. sum up contributions on the global_axis (future?)
+    Parameters
+    ----------
+    model : Model
+        The model providing the penalties.
+    parameters : ParameterGroup
+        The parameters.
+    clp_labels : list[list[str]] | list[str]
+        The clp labels for each global index or for all of them.
+    clps : list[np.ndarray]
+        The clps for each global index.
+    global_axis : np.ndarray
+        The global axis the clps are given on.
+    dataset_models : dict[str, DatasetModel]
+        The dataset models.
+    penalty_indices : list[ClpPenaltyIndices] | None
+        The indices calculated by :func:`get_clp_penalty_indices`, calculated if ``None``.
+    registry : ClpLabelRegistry | None
+        The clp label registry of the problem, created for the call if ``None``.
 
-    penalties = []
-    for penalty in model.clp_area_penalties:
-        penalty = penalty.fill(model, parameters)
-        source_area = np.array([])
-        target_area = np.array([])
-        for _, dataset_model in dataset_models.items():
-            dataset_axis = dataset_model.get_global_axis()
-
-            source_area = np.concatenate(
-                [
-                    source_area,
-                    _get_area(
-                        penalty.source,
-                        clp_labels,
-                        clps,
-                        penalty.source_intervals,
-                        global_axis,
-                        dataset_axis,
-                    ),
-                ]
-            )
+    Returns
+    -------
+    np.ndarray
+        The penalties.
+    """
+    if len(model.clp_area_penalties) == 0:
+        return np.asarray([])
+    if penalty_indices is None:
+        penalty_indices = get_clp_penalty_indices(model, global_axis, dataset_models)
 
-            target_area = np.concatenate(
-                [
-                    target_area,
-                    _get_area(
-                        penalty.target,
-                        clp_labels,
-                        clps,
-                        penalty.target_intervals,
-                        global_axis,
-                        dataset_axis,
-                    ),
-                ]
-            )
-        area_penalty = np.abs(np.sum(source_area) - penalty.parameter * np.sum(target_area))
+    if registry is None:
+        registry = ClpLabelRegistry(model)
+    # The clps are packed in one array if they have the same size at every index.
+    packed_clps = np.asarray(clps) if len({len(c) for c in clps}) == 1 else None
 
+    penalties = []
+    for penalty, indices in zip(model.clp_area_penalties, penalty_indices):
+        source_area = _get_area(
+            registry, penalty.source, clp_labels, clps, packed_clps, indices.source
+        )
+        target_area = _get_area(
+            registry, penalty.target, clp_labels, clps, packed_clps, indices.target
+        )
+        parameter = parameters.get(penalty.parameter.full_label).value
+        area_penalty = np.abs(source_area - parameter * target_area)
         penalties.append(area_penalty * penalty.weight)
 
     return np.asarray(penalties)
 
 
 def _get_area(
+    registry: ClpLabelRegistry,
     clp_label: str,
-    clp_labels: list[list[str]],
+    clp_labels: list[list[str]] | list[str],
     clps: list[np.ndarray],
-    intervals: list[tuple[float, float]],
-    global_axis: np.ndarray,
-    dataset_axis: np.ndarray,
-) -> np.ndarray:
-    area = []
-
-    for interval in intervals:
-        if interval[0] > global_axis[-1]:
-            continue
-        bounded_interval = (
-            max(interval[0], np.min(dataset_axis)),
-            min(interval[1], np.max(dataset_axis)),
-        )
-        start_idx, end_idx = get_idx_from_interval(bounded_interval, global_axis)
-        for i in range(start_idx, end_idx + 1):
-            index_clp_labels = clp_labels[i] if isinstance(clp_labels[0], list) else clp_labels
-            if clp_label in index_clp_labels:
-                area.append(clps[i][index_clp_labels.index(clp_label)])
-
-    return np.asarray(area)  # TODO: normalize for distance on global axis
+    packed_clps: np.ndarray | None,
+    indices: np.ndarray,
+) -> float:
+    """Returns the sum of the clps of a label at the indices."""
+    if indices.size == 0:
+        return 0.0
+    label_id = registry.encode([clp_label]).ids[0]
+    if isinstance(clp_labels[0], list):
+        unique_indices, inverse = np.unique(indices, return_inverse=True)
+        positions = np.asarray(
+            [registry.encode(clp_labels[i]).positions[label_id] for i in unique_indices]
+        )[inverse]
+    else:
+        positions = np.full(indices.size, registry.encode(clp_labels).positions[label_id])
+
+    is_contained = positions >= 0
+    indices, positions = indices[is_contained], positions[is_contained]
+    if packed_clps is not None:
+        return np.sum(
+            packed_clps[indices, positions]
+        )  # TODO: normalize for distance on global axis
+    return sum(clps[i][position] for i, position in zip(indices, positions))
 
 
 def get_idx_from_interval(interval: tuple[float, float], axis: np.ndarray) -> tuple[int, int]:
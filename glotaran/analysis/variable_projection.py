@@ -8,32 +8,127 @@ from scipy.linalg import lapack
 
 
 def residual_variable_projection(
-    matrix: np.ndarray, data: np.ndarray
+    matrix: np.ndarray,
+    data: np.ndarray,
+    overwrite_matrix: bool = False,
+    overwrite_data: bool = False,
 ) -> typing.Tuple[np.ndarray, np.ndarray]:
     """Calculates the conditionally linear parameters and residual with the variable projection
     method.
 
+    The data can either be a single vector or a 2 dimensional array of shape
+    ``(model_axis_size, number_of_columns)``. In the latter case the matrix is factorized only
+    once and applied to all columns at once.
+
     Parameters
     ----------
     matrix :
         The model matrix.
     data : np.ndarray
         The data to analyze.
+    overwrite_matrix : bool
+        Whether the matrix may be overwritten by its factorization. This avoids a copy if the
+        matrix is in Fortran order.
+    overwrite_data : bool
+        Whether the data may be overwritten by the residual. This avoids a copy if the data is
+        contiguous in Fortran order.
     """
     # TODO: Reference Kaufman paper
 
+    # dormqr needs at least as much workspace as the number of columns of the data
+    lwork = max(1, matrix.shape[1], data.shape[1] if data.ndim == 2 else 1)
+
     # Kaufman Q2 step 3
-    qr, tau, _, _ = lapack.dgeqrf(matrix)
+    qr, tau, _, _ = lapack.dgeqrf(matrix, overwrite_a=overwrite_matrix)
 
     # Kaufman Q2 step 4
-    temp, _, _ = lapack.dormqr("L", "T", qr, tau, data, max(1, matrix.shape[1]), overwrite_c=0)
+    temp, _, _ = lapack.dormqr("L", "T", qr, tau, data, lwork, overwrite_c=overwrite_data)
 
     clp, _ = lapack.dtrtrs(qr, temp)
 
-    for i in range(matrix.shape[1]):
-        temp[i] = 0
+    temp[: matrix.shape[1]] = 0
 
     # Kaufman Q2 step 5
 
-    residual, _, _ = lapack.dormqr("L", "N", qr, tau, temp, max(1, matrix.shape[1]), overwrite_c=0)
+    # temp is not needed anymore, so the residual is calculated in place
+    residual, _, _ = lapack.dormqr("L", "N", qr, tau, temp, lwork, overwrite_c=1)
     return clp[: matrix.shape[1]], residual
+
+
+def residual_variable_projection_kronecker(
+    model_matrix: np.ndarray, global_matrix: np.ndarray, data: np.ndarray
+) -> typing.Tuple[np.ndarray, np.ndarray]:
+    r"""Calculates the conditionally linear parameters and residual with the variable projection
+    method for a matrix which is the kronecker product of a global and a model matrix.
+
+    With :math:`\operatorname{vec}(A X G^T) = (G \otimes A) \operatorname{vec}(X)` the least
+    squares problem separates into one problem for each factor, so the kronecker product is
+    never calculated.
+
+    Parameters
+    ----------
+    model_matrix : np.ndarray
+        The model matrix :math:`A` of shape ``(model_axis_size, number_of_clps)``.
+    global_matrix : np.ndarray
+        The global matrix :math:`G` of shape ``(global_axis_size, number_of_global_clps)``.
+    data : np.ndarray
+        The data of shape ``(model_axis_size, global_axis_size)``.
+
+    Returns
+    -------
+    typing.Tuple[np.ndarray, np.ndarray]
+        The conditionally linear parameters of shape ``(number_of_clps, number_of_global_clps)``
+        and the residual of the shape of the data.
+    """
+    model_clps, _ = residual_variable_projection(model_matrix, data)
+    clps, _ = residual_variable_projection(global_matrix, np.ascontiguousarray(model_clps.T))
+    clps = clps.T
+    residual = data - model_matrix @ clps @ global_matrix.T
+    return clps, residual
+
+
+def jacobian_variable_projection(
+    matrix: np.ndarray, matrix_derivatives: typing.List[np.ndarray], clp: np.ndarray
+) -> np.ndarray:
+    r"""Calculates the jacobian of the variable projection residual with Kaufman's approximation.
+
+    The column of the jacobian for a parameter is :math:`-P^\perp \partial_p A c`, where
+    :math:`P^\perp` is the projector on the orthogonal complement of the column space of the
+    matrix :math:`A` and :math:`c` are the conditionally linear parameters.
+
+    Parameters
+    ----------
+    matrix :
+        The model matrix.
+    matrix_derivatives : typing.List[np.ndarray]
+        The derivatives of the model matrix with respect to each parameter.
+    clp : np.ndarray
+        The conditionally linear parameters as returned by :func:`residual_variable_projection`.
+        If they are 2 dimensional, the rows of the jacobian are ordered like the flattened
+        columns of the residual.
+
+    Returns
+    -------
+    np.ndarray
+        The jacobian with one column per parameter.
+    """
+    number_of_parameters = len(matrix_derivatives)
+    number_of_columns = clp.shape[1] if clp.ndim == 2 else 1
+    clp = clp.reshape((clp.shape[0], number_of_columns))
+
+    # The right hand side holds the derivatives for all columns and parameters.
+    temp = np.empty((matrix.shape[0], number_of_columns * number_of_parameters))
+    for i, matrix_derivative in enumerate(matrix_derivatives):
+        temp[:, i * number_of_columns : (i + 1) * number_of_columns] = matrix_derivative @ clp
+
+    lwork = max(1, matrix.shape[1], temp.shape[1])
+    qr, tau, _, _ = lapack.dgeqrf(matrix)
+    temp, _, _ = lapack.dormqr("L", "T", qr, tau, temp, lwork, overwrite_c=1)
+    for i in range(matrix.shape[1]):
+        temp[i] = 0
+    temp, _, _ = lapack.dormqr("L", "N", qr, tau, temp, lwork, overwrite_c=1)
+
+    jacobian = -temp.reshape((matrix.shape[0], number_of_parameters, number_of_columns))
+    return jacobian.transpose((2, 0, 1)).reshape(
+        (number_of_columns * matrix.shape[0], number_of_parameters)
+    )
@@ -17,6 +17,7 @@ from glotaran.io import save_dataset
 from glotaran.io import save_parameters
 from glotaran.model import Model
 from glotaran.parameter import ParameterGroup
+from glotaran.project import ParameterHistoryOptions
 from glotaran.project import SavingOptions
 from glotaran.project import Scheme
 from glotaran.utils.sanitize import sanitize_yaml
@@ -125,6 +126,11 @@ class YmlProjectIo(ProjectIoInterface):
                 raise ValueError(f"Error loading dataset '{label}': {e}")
 
         optimization_method = scheme.get("optimization_method", "TrustRegionReflection")
+        jacobian_method = scheme.get("jacobian_method", "FiniteDifference")
+        number_of_jacobian_workers = scheme.get("number_of_jacobian_workers", None)
+        jacobian_start_method = scheme.get("jacobian_start_method", "spawn")
+        number_of_residual_threads = scheme.get("number_of_residual_threads", None)
+        number_of_residual_workers = scheme.get("number_of_residual_workers", None)
         nnls = scheme.get("non-negative-least-squares", False)
         nfev = scheme.get("maximum-number-function-evaluations", None)
         ftol = scheme.get("ftol", 1e-8)
@@ -133,6 +139,7 @@ class YmlProjectIo(ProjectIoInterface):
         group = scheme.get("group", False)
         group_tolerance = scheme.get("group_tolerance", 0.0)
         saving = SavingOptions(**scheme.get("saving", {}))
+        parameter_history = ParameterHistoryOptions(**scheme.get("parameter_history", {}))
         return Scheme(
             model=model,
             parameters=parameters,
@@ -145,7 +152,13 @@ class YmlProjectIo(ProjectIoInterface):
             group=group,
             group_tolerance=group_tolerance,
             optimization_method=optimization_method,
+            jacobian_method=jacobian_method,
+            number_of_jacobian_workers=number_of_jacobian_workers,
+            jacobian_start_method=jacobian_start_method,
+            number_of_residual_threads=number_of_residual_threads,
+            number_of_residual_workers=number_of_residual_workers,
             saving=saving,
+            parameter_history=parameter_history,
         )
 
     def save_scheme(self, scheme: Scheme, file_name: str):
@@ -2,6 +2,7 @@
 from __future__ import annotations
 
 from typing import List
+from typing import NamedTuple
 
 import numpy as np
 import xarray as xr
@@ -10,6 +11,8 @@ from glotaran.builtin.megacomplexes.decay.initial_concentration import InitialCo
 from glotaran.builtin.megacomplexes.decay.irf import Irf
 from glotaran.builtin.megacomplexes.decay.irf import IrfMultiGaussian
 from glotaran.builtin.megacomplexes.decay.k_matrix import KMatrix
+from glotaran.builtin.megacomplexes.decay.util import decay_matrices_implementation
+from glotaran.builtin.megacomplexes.decay.util import decay_matrix_derivatives_implementation
 from glotaran.builtin.megacomplexes.decay.util import decay_matrix_implementation
 from glotaran.builtin.megacomplexes.decay.util import retrieve_decay_associated_data
 from glotaran.builtin.megacomplexes.decay.util import retrieve_irf
@@ -20,6 +23,16 @@ from glotaran.model import ModelError
 from glotaran.model import megacomplex
 
 
+class KMatrixDecomposition(NamedTuple):
+    """The index independent part of the decay matrix of a dataset."""
+
+    initial_concentration: InitialConcentration
+    k_matrix: KMatrix
+    species: list[str]
+    rates: np.ndarray
+    a_matrix: np.ndarray
+
+
 @megacomplex(
     dimension="time",
     model_items={
@@ -60,29 +73,60 @@ class DecayMegacomplex(Megacomplex):
             and dataset_model.irf.is_index_dependent()
         )
 
-    def calculate_matrix(
-        self,
-        dataset_model: DatasetModel,
-        indices: dict[str, int],
-        **kwargs,
-    ):
+    def decompose_k_matrix(self, dataset_model: DatasetModel) -> KMatrixDecomposition:
+        """Returns the rates and the A matrix of the k matrix for the initial concentration
+        of a dataset.
+
+        The eigen decomposition does not depend on the global index, so the result is cached
+        by the parameter values of the k matrices and the initial concentration. The cache
+        lives on the filled megacomplex and only holds the latest decomposition.
+        """
         if dataset_model.initial_concentration is None:
             raise ModelError(
                 f'No initial concentration specified in dataset "{dataset_model.label}"'
             )
-        initial_concentration = dataset_model.initial_concentration.normalized()
-
-        k_matrix = self.full_k_matrix()
 
-        # we might have more species in the model then in the k matrix
-        species = [
-            comp
-            for comp in initial_concentration.compartments
-            if comp in k_matrix.involved_compartments()
-        ]
+        key = (
+            dataset_model.initial_concentration.label,
+            tuple(float(p) for p in dataset_model.initial_concentration.parameters),
+            tuple(
+                (index, float(p))
+                for k_matrix in self.k_matrix
+                for index, p in k_matrix.matrix.items()
+            ),
+        )
+        if not hasattr(self, "_k_matrix_decompositions"):
+            self._k_matrix_decompositions = {}
+        if key not in self._k_matrix_decompositions:
+            self._k_matrix_decompositions.clear()
+            initial_concentration = dataset_model.initial_concentration.normalized()
+
+            k_matrix = self.full_k_matrix()
+
+            # we might have more species in the model then in the k matrix
+            species = [
+                comp
+                for comp in initial_concentration.compartments
+                if comp in k_matrix.involved_compartments()
+            ]
+
+            self._k_matrix_decompositions[key] = KMatrixDecomposition(
+                initial_concentration=initial_concentration,
+                k_matrix=k_matrix,
+                species=species,
+                # the rates are the eigenvalues of the k matrix
+                rates=k_matrix.rates(initial_concentration),
+                a_matrix=k_matrix.a_matrix(initial_concentration),
+            )
+        return self._k_matrix_decompositions[key]
 
-        # the rates are the eigenvalues of the k matrix
-        rates = k_matrix.rates(initial_concentration)
+    def calculate_matrix(
+        self,
+        dataset_model: DatasetModel,
+        indices: dict[str, int],
+        **kwargs,
+    ):
+        _, k_matrix, species, rates, a_matrix = self.decompose_k_matrix(dataset_model)
 
         global_dimension = dataset_model.get_global_dimension()
         global_index = indices.get(global_dimension)
@@ -104,11 +148,67 @@ class DecayMegacomplex(Megacomplex):
             )
 
         # apply A matrix
-        matrix = matrix @ k_matrix.a_matrix(initial_concentration)
+        matrix = matrix @ a_matrix
 
         # done
         return species, matrix
 
+    def calculate_index_dependent_matrices(
+        self,
+        dataset_model: DatasetModel,
+        **kwargs,
+    ):
+        _, k_matrix, species, rates, a_matrix = self.decompose_k_matrix(dataset_model)
+
+        global_axis = dataset_model.get_global_axis()
+        model_axis = dataset_model.get_model_axis()
+
+        size = (global_axis.size, model_axis.size, rates.size)
+        matrices = np.zeros(size, dtype=np.float64)
+
+        decay_matrices_implementation(matrices, rates, global_axis, model_axis, dataset_model)
+
+        if not np.all(np.isfinite(matrices)):
+            raise ValueError(
+                f"Non-finite concentrations for K-Matrix '{k_matrix.label}':\n"
+                f"{k_matrix.matrix_as_markdown(fill_parameters=True)}"
+            )
+
+        return species, matrices @ a_matrix
+
+    def calculate_matrix_derivatives(
+        self,
+        dataset_model: DatasetModel,
+        indices: dict[str, int],
+        **kwargs,
+    ):
+        initial_concentration, k_matrix, species, rates, a_matrix = self.decompose_k_matrix(
+            dataset_model
+        )
+
+        global_dimension = dataset_model.get_global_dimension()
+        global_index = indices.get(global_dimension)
+        global_axis = dataset_model.get_global_axis()
+        model_axis = dataset_model.get_model_axis()
+
+        size = (model_axis.size, rates.size)
+        matrix = np.zeros(size, dtype=np.float64)
+        rate_derivatives = np.zeros(size, dtype=np.float64)
+
+        irf_derivatives = decay_matrix_derivatives_implementation(
+            matrix, rate_derivatives, rates, global_index, global_axis, model_axis, dataset_model
+        )
+
+        # chain rule through the eigen decomposition of the k matrix
+        derivatives = {
+            label: (rate_derivatives * d_rates) @ a_matrix + matrix @ d_a_matrix
+            for label, (d_rates, d_a_matrix) in k_matrix.derivatives(initial_concentration).items()
+        }
+        for label, irf_derivative in irf_derivatives.items():
+            derivatives[label] = derivatives.get(label, 0) + irf_derivative @ a_matrix
+
+        return species, derivatives
+
     def finalize_data(
         self,
         dataset_model: DatasetModel,
@@ -1,5 +1,6 @@
 """This package contains irf items."""
 
+from typing import Dict
 from typing import List
 from typing import Tuple
 
@@ -99,6 +100,42 @@ class IrfMultiGaussian:
 
         return centers, widths, scales, shift, backsweep, backsweep_period
 
+    def parameter_derivatives(
+        self, global_index: int, global_axis: np.ndarray
+    ) -> Tuple[Dict[str, np.ndarray], Dict[str, np.ndarray]]:
+        """Returns the derivatives of the centers and widths returned by
+        :meth:`IrfMultiGaussian.parameter` with respect to the parameters of the irf.
+
+        The derivatives are given as dictionaries of full parameter labels and arrays with one
+        entry per gaussian.
+        """
+        centers = self.center if isinstance(self.center, list) else [self.center]
+        widths = self.width if isinstance(self.width, list) else [self.width]
+        size = max(len(centers), len(widths))
+
+        center_derivatives = {}
+        for i, center in enumerate(centers):
+            derivative = center_derivatives.setdefault(center.full_label, np.zeros(size))
+            if len(centers) == size:
+                derivative[i] += 1
+            else:
+                derivative += 1
+
+        width_derivatives = {}
+        for i, width in enumerate(widths):
+            derivative = width_derivatives.setdefault(width.full_label, np.zeros(size))
+            if len(widths) == size:
+                derivative[i] += 1
+            else:
+                derivative += 1
+
+        if self.shift is not None:
+            shift = self.shift[global_index]
+            center_derivatives.setdefault(shift.full_label, np.zeros(size))
+            center_derivatives[shift.full_label] -= 1
+
+        return center_derivatives, width_derivatives
+
     def calculate(self, index: int, global_axis: np.ndarray, model_axis: np.ndarray) -> np.ndarray:
         centers, widths, scales, _, _, _ = self.parameter(index, global_axis)
         return sum(
@@ -187,6 +224,34 @@ class IrfSpectralMultiGaussian(IrfMultiGaussian):
 
         return centers, widths, scale, shift, backsweep, backsweep_period
 
+    def parameter_derivatives(self, global_index: int, global_axis: np.ndarray):
+        """Returns the derivatives of the centers and widths returned by
+        :meth:`IrfSpectralMultiGaussian.parameter` with respect to the parameters of the irf,
+        including the dispersion coefficients."""
+        center_derivatives, width_derivatives = super().parameter_derivatives(
+            global_index, global_axis
+        )
+        size = next(iter(center_derivatives.values())).size
+
+        index = global_axis[global_index] if global_index is not None else None
+
+        if self.dispersion_center is not None:
+            dist = (
+                (1e3 / index - 1e3 / self.dispersion_center)
+                if self.model_dispersion_with_wavenumber
+                else (index - self.dispersion_center) / 100
+            )
+
+        for i, disp in enumerate(self.center_dispersion_coefficients):
+            center_derivatives.setdefault(disp.full_label, np.zeros(size))
+            center_derivatives[disp.full_label] += np.power(dist, i + 1)
+
+        for i, disp in enumerate(self.width_dispersion_coefficients):
+            width_derivatives.setdefault(disp.full_label, np.zeros(size))
+            width_derivatives[disp.full_label] += np.power(dist, i + 1)
+
+        return center_derivatives, width_derivatives
+
     def calculate_dispersion(self, axis):
         dispersion = []
         for index, _ in enumerate(axis):
@@ -195,6 +195,32 @@ class KMatrix:
                 mat[fr_idx, fr_idx] -= param
         return mat
 
+    def full_derivative(self, compartments: list[str], parameter_label: str) -> np.ndarray:
+        """The derivative of the full representation of the KMatrix with respect to a parameter.
+
+        Parameters
+        ----------
+        compartments :
+            The compartment order.
+        parameter_label :
+            The full label of the parameter.
+        """
+        compartments = [c for c in compartments if c in self.involved_compartments()]
+        size = len(compartments)
+        mat = np.zeros((size, size), np.float64)
+        for (to_comp, from_comp), param in self.matrix.items():
+            if param.full_label != parameter_label:
+                continue
+            to_idx = compartments.index(to_comp)
+            fr_idx = compartments.index(from_comp)
+
+            if to_idx == fr_idx:
+                mat[to_idx, fr_idx] -= 1
+            else:
+                mat[to_idx, fr_idx] += 1
+                mat[fr_idx, fr_idx] -= 1
+        return mat
+
     def eigen(self, compartments: list[str]) -> tuple[np.ndarray, np.ndarray]:
         """Returns the eigenvalues and eigenvectors of the k matrix.
 
@@ -293,6 +319,91 @@ class KMatrix:
 
         return a_matrix
 
+    def derivatives(
+        self, initial_concentration: InitialConcentration
+    ) -> dict[str, tuple[np.ndarray, np.ndarray]]:
+        """The derivatives of the rates and the A matrix with respect to the parameters of the
+        KMatrix.
+
+        The derivatives are ordered like the results of
+        :meth:`KMatrix.rates` and :meth:`KMatrix.a_matrix`.
+
+        Parameters
+        ----------
+        initial_concentration :
+            The initial concentration.
+
+        Returns
+        -------
+        dict[str, tuple[np.ndarray, np.ndarray]]
+            The derivatives of the rates and the A matrix by full parameter label.
+        """
+        parameter_labels = {parameter.full_label for parameter in self.matrix.values()}
+        derivative_function = (
+            self._derivatives_unibranch
+            if self.is_unibranched(initial_concentration)
+            else self._derivatives_non_unibranch
+        )
+        return {
+            label: derivative_function(initial_concentration, label) for label in parameter_labels
+        }
+
+    def _derivatives_non_unibranch(
+        self, initial_concentration: InitialConcentration, parameter_label: str
+    ) -> tuple[np.ndarray, np.ndarray]:
+        compartments = [
+            c for c in initial_concentration.compartments if c in self.involved_compartments()
+        ]
+        eigenvalues, eigenvectors = self.eigen(compartments)
+        inverse_eigenvectors = np.linalg.inv(eigenvectors)
+        gamma = np.diag(self._gamma(eigenvectors, initial_concentration))
+
+        # first order perturbation of the eigen decomposition of the full matrix
+        perturbation = (
+            inverse_eigenvectors
+            @ self.full_derivative(compartments, parameter_label)
+            @ eigenvectors
+        )
+        rate_derivatives = np.diag(perturbation).copy()
+        eigenvalue_differences = eigenvalues[np.newaxis, :] - eigenvalues[:, np.newaxis]
+        np.fill_diagonal(eigenvalue_differences, 1)
+        coefficients = perturbation / eigenvalue_differences
+        np.fill_diagonal(coefficients, 0)
+
+        eigenvector_derivatives = eigenvectors @ coefficients
+        gamma_derivatives = -coefficients @ gamma
+        a_matrix_derivatives = (
+            eigenvector_derivatives * gamma[np.newaxis, :]
+            + eigenvectors * gamma_derivatives[np.newaxis, :]
+        )
+        return rate_derivatives, a_matrix_derivatives.T
+
+    def _derivatives_unibranch(
+        self, initial_concentration: InitialConcentration, parameter_label: str
+    ) -> tuple[np.ndarray, np.ndarray]:
+        compartments = [
+            c for c in initial_concentration.compartments if c in self.involved_compartments()
+        ]
+        rates = np.diag(self.full(compartments))
+        rate_derivatives = np.diag(self.full_derivative(compartments, parameter_label)).copy()
+
+        a_matrix_derivatives = np.zeros((rates.size, rates.size), dtype=np.float64)
+        for i, j in itertools.product(range(rates.size), range(1, rates.size)):
+            if i > j:
+                continue
+            numerator = rates[:j]
+            numerator_derivatives = rate_derivatives[:j]
+            denominator = np.asarray([rates[m] - rates[i] for m in range(j + 1) if i != m])
+            denominator_derivatives = np.asarray(
+                [rate_derivatives[m] - rate_derivatives[i] for m in range(j + 1) if i != m]
+            )
+            a_matrix_derivatives[i, j] = (
+                _product_derivative(numerator, numerator_derivatives) * np.prod(denominator)
+                - np.prod(numerator) * _product_derivative(denominator, denominator_derivatives)
+            ) / np.prod(denominator) ** 2
+
+        return rate_derivatives, a_matrix_derivatives
+
     def is_unibranched(self, initial_concentration: InitialConcentration) -> bool:
         """Returns true in the KMatrix represents an unibranched model.
 
@@ -316,3 +427,8 @@ class KMatrix:
             np.nonzero(matrix[:, i])[0].size != 1 or i != 0 and matrix[i, i - 1] == 0
             for i in range(matrix.shape[1])
         )
+
+
+def _product_derivative(values: np.ndarray, derivatives: np.ndarray) -> float:
+    """Derivative of the product of ``values`` given the derivatives of the single values."""
+    return sum(derivatives[i] * np.prod(np.delete(values, i)) for i in range(values.size))
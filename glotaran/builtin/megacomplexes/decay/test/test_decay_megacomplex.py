@@ -1,11 +1,20 @@
 from __future__ import annotations
 
+import warnings
+from dataclasses import replace
+
 import numpy as np
 import pytest
 import xarray as xr
 
 from glotaran.analysis.optimize import optimize
+from glotaran.analysis.optimize import optimize_problem
+from glotaran.analysis.problem_grouped import GroupedProblem
+from glotaran.analysis.problem_ungrouped import UngroupedProblem
 from glotaran.analysis.simulation import simulate
+from glotaran.analysis.util import calculate_index_dependent_matrices
+from glotaran.analysis.util import calculate_matrix
+from glotaran.builtin.megacomplexes.decay.k_matrix import KMatrix
 from glotaran.model import Model
 from glotaran.parameter import ParameterGroup
 from glotaran.project import Scheme
@@ -275,3 +284,234 @@ def test_kinetic_model(suite, nnls):
 
     if len(model.irf) != 0:
         assert "irf" in resultdata
+
+
+@pytest.mark.parametrize(
+    "suite",
+    [
+        OneComponentOneChannel,
+        OneComponentOneChannelGaussianIrf,
+        ThreeComponentParallel,
+        ThreeComponentSequential,
+    ],
+)
+@pytest.mark.parametrize("problem_class", [UngroupedProblem, GroupedProblem])
+def test_analytic_jacobian(suite, problem_class):
+
+    model = suite.model
+    dataset = simulate(model, "dataset1", suite.wanted_parameters, suite.axis, suite.clp)
+    scheme = Scheme(
+        model=model,
+        parameters=suite.initial_parameters,
+        data={"dataset1": dataset},
+        maximum_number_function_evaluations=20,
+        jacobian_method="Analytic",
+    )
+
+    # The residual vanishes at the wanted parameters, where the jacobian with Kaufman's
+    # approximation equals the finite difference one.
+    problem = problem_class(replace(scheme, parameters=suite.wanted_parameters))
+    free_parameter_labels, values, _, _ = problem.parameters.get_label_value_and_bounds_arrays(
+        exclude_non_vary=True
+    )
+    assert problem.supports_analytic_jacobian(free_parameter_labels)
+
+    jacobian = problem.calculate_jacobian(free_parameter_labels)
+    assert jacobian.shape == (problem.full_penalty.size, len(free_parameter_labels))
+
+    for i, label in enumerate(free_parameter_labels):
+        parameter = problem.parameters.get(label)
+        value = parameter.value
+        step = 1e-6 * max(abs(value), 1e-3)
+        penalties = []
+        for delta in [step, -step]:
+            parameter.value = value + delta
+            problem.reset()
+            penalties.append(problem.full_penalty.copy())
+        parameter.value = value
+        finite_difference = (penalties[0] - penalties[1]) / (2 * step)
+        assert np.allclose(
+            jacobian[:, i], finite_difference, atol=1e-2 * np.abs(finite_difference).max()
+        )
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        result = optimize_problem(problem_class(scheme))
+    for label, param in result.optimized_parameters.all():
+        assert np.allclose(param.value, suite.wanted_parameters.get(label).value, rtol=1e-1)
+
+
+def test_parallel_finite_difference_jacobian():
+    suite = ThreeComponentSequential
+    dataset = simulate(suite.model, "dataset1", suite.wanted_parameters, suite.axis, suite.clp)
+    scheme = Scheme(
+        model=suite.model,
+        parameters=suite.initial_parameters,
+        data={"dataset1": dataset},
+        maximum_number_function_evaluations=5,
+        jacobian_method="ParallelFiniteDifference",
+        number_of_jacobian_workers=2,
+    )
+
+    # the workers are started after the first residual has run the numba kernels
+    result = optimize(scheme, raise_exception=True)
+    serial_result = optimize(replace(scheme, jacobian_method="FiniteDifference"))
+
+    assert result.success
+    assert np.allclose(result.jacobian, serial_result.jacobian)
+
+
+def test_k_matrix_decomposition_cache(monkeypatch):
+    model = DecayModel.from_dict(
+        {
+            "initial_concentration": {
+                "j1": {"compartments": ["s1", "s2"], "parameters": ["j.1", "j.0"]},
+            },
+            "megacomplex": {
+                "mc1": {"k_matrix": ["k1"]},
+            },
+            "k_matrix": {
+                "k1": {
+                    "matrix": {
+                        ("s2", "s1"): "kinetic.1",
+                        ("s2", "s2"): "kinetic.2",
+                    }
+                }
+            },
+            "irf": {
+                "irf1": {
+                    "type": "spectral-gaussian",
+                    "center": "irf.center",
+                    "width": "irf.width",
+                    "dispersion_center": "irf.dispersion_center",
+                    "center_dispersion_coefficients": ["irf.center_dispersion"],
+                },
+            },
+            "dataset": {
+                "dataset1": {
+                    "initial_concentration": "j1",
+                    "irf": "irf1",
+                    "megacomplex": ["mc1"],
+                },
+            },
+        }
+    )
+    parameters = ParameterGroup.from_dict(
+        {
+            "kinetic": [["1", 0.5], ["2", 0.05]],
+            "irf": [
+                ["center", 1.3],
+                ["width", 7.8],
+                ["dispersion_center", 650],
+                ["center_dispersion", 0.1],
+            ],
+            "j": [
+                ["1", 1, {"vary": False, "non-negative": False}],
+                ["0", 0, {"vary": False, "non-negative": False}],
+            ],
+        }
+    )
+    axis = {"time": np.arange(-10, 50, 1.0), "pixel": np.arange(600, 750, 10)}
+    clp = _create_gaussian_clp(["s1", "s2"], [7, 30], [620, 720], [10, 50], axis["pixel"])
+    dataset = simulate(model, "dataset1", parameters, axis, clp)
+
+    a_matrix_calls = []
+    a_matrix = KMatrix.a_matrix
+
+    def counting_a_matrix(self, initial_concentration):
+        a_matrix_calls.append(initial_concentration)
+        return a_matrix(self, initial_concentration)
+
+    monkeypatch.setattr(KMatrix, "a_matrix", counting_a_matrix)
+
+    problem = UngroupedProblem(
+        Scheme(model=model, parameters=parameters, data={"dataset1": dataset})
+    )
+    problem.calculate_matrices()
+    assert problem.dataset_models["dataset1"].is_index_dependent()
+    assert len(problem.matrices["dataset1"]) == axis["pixel"].size
+    # the k matrix is decomposed once instead of once per index
+    assert len(a_matrix_calls) == 1
+
+    problem.parameters.get("kinetic.1").value = 0.6
+    problem.reset()
+    problem.calculate_matrices()
+    assert len(a_matrix_calls) == 2
+
+
+@pytest.mark.parametrize("irf", [None, "irf1"])
+def test_index_dependent_matrices(irf):
+    model_dict = {
+        "initial_concentration": {
+            "j1": {"compartments": ["s1", "s2"], "parameters": ["j.1", "j.0"]},
+        },
+        "megacomplex": {
+            "mc1": {"k_matrix": ["k1"]},
+            "mc2": {"k_matrix": ["k2"]},
+        },
+        "k_matrix": {
+            "k1": {"matrix": {("s2", "s1"): "kinetic.1", ("s2", "s2"): "kinetic.2"}},
+            "k2": {"matrix": {("s1", "s1"): "kinetic.2"}},
+        },
+        "irf": {
+            "irf1": {
+                "type": "spectral-multi-gaussian",
+                "center": ["irf.center1", "irf.center2"],
+                "width": ["irf.width1", "irf.width2"],
+                "scale": ["irf.scale1", "irf.scale2"],
+                "dispersion_center": "irf.dispersion_center",
+                "center_dispersion_coefficients": ["irf.center_dispersion"],
+                "width_dispersion_coefficients": ["irf.width_dispersion"],
+                "backsweep": True,
+                "backsweep_period": "irf.backsweep",
+            },
+        },
+        "dataset": {
+            "dataset1": {
+                "initial_concentration": "j1",
+                "irf": irf,
+                "megacomplex": ["mc1", "mc2"],
+                "megacomplex_scale": ["scale.1", "scale.2"],
+            },
+        },
+    }
+    if irf is None:
+        del model_dict["dataset"]["dataset1"]["irf"]
+    model = DecayModel.from_dict(model_dict)
+    parameters = ParameterGroup.from_dict(
+        {
+            "kinetic": [["1", 0.5], ["2", 0.05]],
+            "irf": [
+                ["center1", 1.3],
+                ["center2", 4.1],
+                ["width1", 7.8],
+                ["width2", 2.1],
+                ["scale1", 0.4],
+                ["scale2", 0.6],
+                ["dispersion_center", 650],
+                ["center_dispersion", 0.1],
+                ["width_dispersion", 0.01],
+                ["backsweep", 100],
+            ],
+            "j": [
+                ["1", 1, {"vary": False, "non-negative": False}],
+                ["0", 0, {"vary": False, "non-negative": False}],
+            ],
+            "scale": [["1", 1.2], ["2", 0.3]],
+        }
+    )
+    axis = {"time": np.arange(-10, 50, 1.0), "pixel": np.arange(600, 750, 10)}
+    clp = _create_gaussian_clp(["s1", "s2"], [7, 30], [620, 720], [10, 50], axis["pixel"])
+    dataset = simulate(model, "dataset1", parameters, axis, clp)
+
+    problem = UngroupedProblem(
+        Scheme(model=model, parameters=parameters, data={"dataset1": dataset})
+    )
+    dataset_model = problem.dataset_models["dataset1"]
+    matrices = calculate_index_dependent_matrices(dataset_model)
+
+    assert len(matrices) == axis["pixel"].size
+    for i, matrix in enumerate(matrices):
+        expected = calculate_matrix(dataset_model, {"pixel": i})
+        assert matrix.clp_labels == expected.clp_labels
+        assert np.allclose(matrix.matrix, expected.matrix)
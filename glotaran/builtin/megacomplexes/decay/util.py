@@ -51,6 +51,112 @@ def decay_matrix_implementation(
         calculate_decay_matrix_no_irf(matrix, rates, model_axis)
 
 
+def decay_matrices_implementation(
+    matrices: np.ndarray,
+    rates: np.ndarray,
+    global_axis: np.ndarray,
+    model_axis: np.ndarray,
+    dataset_model: DatasetModel,
+):
+    """Calculates the decay matrices for all global indices and adds them to ``matrices``
+    with the shape ``(global, time, rates)``."""
+    if isinstance(dataset_model.irf, IrfMultiGaussian):
+
+        parameters = [
+            dataset_model.irf.parameter(global_index, global_axis)
+            for global_index in range(global_axis.size)
+        ]
+        _, _, irf_scales, _, backsweep, backsweep_period = parameters[0]
+        centers = np.asarray(
+            [np.asarray(centers) - shift for centers, _, _, shift, _, _ in parameters],
+            dtype=np.float64,
+        )
+        widths = np.asarray([widths for _, widths, _, _, _, _ in parameters], dtype=np.float64)
+
+        calculate_decay_matrices_gaussian_irf(
+            matrices,
+            rates,
+            model_axis,
+            centers,
+            widths,
+            np.asarray(irf_scales, dtype=np.float64),
+            backsweep,
+            backsweep_period,
+        )
+        if dataset_model.irf.normalize:
+            matrices /= np.sum(irf_scales[-1])
+
+    else:
+        matrix = np.zeros(matrices.shape[1:], dtype=np.float64)
+        calculate_decay_matrix_no_irf(matrix, rates, model_axis)
+        matrices += matrix
+
+
+def decay_matrix_derivatives_implementation(
+    matrix: np.ndarray,
+    rate_derivatives: np.ndarray,
+    rates: np.ndarray,
+    global_index: int,
+    global_axis: np.ndarray,
+    model_axis: np.ndarray,
+    dataset_model: DatasetModel,
+) -> dict[str, np.ndarray]:
+    """Calculates the decay matrix and its derivatives.
+
+    The decay matrix and its derivatives with respect to the rates are added to ``matrix`` and
+    ``rate_derivatives``. The derivatives with respect to the irf parameters are returned by full
+    parameter label.
+    """
+    irf_derivatives = {}
+    if isinstance(dataset_model.irf, IrfMultiGaussian):
+
+        (
+            centers,
+            widths,
+            irf_scales,
+            shift,
+            backsweep,
+            backsweep_period,
+        ) = dataset_model.irf.parameter(global_index, global_axis)
+        if backsweep:
+            raise NotImplementedError("Derivatives with backsweep are not supported.")
+        center_derivatives, width_derivatives = dataset_model.irf.parameter_derivatives(
+            global_index, global_axis
+        )
+
+        for i, (center, width, irf_scale) in enumerate(zip(centers, widths, irf_scales)):
+            center_derivative = np.zeros_like(matrix)
+            width_derivative = np.zeros_like(matrix)
+            calculate_decay_matrix_gaussian_irf_derivatives(
+                matrix,
+                rate_derivatives,
+                center_derivative,
+                width_derivative,
+                rates,
+                model_axis,
+                center - shift,
+                width,
+                irf_scale,
+            )
+            for label, derivative in center_derivatives.items():
+                irf_derivatives.setdefault(label, np.zeros_like(matrix))
+                irf_derivatives[label] += derivative[i] * center_derivative
+            for label, derivative in width_derivatives.items():
+                irf_derivatives.setdefault(label, np.zeros_like(matrix))
+                irf_derivatives[label] += derivative[i] * width_derivative
+        if dataset_model.irf.normalize:
+            matrix /= np.sum(irf_scale)
+            rate_derivatives /= np.sum(irf_scale)
+            for derivative in irf_derivatives.values():
+                derivative /= np.sum(irf_scale)
+
+    else:
+        calculate_decay_matrix_no_irf(matrix, rates, model_axis)
+        rate_derivatives += matrix * model_axis[:, np.newaxis]
+
+    return irf_derivatives
+
+
 @nb.jit(nopython=True, parallel=True)
 def calculate_decay_matrix_no_irf(matrix, rates, times):
     for n_r in nb.prange(rates.size):
@@ -61,6 +167,7 @@ def calculate_decay_matrix_no_irf(matrix, rates, times):
 
 
 sqrt2 = np.sqrt(2)
+sqrt2pi = np.sqrt(2 * np.pi)
 
 
 @nb.jit(nopython=True, parallel=True)
@@ -68,25 +175,92 @@ def calculate_decay_matrix_gaussian_irf(
     matrix, rates, times, center, width, scale, backsweep, backsweep_period
 ):
     """Calculates a decay matrix with a gaussian irf."""
+    for n_r in nb.prange(rates.size):
+        for n_t in nb.prange(times.size):
+            matrix[n_t, n_r] += decay_gaussian_irf(
+                rates[n_r], times[n_t], center, width, scale, backsweep, backsweep_period
+            )
+
+
+@nb.jit(nopython=True, parallel=True)
+def calculate_decay_matrices_gaussian_irf(
+    matrices, rates, times, centers, widths, scales, backsweep, backsweep_period
+):
+    """Calculates the decay matrices with gaussian irfs for all global indices at once.
+
+    The ``matrices`` have the shape ``(global, time, rates)``, the ``centers`` and ``widths``
+    the shape ``(global, gaussians)`` and the ``scales`` the shape ``(gaussians,)``.
+    """
+    for n_g in nb.prange(matrices.shape[0]):
+        for n_r in range(rates.size):
+            for n_t in range(times.size):
+                for n_i in range(scales.size):
+                    matrices[n_g, n_t, n_r] += decay_gaussian_irf(
+                        rates[n_r],
+                        times[n_t],
+                        centers[n_g, n_i],
+                        widths[n_g, n_i],
+                        scales[n_i],
+                        backsweep,
+                        backsweep_period,
+                    )
+
+
+@nb.jit(nopython=True)
+def decay_gaussian_irf(rate, time, center, width, scale, backsweep, backsweep_period):
+    """Calculates the value of a decay convolved with a gaussian irf at a point in time."""
+    r_n = -rate
+    alpha = (r_n * width) / sqrt2
+    beta = (time - center) / (width * sqrt2)
+    thresh = beta - alpha
+    if thresh < -1:
+        value = scale * 0.5 * erfcx(-thresh) * np.exp(-beta * beta)
+    else:
+        value = scale * 0.5 * (1 + erf(thresh)) * np.exp(alpha * (alpha - 2 * beta))
+    if backsweep and abs(r_n) * backsweep_period > 0.001:
+        x1 = np.exp(-r_n * (time - center + backsweep_period))
+        x2 = np.exp(-r_n * ((backsweep_period / 2) - (time - center)))
+        x3 = np.exp(-r_n * backsweep_period)
+        value += scale * (x1 + x2) / (1 - x3)
+    return value
+
+
+@nb.jit(nopython=True, parallel=True)
+def calculate_decay_matrix_gaussian_irf_derivatives(
+    matrix,
+    rate_derivatives,
+    center_derivatives,
+    width_derivatives,
+    rates,
+    times,
+    center,
+    width,
+    scale,
+):
+    """Calculates a decay matrix with a gaussian irf and its derivatives with respect to the
+    rates, the irf center and the irf width."""
     for n_r in nb.prange(rates.size):
         r_n = -rates[n_r]
-        backsweep_valid = abs(r_n) * backsweep_period > 0.001
         alpha = (r_n * width) / sqrt2
         for n_t in nb.prange(times.size):
             t_n = times[n_t]
             beta = (t_n - center) / (width * sqrt2)
             thresh = beta - alpha
             if thresh < -1:
-                matrix[n_t, n_r] += scale * 0.5 * erfcx(-thresh) * np.exp(-beta * beta)
+                value = scale * 0.5 * erfcx(-thresh) * np.exp(-beta * beta)
             else:
-                matrix[n_t, n_r] += (
-                    scale * 0.5 * (1 + erf(thresh)) * np.exp(alpha * (alpha - 2 * beta))
-                )
-            if backsweep and backsweep_valid:
-                x1 = np.exp(-r_n * (t_n - center + backsweep_period))
-                x2 = np.exp(-r_n * ((backsweep_period / 2) - (t_n - center)))
-                x3 = np.exp(-r_n * backsweep_period)
-                matrix[n_t, n_r] += scale * (x1 + x2) / (1 - x3)
+                value = scale * 0.5 * (1 + erf(thresh)) * np.exp(alpha * (alpha - 2 * beta))
+            matrix[n_t, n_r] += value
+
+            shifted_time = t_n - center
+            gaussian = scale * np.exp(-beta * beta) / sqrt2pi
+            rate_derivatives[n_t, n_r] -= (
+                r_n * width * width - shifted_time
+            ) * value - width * gaussian
+            center_derivatives[n_t, n_r] += r_n * value - gaussian / width
+            width_derivatives[n_t, n_r] += r_n * r_n * width * value - gaussian * (
+                r_n + shifted_time / (width * width)
+            )
 
 
 import ctypes  # noqa: E402
@@ -125,11 +125,38 @@ class DatasetModel:
 
     def set_data(self, dataset: xr.Dataset) -> DatasetModel:
         """Sets the dataset model's data."""
-        self._coords = {name: dim.values for name, dim in dataset.coords.items()}
-        self._data: np.ndarray = dataset.data.values
-        self._weight: np.ndarray | None = dataset.weight.values if "weight" in dataset else None
-        if self._weight is not None:
-            self._data = self._data * self._weight
+        coords = {name: dim.values for name, dim in dataset.coords.items()}
+        data = dataset.data.values
+        weight = dataset.weight.values if "weight" in dataset else None
+        if weight is not None:
+            data = data * weight
+        return self.bind_data(data, weight, coords)
+
+    def bind_data(
+        self,
+        data: np.ndarray,
+        weight: np.ndarray | None,
+        coords: dict[Hashable, np.ndarray],
+    ) -> DatasetModel:
+        """Binds already prepared data arrays to the dataset model without copying them.
+
+        Parameters
+        ----------
+        data : np.ndarray
+            The data, already multiplied with the weight.
+        weight : np.ndarray | None
+            The weight.
+        coords : dict[Hashable, np.ndarray]
+            The coordinates of the data.
+
+        Returns
+        -------
+        DatasetModel
+            The dataset model itself.
+        """
+        self._coords = coords
+        self._data: np.ndarray = data
+        self._weight: np.ndarray | None = weight
         return self
 
     def get_data(self) -> np.ndarray:
@@ -124,6 +124,12 @@ def model_item(
         fill = _create_fill_func(cls)
         setattr(cls, "fill", fill)
 
+        get_parameter_labels = _create_get_parameter_labels_func(cls)
+        setattr(cls, "get_parameter_labels", get_parameter_labels)
+
+        get_parameters = _create_get_parameters_func(cls)
+        setattr(cls, "get_parameters", get_parameters)
+
         mprint = _create_mprint_func(cls)
         setattr(cls, "mprint", mprint)
 
@@ -304,6 +310,46 @@ def _create_fill_func(cls):
     return fill
 
 
+def _create_get_parameter_labels_func(cls):
+    @wrap_func_as_method(cls)
+    def get_parameter_labels(self, model: Model) -> set[str]:
+        """Returns the full labels of all parameters the item depends on, including the
+        parameters of the model items it references.
+
+        Parameters
+        ----------
+        model :
+            A glotaran model.
+        """
+        labels = set()
+        for name in self._glotaran_properties:
+            prop = getattr(self.__class__, name)
+            value = getattr(self, name)
+            labels |= prop.get_parameter_labels(value, model)
+        return labels
+
+    return get_parameter_labels
+
+
+def _create_get_parameters_func(cls):
+    @wrap_func_as_method(cls)
+    def get_parameters(self) -> list[Parameter]:
+        """Returns all parameters of a filled item, including the parameters of the filled
+        model items it contains.
+
+        The parameters are the instances the item was filled with, so updating their values
+        updates the item without filling it again.
+        """
+        parameters = []
+        for name in self._glotaran_properties:
+            prop = getattr(self.__class__, name)
+            value = getattr(self, name)
+            parameters += prop.get_parameters(value)
+        return parameters
+
+    return get_parameters
+
+
 def _create_get_state_func(cls):
     @wrap_func_as_method(cls)
     def get_state(self) -> cls:
@@ -4,6 +4,7 @@ from typing import TYPE_CHECKING
 from typing import Dict
 from typing import List
 
+import numpy as np
 import xarray as xr
 from typing_inspect import get_args
 from typing_inspect import is_generic_type
@@ -116,6 +117,41 @@ class Megacomplex:
     def index_dependent(self, dataset_model: DatasetModel) -> bool:
         raise NotImplementedError
 
+    def calculate_matrix_derivatives(
+        self,
+        dataset_model: DatasetModel,
+        indices: dict[str, int],
+        **kwargs,
+    ) -> tuple[list[str], dict[str, np.ndarray]]:
+        """Calculates the derivatives of the matrix with respect to the parameters.
+
+        Subclasses can overwrite this method to support the calculation of an analytic jacobian.
+
+        Returns
+        -------
+        tuple[list[str], dict[str, np.ndarray]]
+            The clp labels and the derivatives of the matrix by full parameter label.
+        """
+        raise NotImplementedError
+
+    def calculate_index_dependent_matrices(
+        self,
+        dataset_model: DatasetModel,
+        **kwargs,
+    ) -> tuple[list[str], np.ndarray]:
+        """Calculates the matrices for all indices of the global axis at once.
+
+        Subclasses can overwrite this method to calculate index dependent matrices in a single
+        vectorized call instead of calling
+        :meth:`glotaran.model.Megacomplex.calculate_matrix` for each index.
+
+        Returns
+        -------
+        tuple[list[str], np.ndarray]
+            The clp labels and the matrices with the shape ``(global, model, clp)``.
+        """
+        raise NotImplementedError
+
     def finalize_data(
         self,
         dataset_model: DatasetModel,
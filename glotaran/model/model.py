@@ -50,6 +50,7 @@ class Model:
         self._default_megacomplex_type = default_megacomplex_type or next(iter(megacomplex_types))
 
         self._model_items = {}
+        self._model_dict = None
         self._dataset_properties = {}
         self._add_default_items_and_properties()
         self._add_megacomplexe_types()
@@ -90,24 +91,96 @@ class Model:
         model = cls(
             megacomplex_types=megacomplex_types, default_megacomplex_type=default_megacomplex_type
         )
+        model._add_items_from_dict(model_dict)
+
+        return model
+
+    def _add_items_from_dict(self, model_dict: dict[str, Any]):
+
+        # keep a copy of the dictionary to be able to pickle the model
+        self._model_dict = copy.deepcopy(model_dict)
 
         model_dict_local = copy.deepcopy(model_dict)  # TODO: maybe redundant?
 
         # iterate over items
         for name, items in list(model_dict_local.items()):
 
-            if name not in model._model_items:
+            if name not in self._model_items:
                 warn(f"Unknown model item type '{name}'.")
                 continue
 
-            is_list = isinstance(getattr(model, name), list)
+            is_list = isinstance(getattr(self, name), list)
 
             if is_list:
-                model._add_list_items(name, items)
+                self._add_list_items(name, items)
             else:
-                model._add_dict_items(name, items)
+                self._add_dict_items(name, items)
 
-        return model
+    def __reduce__(self):
+        """Pickles the model by the dictionary it was created from and the state of its items.
+
+        The classes of the model items are created at runtime and can not be pickled directly.
+        The items are created again from the dictionary, after which their current state is
+        restored, so that changes to the items after the creation of the model are preserved.
+
+        Raises
+        ------
+        TypeError
+            If the model was not created with ``from_dict`` or items were added or removed
+            after its creation.
+        """
+        if self._model_dict is None:
+            raise TypeError("Only models created with 'from_dict' can be pickled.")
+        return (
+            _unpickle_model,
+            (
+                self.__class__,
+                self._megacomplex_types,
+                self._default_megacomplex_type,
+                self._model_dict,
+                self._get_item_states(),
+            ),
+        )
+
+    def _get_item_states(self) -> dict[str, dict[str, tuple] | list[tuple]]:
+        """Returns the states of the model items, like they are stored on the model."""
+        states = {}
+        for name in self._model_items:
+            items = getattr(self, name)
+            created_items = self._model_dict.get(name, [] if isinstance(items, list) else {})
+            if isinstance(items, list):
+                if len(items) != len(created_items):
+                    raise TypeError(
+                        f"Model items of type '{name}' were added or removed after the creation "
+                        "of the model, it can not be pickled."
+                    )
+                states[name] = [item.__getstate__() for item in items]
+            else:
+                if set(items) != set(created_items):
+                    raise TypeError(
+                        f"Model items of type '{name}' were added or removed after the creation "
+                        "of the model, it can not be pickled."
+                    )
+                states[name] = {label: item.__getstate__() for label, item in items.items()}
+        return states
+
+    def _set_item_states(self, states: dict[str, dict[str, tuple] | list[tuple]]):
+        """Restores the states of the model items returned by :meth:`_get_item_states`."""
+        for name, item_states in states.items():
+            items = getattr(self, name)
+            labels = item_states.keys() if isinstance(item_states, dict) else range(len(items))
+            for label in labels:
+                item = items[label]
+                state = item_states[label]
+                if len(state) != len(item._glotaran_properties) or (
+                    "type" in item._glotaran_properties
+                    and state[item._glotaran_properties.index("type")] != item.type
+                ):
+                    raise TypeError(
+                        f"The model item '{name}'['{label}'] was replaced by an item of another "
+                        "type after the creation of the model, it can not be unpickled."
+                    )
+                item.__setstate__(state)
 
     def _add_dict_items(self, name: str, items: dict):
 
@@ -363,3 +436,18 @@ class Model:
 
     def __str__(self):
         return str(self.markdown())
+
+
+def _unpickle_model(
+    cls: type[Model],
+    megacomplex_types: dict[str, type[Megacomplex]],
+    default_megacomplex_type: str,
+    model_dict: dict[str, Any],
+    item_states: dict[str, dict[str, tuple] | list[tuple]],
+) -> Model:
+    model = cls(
+        megacomplex_types=megacomplex_types, default_megacomplex_type=default_megacomplex_type
+    )
+    model._add_items_from_dict(model_dict)
+    model._set_item_states(item_states)
+    return model
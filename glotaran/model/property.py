@@ -119,6 +119,75 @@ class ModelProperty(property):
 
         return value
 
+    def get_parameter_labels(self, value, model) -> typing.Set[str]:
+        """Returns the full labels of all parameters referenced by the value.
+
+        Model items referenced by label are resolved with the model and searched recursively.
+        """
+
+        if value is None:
+            return set()
+
+        if self._is_parameter:
+
+            if self._is_parameter_value:
+                return {value.full_label}
+
+            elif self._is_parameter_list:
+                return {v.full_label for v in value}
+
+            elif self._is_parameter_dict:
+                return {v.full_label for v in value.values()}
+
+        elif hasattr(model, self._name):
+            items = getattr(model, self._name)
+            if isinstance(value, list):
+                values = value
+            elif isinstance(value, dict):
+                values = list(value.values())
+            elif not isinstance(value, bool):
+                values = [value]
+            else:
+                values = []
+            labels = set()
+            for v in values:
+                item = items[v] if isinstance(v, str) else v
+                labels |= item.get_parameter_labels(model)
+            return labels
+
+        return set()
+
+    def get_parameters(self, value) -> typing.List[Parameter]:
+        """Returns the parameters of a filled value, including the parameters of the filled
+        model items it contains."""
+
+        if value is None:
+            return []
+
+        if self._is_parameter:
+
+            if self._is_parameter_value:
+                return [value]
+
+            elif self._is_parameter_list:
+                return list(value)
+
+            elif self._is_parameter_dict:
+                return list(value.values())
+
+        if isinstance(value, list):
+            values = value
+        elif isinstance(value, dict):
+            values = list(value.values())
+        else:
+            values = [value]
+        return [
+            parameter
+            for v in values
+            if hasattr(v, "get_parameters")
+            for parameter in v.get_parameters()
+        ]
+
     def _determine_if_parameter(self, type):
         self._is_parameter_value = type is Parameter
         self._is_parameter_list = (
@@ -1,3 +1,4 @@
+import pickle
 from math import inf
 from math import nan
 from typing import Dict
@@ -375,6 +376,27 @@ def test_model_ipython_rendering(test_model: Model):
     assert rendered_markdown_return["text/markdown"].startswith("# Model")
 
 
+def test_model_pickle(test_model: Model):
+    pickled_model = pickle.loads(pickle.dumps(test_model))
+
+    assert pickled_model.markdown() == test_model.markdown()
+    assert pickled_model.megacomplex_types == test_model.megacomplex_types
+
+
+def test_model_pickle_changed_items(test_model: Model):
+    test_model.megacomplex["m1"].test_item1 = "t1"
+    test_model.weights[0].value = 1.5
+    pickled_model = pickle.loads(pickle.dumps(test_model))
+
+    assert pickled_model.megacomplex["m1"].test_item1 == "t1"
+    assert pickled_model.weights[0].value == 1.5
+    assert pickled_model.markdown() == test_model.markdown()
+
+    test_model.test_item1["t3"] = test_model.test_item1["t1"]
+    with pytest.raises(TypeError, match="were added or removed"):
+        pickle.dumps(test_model)
+
+
 def test_interval_property():
     ip1 = IntervalProperty.from_dict({"interval": [[1, 1000]]})
     assert all(ip1.applies(x) for x in (1, 500, 100))
@@ -1,5 +1,7 @@
 from glotaran.parameter import parameter
 from glotaran.parameter import parameter_group
+from glotaran.parameter import parameter_history
 
 Parameter = parameter.Parameter
 ParameterGroup = parameter_group.ParameterGroup
+ParameterHistory = parameter_history.ParameterHistory
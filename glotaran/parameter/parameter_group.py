@@ -2,8 +2,10 @@
 
 from __future__ import annotations
 
+import re
 from copy import copy
 from textwrap import indent
+from typing import Any
 from typing import Generator
 
 import asteval
@@ -37,6 +39,10 @@ class ParameterGroup(dict):
         self._label = label
         self._parameters = {}
         self._root_group = root_group
+        # Flat lookup of all parameters in the group and its subgroups by their relative label.
+        self._parameter_index = None
+        self._optimization_parameters = None
+        self._compiled_expressions = None
         self._evaluator = (
             asteval.Interpreter(symtable=asteval.make_symbol_table(group=self))
             if root_group is None
@@ -226,6 +232,7 @@ class ParameterGroup(dict):
                 p.label = f"{p.index}"
             p.full_label = f"{self.label}.{p.label}" if self.label else p.label
             self._parameters[p.label] = p
+        self._invalidate_parameter_index()
 
     def add_group(self, group: ParameterGroup):
         """Adds a :class:`ParameterGroup` to the group.
@@ -239,6 +246,30 @@ class ParameterGroup(dict):
             raise TypeError("Group must be glotaran.parameter.ParameterGroup")
         self[group.label] = group
 
+    def __setitem__(self, label: str, group: ParameterGroup):
+        super().__setitem__(label, group)
+        self._invalidate_parameter_index()
+
+    def __delitem__(self, label: str):
+        super().__delitem__(label)
+        self._invalidate_parameter_index()
+
+    def _invalidate_parameter_index(self):
+        """Invalidates the parameter index of the group and all groups containing it."""
+        group = self
+        while group is not None:
+            group._parameter_index = None
+            group._optimization_parameters = None
+            group._compiled_expressions = None
+            # unpickling sets the items before the state
+            group = getattr(group, "_root_group", None)
+
+    def _get_parameter_index(self) -> dict[str, Parameter]:
+        """Returns the parameters of the group and its subgroups by their relative label."""
+        if self._parameter_index is None:
+            self._parameter_index = dict(self.all())
+        return self._parameter_index
+
     def get_nr_roots(self) -> int:
         """Returns the number of roots of the group."""
         n = 0
@@ -280,6 +311,10 @@ class ParameterGroup(dict):
         # sometimes the spec parser delivers the labels as int
         label = str(label)
 
+        parameter = self._get_parameter_index().get(label)
+        if parameter is not None:
+            return parameter
+
         path = label.split(".")
         label = path.pop()
 
@@ -302,7 +337,9 @@ class ParameterGroup(dict):
             root._parameters[label] = copy(parameter)
 
         for label, group in self.items():
-            root[label] = group.copy()
+            group = group.copy()
+            group._root_group = root
+            root[label] = group
 
         return root
 
@@ -344,7 +381,7 @@ class ParameterGroup(dict):
         lower_bounds = []
         upper_bounds = []
 
-        for label, parameter in self.all():
+        for label, parameter in self._get_parameter_index().items():
             if not exclude_non_vary or parameter.vary:
                 labels.append(label)
                 value, minimum, maximum = parameter.get_value_and_bounds_for_optimization()
@@ -362,22 +399,101 @@ class ParameterGroup(dict):
                 f"Length of labels({len(labels)}) not equal to length of values({len(values)})."
             )
 
-        for label, value in zip(labels, values):
-            self.get(label).set_value_from_optimization(value)
+        # The parameters are resolved once for the labels the optimizer passes on every call.
+        if self._optimization_parameters is None or self._optimization_parameters[0] is not labels:
+            self._optimization_parameters = (labels, [self.get(label) for label in labels])
+        for parameter, value in zip(self._optimization_parameters[1], values):
+            parameter.set_value_from_optimization(value)
 
         self.update_parameter_expression()
 
     def update_parameter_expression(self):
-        """Updates all parameters which have an expression."""
-        for label, parameter in self.all():
-            if parameter.expression is not None:
-                value = self._evaluator(parameter.transformed_expression)
-                if not isinstance(value, (int, float)):
-                    raise ValueError(
-                        f"Expression '{parameter.expression}' of parameter '{label}' evaluates to"
-                        f"non numeric value '{value}'."
-                    )
-                parameter.value = value
+        """Updates all parameters which have an expression.
+
+        The expressions are compiled once and evaluated in the order of their dependencies.
+        """
+        symtable = self._evaluator.symtable
+        for label, parameter, compiled_expression, references in self._get_compiled_expressions():
+            for symbol, reference in references:
+                symtable[symbol] = reference.value
+            value = self._evaluator.run(compiled_expression)
+            if not isinstance(value, (int, float)):
+                raise ValueError(
+                    f"Expression '{parameter.expression}' of parameter '{label}' evaluates to"
+                    f"non numeric value '{value}'."
+                )
+            parameter.value = value
+
+    def _get_compiled_expressions(
+        self,
+    ) -> list[tuple[str, Parameter, Any, list[tuple[str, Parameter]]]]:
+        """Returns the compiled expressions of the group sorted by their dependencies.
+
+        Each entry holds the label and the parameter with the expression, the parsed expression
+        and the symbols of the parameters it references. The expressions are compiled again if
+        any expression changed.
+        """
+        expression_parameters = {
+            label: parameter
+            for label, parameter in self._get_parameter_index().items()
+            if parameter.expression is not None
+        }
+        signature = [(id(p), p.expression) for p in expression_parameters.values()]
+        if self._compiled_expressions is not None and self._compiled_expressions[0] == signature:
+            return self._compiled_expressions[1]
+
+        symbols = {}
+
+        def substitute(match: re.Match) -> str:
+            label = match.group(0)[1:]
+            if label not in symbols:
+                symbols[label] = f"_parameter_{len(symbols)}"
+            return symbols[label]
+
+        labels_by_id = {id(p): label for label, p in expression_parameters.items()}
+        compiled = {}
+        dependencies = {}
+        for label, parameter in expression_parameters.items():
+            expression = Parameter._find_parameter.sub(substitute, parameter.expression)
+            references = [
+                (symbols[reference], self.get(reference))
+                for reference in {
+                    match[1:] for match in Parameter._find_parameter.findall(parameter.expression)
+                }
+            ]
+            try:
+                compiled_expression = self._evaluator.parse(expression)
+            except Exception:
+                # evaluates to None and is reported as non numeric value
+                compiled_expression = None
+            compiled[label] = (label, parameter, compiled_expression, references)
+            dependencies[label] = [
+                labels_by_id[id(reference)]
+                for _, reference in references
+                if id(reference) in labels_by_id
+            ]
+
+        ordered = []
+        visited = set()
+        visiting = set()
+
+        def visit(label: str):
+            if label in visiting:
+                raise ValueError(f"Cyclic dependency in the expression of parameter '{label}'.")
+            if label in visited:
+                return
+            visiting.add(label)
+            for dependency in dependencies[label]:
+                visit(dependency)
+            visiting.remove(label)
+            visited.add(label)
+            ordered.append(compiled[label])
+
+        for label in compiled:
+            visit(label)
+
+        self._compiled_expressions = (signature, ordered)
+        return ordered
 
     def markdown(self) -> MarkdownStr:
         """Formats the :class:`ParameterGroup` as markdown string.
@@ -427,6 +543,19 @@ class ParameterGroup(dict):
         """Special method used by ``ipython`` to render markdown."""
         return str(self.markdown())
 
+    def __getstate__(self):
+        """Returns the state for pickling without the expression evaluator."""
+        state = self.__dict__.copy()
+        state["_evaluator"] = None
+        state["_compiled_expressions"] = None
+        return state
+
+    def __setstate__(self, state):
+        """Restores the state after unpickling and recreates the expression evaluator."""
+        self.__dict__.update(state)
+        if self._root_group is None:
+            self._evaluator = asteval.Interpreter(symtable=asteval.make_symbol_table(group=self))
+
     def __repr__(self):
         """Representation used by repl and tracebacks."""
         if self.label is None:
@@ -0,0 +1,331 @@
+"""The parameter history class."""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+import numpy as np
+import xarray as xr
+
+if TYPE_CHECKING:
+    from typing import BinaryIO
+
+    from glotaran.parameter.parameter_group import ParameterGroup
+
+
+class ParameterHistory:
+    """A history of the values of the free parameters and the cost of an optimization.
+
+    The records are stored as rows of a two dimensional array, which grows as needed. Which
+    records are kept is controlled by a retention policy: only every ``keep_every``-th record is
+    recorded at all, and of those only the last ``keep_last`` are kept in memory.
+
+    For long runs the records can additionally be streamed to a ``.npy`` or ``.nc`` file. The
+    file contains all recorded rows, regardless of ``keep_last``.
+    """
+
+    def __init__(
+        self,
+        labels: list[str],
+        keep_last: int | None = None,
+        keep_every: int = 1,
+        spill_path: str | None = None,
+    ):
+        """
+
+        Parameters
+        ----------
+        labels : list[str]
+            The labels of the recorded parameters.
+        keep_last : int | None
+            The number of records to keep in memory, all if ``None``.
+        keep_every : int
+            Only every ``keep_every``-th call of :meth:`append` is recorded.
+        spill_path : str | None
+            The path of a ``.npy`` or ``.nc`` file the records are streamed to. The rows of the
+            ``.npy`` file are the number of the record, the cost and the parameter values.
+
+        Raises
+        ------
+        ValueError
+            If ``keep_last`` or ``keep_every`` is smaller than one or the spill file has an
+            unsupported format.
+        """
+        if keep_last is not None and keep_last < 1:
+            raise ValueError(f"'keep_last' must be at least 1, got {keep_last}.")
+        if keep_every < 1:
+            raise ValueError(f"'keep_every' must be at least 1, got {keep_every}.")
+        self._labels = list(labels)
+        self._keep_last = keep_last
+        self._keep_every = keep_every
+        self._number_of_records = 0
+        # The parameter instances of the labels, resolved once per parameter group.
+        self._parameters = None
+
+        # The columns are the number of the record, the cost and the parameter values.
+        # The retained rows are ``_rows[_start:_end]``.
+        capacity = 64 if keep_last is None else 2 * keep_last
+        self._rows = np.empty((capacity, len(self._labels) + 2))
+        self._start = 0
+        self._end = 0
+
+        self._spill = None
+        # A row without cost is spilled once its cost is set or the next row is appended.
+        self._pending_row = None
+        if spill_path is not None:
+            if spill_path.endswith(".npy"):
+                self._spill = _NpySpill(spill_path, self._rows.shape[1])
+            elif spill_path.endswith(".nc"):
+                self._spill = _NetCDFSpill(spill_path, self._labels)
+            else:
+                raise ValueError(
+                    f"Unsupported file format of spill path '{spill_path}', "
+                    "supported formats are '.npy' and '.nc'."
+                )
+
+    @classmethod
+    def from_parameters(cls, parameters: ParameterGroup, **kwargs) -> ParameterHistory:
+        """Creates a history for the free parameters of a :class:`ParameterGroup`.
+
+        Parameters
+        ----------
+        parameters : ParameterGroup
+            The parameters.
+        **kwargs
+            The retention policy, see :class:`ParameterHistory`.
+
+        Returns
+        -------
+        ParameterHistory
+            The history.
+        """
+        labels = parameters.get_label_value_and_bounds_arrays(exclude_non_vary=True)[0]
+        return cls(labels, **kwargs)
+
+    @property
+    def labels(self) -> list[str]:
+        """The labels of the recorded parameters."""
+        return self._labels
+
+    @property
+    def number_of_records(self) -> int:
+        """The number of calls of :meth:`append`, including those not kept."""
+        return self._number_of_records
+
+    @property
+    def record_numbers(self) -> np.ndarray:
+        """The number of each kept record, i.e. the index of the call of :meth:`append`."""
+        return self._rows[self._start : self._end, 0].astype(int)
+
+    @property
+    def costs(self) -> np.ndarray:
+        """The cost of each kept record, ``nan`` if it is not known."""
+        return self._rows[self._start : self._end, 1]
+
+    @property
+    def values(self) -> np.ndarray:
+        """The parameter values of the kept records, one row per record."""
+        return self._rows[self._start : self._end, 2:]
+
+    def __len__(self) -> int:
+        """The number of kept records."""
+        return self._end - self._start
+
+    def append(self, values: np.ndarray, cost: float = np.nan):
+        """Records parameter values, if the retention policy keeps them.
+
+        Parameters
+        ----------
+        values : np.ndarray
+            The values of the parameters, in the order of :attr:`labels`.
+        cost : float
+            The cost of the parameters, it can be set later with :meth:`set_last_cost`.
+        """
+        record_number = self._number_of_records
+        self._number_of_records += 1
+        if record_number % self._keep_every != 0:
+            return
+
+        if self._end == self._rows.shape[0]:
+            self._make_room()
+        row = self._rows[self._end]
+        row[0] = record_number
+        row[1] = cost
+        row[2:] = values
+        self._end += 1
+        if self._keep_last is not None and len(self) > self._keep_last:
+            self._start += 1
+
+        if self._spill is not None:
+            self._write_pending_row()
+            if np.isnan(cost):
+                self._pending_row = row.copy()
+            else:
+                self._spill.write(row)
+
+    def append_parameters(self, parameters: ParameterGroup, cost: float = np.nan):
+        """Records the values of parameters, if the retention policy keeps them.
+
+        Parameters
+        ----------
+        parameters : ParameterGroup
+            The parameters, which contain the parameters of :attr:`labels`.
+        cost : float
+            The cost of the parameters, it can be set later with :meth:`set_last_cost`.
+        """
+        if self._parameters is None or self._parameters[0] is not parameters:
+            self._parameters = (parameters, [parameters.get(label) for label in self._labels])
+        values = np.fromiter(
+            (parameter.value for parameter in self._parameters[1]),
+            dtype=np.float64,
+            count=len(self._labels),
+        )
+        self.append(values, cost)
+
+    def set_last_cost(self, cost: float):
+        """Sets the cost of the last record.
+
+        Parameters
+        ----------
+        cost : float
+            The cost.
+        """
+        if self._end == self._start or self._rows[self._end - 1, 0] != self._number_of_records - 1:
+            # the last call of append was not recorded
+            return
+        self._rows[self._end - 1, 1] = cost
+        if self._pending_row is not None:
+            self._pending_row[1] = cost
+            self._write_pending_row()
+
+    def set_parameters(self, index: int, parameters: ParameterGroup):
+        """Sets the values of a record to parameters.
+
+        Parameters
+        ----------
+        index : int
+            The index of the record among the kept records, negative indices count from the
+            last record.
+        parameters : ParameterGroup
+            The parameters to set.
+
+        Raises
+        ------
+        IndexError
+            If there is no record for the index.
+        """
+        values = self.values[index]
+        for label, value in zip(self._labels, values.tolist()):
+            parameters.get(label).value = value
+        parameters.update_parameter_expression()
+
+    def to_dataset(self) -> xr.Dataset:
+        """Creates a dataset of the kept records.
+
+        Returns
+        -------
+        xr.Dataset
+            The dataset, with the parameter values and costs over the record numbers.
+        """
+        coords = {"record": self.record_numbers, "parameter": self._labels}
+        return xr.Dataset(
+            {
+                "cost": ("record", self.costs.copy()),
+                "parameter_values": (("record", "parameter"), self.values.copy()),
+            },
+            coords=coords,
+        )
+
+    def close(self):
+        """Flushes and closes the spill file, if any."""
+        if self._spill is not None:
+            self._write_pending_row()
+            self._spill.close()
+            self._spill = None
+
+    def _make_room(self):
+        """Makes room for a row at the end of the buffer.
+
+        A history keeping all records doubles its buffer. Otherwise the buffer holds twice the
+        rows to keep, so the kept rows are moved to the front only every ``keep_last`` records.
+        """
+        if self._keep_last is None:
+            self._rows = np.concatenate([self._rows, np.empty_like(self._rows)])
+            return
+        size = len(self)
+        self._rows[:size] = self._rows[self._start : self._end]
+        self._start = 0
+        self._end = size
+
+    def _write_pending_row(self):
+        if self._pending_row is not None:
+            self._spill.write(self._pending_row)
+            self._pending_row = None
+
+
+class _NpySpill:
+    """Streams rows to a ``.npy`` file.
+
+    The header is rewritten with the number of rows after every row, so the file stays
+    readable with :func:`numpy.load` at any time.
+    """
+
+    # The header is padded to a fixed size, so that the number of rows can grow.
+    _header_size = 128
+
+    def __init__(self, path: str, number_of_columns: int):
+        self._file: BinaryIO = open(path, "wb")
+        self._number_of_columns = number_of_columns
+        self._number_of_rows = 0
+        self._write_header()
+
+    def write(self, row: np.ndarray):
+        self._file.seek(0, 2)
+        self._file.write(np.asarray(row, dtype="<f8").tobytes())
+        self._number_of_rows += 1
+        self._write_header()
+
+    def close(self):
+        self._file.close()
+
+    def _write_header(self):
+        header = repr(
+            {
+                "descr": "<f8",
+                "fortran_order": False,
+                "shape": (self._number_of_rows, self._number_of_columns),
+            }
+        )
+        # magic string, version 1.0, header length and the header terminated by a newline
+        prefix = b"\x93NUMPY\x01\x00"
+        header_length = self._header_size - len(prefix) - 2
+        header = header.ljust(header_length - 1) + "\n"
+        self._file.seek(0)
+        self._file.write(prefix + header_length.to_bytes(2, "little") + header.encode("latin1"))
+
+
+class _NetCDFSpill:
+    """Streams rows to a netCDF file with an unlimited record dimension."""
+
+    def __init__(self, path: str, labels: list[str]):
+        import netCDF4
+
+        self._dataset = netCDF4.Dataset(path, "w")
+        self._dataset.createDimension("record", None)
+        self._dataset.createDimension("parameter", len(labels))
+        self._dataset.createVariable("record", "i8", ("record",))
+        self._dataset.createVariable("cost", "f8", ("record",))
+        self._dataset.createVariable("parameter_values", "f8", ("record", "parameter"))
+        parameter = self._dataset.createVariable("parameter", str, ("parameter",))
+        parameter[:] = np.asarray(labels, dtype=object)
+        self._number_of_rows = 0
+
+    def write(self, row: np.ndarray):
+        index = self._number_of_rows
+        self._dataset["record"][index] = int(row[0])
+        self._dataset["cost"][index] = row[1]
+        self._dataset["parameter_values"][index, :] = row[2:]
+        self._number_of_rows += 1
+
+    def close(self):
+        self._dataset.close()
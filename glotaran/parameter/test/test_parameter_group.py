@@ -1,6 +1,11 @@
+import pickle
+
+import numpy as np
+import pytest
 from IPython.core.formatters import format_display_data
 
 from glotaran.io import load_parameters
+from glotaran.parameter import Parameter
 from glotaran.parameter.parameter_group import ParameterGroup
 
 PARAMETERS_3C_BASE = """\
@@ -79,6 +84,42 @@ def test_param_group_repr():
     assert result.__repr__() == expected
 
 
+def test_param_group_pickle():
+    """Expressions are evaluated after unpickling."""
+    parameters = ParameterGroup.from_dict(
+        {"foo": [["1", 1.0], ["2", 2.0, {"expr": "$foo.1 * 2"}]]}
+    )
+    pickled_parameters = pickle.loads(pickle.dumps(parameters))
+
+    assert pickled_parameters == parameters
+    pickled_parameters.get("foo.1").value = 3.0
+    pickled_parameters.update_parameter_expression()
+    assert pickled_parameters.get("foo.2").value == 6.0
+
+
+def test_param_group_label_and_value_arrays():
+    parameters = ParameterGroup.from_dict(
+        {
+            "foo": [["1", 1.0, {"non-negative": True}], ["2", 2.0, {"expr": "$foo.1 * 2"}]],
+            "bar": {"baz": [["1", 3.0]]},
+        }
+    )
+    labels, values, _, _ = parameters.get_label_value_and_bounds_arrays(exclude_non_vary=True)
+    assert labels == ["foo.1", "bar.baz.1"]
+    assert np.allclose(values, [0.0, 3.0])
+
+    parameters.set_from_label_and_value_arrays(labels, np.asarray([np.log(4.0), 5.0]))
+    assert parameters.get("foo.1").value == 4.0
+    assert parameters.get("foo.2").value == 8.0
+    assert parameters.get("bar.baz.1").value == 5.0
+    assert parameters["bar"].get("baz.1").value == 5.0
+
+    # adding a parameter to a subgroup updates the lookup of the root group
+    parameters["bar"]["baz"].add_parameter(Parameter(label="2", value=6.0))
+    assert parameters.get("bar.baz.2").value == 6.0
+    assert parameters.copy().get("bar.baz.2").value == 6.0
+
+
 def test_param_group_ipython_rendering():
     """Autorendering in ipython"""
     param_group = ParameterGroup.from_dict({"foo": {"bar": [["1", 1.0], ["2", 2.0], ["3", 3.0]]}})
@@ -91,3 +132,23 @@ def test_param_group_ipython_rendering():
 
     assert "text/markdown" in rendered_markdown_return
     assert rendered_markdown_return["text/markdown"].startswith("  * __foo__")
+
+
+def test_param_group_expression_order():
+    """Expressions depending on other expressions are evaluated after them."""
+    parameters = ParameterGroup.from_dict(
+        {
+            "a": [["1", 1.0, {"expr": "$b.1 + $b.10"}]],
+            "b": [["1", 2.0, {"expr": "$c.1 * 2"}], ["10", 10.0]],
+            "c": [["1", 3.0]],
+        }
+    )
+    assert parameters.get("b.1").value == 6.0
+    assert parameters.get("a.1").value == 16.0
+
+    parameters.set_from_label_and_value_arrays(["c.1"], np.asarray([4.0]))
+    assert parameters.get("a.1").value == 18.0
+
+    parameters.get("c.1").expression = "$a.1"
+    with pytest.raises(ValueError, match="Cyclic"):
+        parameters.update_parameter_expression()
@@ -0,0 +1,82 @@
+import numpy as np
+import pytest
+import xarray as xr
+
+from glotaran.parameter import ParameterGroup
+from glotaran.parameter import ParameterHistory
+
+
+def test_parameter_history_keep_all():
+    history = ParameterHistory(["a", "b"])
+    for i in range(100):
+        history.append([i, 2 * i], cost=i / 2)
+
+    assert len(history) == 100
+    assert history.number_of_records == 100
+    assert np.array_equal(history.record_numbers, np.arange(100))
+    assert np.array_equal(history.costs, np.arange(100) / 2)
+    assert np.array_equal(history.values[:, 1], 2 * np.arange(100))
+
+
+def test_parameter_history_retention():
+    history = ParameterHistory(["a"], keep_last=3, keep_every=2)
+    for i in range(20):
+        history.append([i])
+
+    assert len(history) == 3
+    assert history.number_of_records == 20
+    assert history.record_numbers.tolist() == [14, 16, 18]
+    assert history.values[:, 0].tolist() == [14, 16, 18]
+
+    # the cost of records which were not kept is dropped
+    history.set_last_cost(1.0)
+    assert np.all(np.isnan(history.costs))
+    history.append([20])
+    history.set_last_cost(1.0)
+    assert history.costs[-1] == 1.0
+
+    with pytest.raises(ValueError):
+        ParameterHistory(["a"], keep_last=0)
+
+
+def test_parameter_history_set_parameters():
+    parameters = ParameterGroup.from_dict(
+        {"a": [["1", 1.0], ["2", 2.0], ["3", 0.0, {"expr": "$a.1 + $a.2"}]]}
+    )
+    history = ParameterHistory.from_parameters(parameters)
+    assert history.labels == ["a.1", "a.2"]
+
+    history.append_parameters(parameters)
+    parameters.get("a.1").value = 5.0
+    history.append_parameters(parameters)
+
+    history.set_parameters(-2, parameters)
+    assert parameters.get("a.1").value == 1.0
+    assert parameters.get("a.3").value == 3.0
+
+
+@pytest.mark.parametrize("suffix", [".npy", ".nc"])
+def test_parameter_history_spill(tmp_path, suffix: str):
+    path = str(tmp_path / f"history{suffix}")
+    history = ParameterHistory(["a", "b"], keep_last=2, spill_path=path)
+    for i in range(5):
+        history.append([i, -i])
+        history.set_last_cost(float(i))
+    # a row without cost is written on close
+    history.append([5, -5])
+    history.close()
+
+    assert len(history) == 2
+    if suffix == ".npy":
+        rows = np.load(path)
+        assert rows.shape == (6, 4)
+        assert np.array_equal(rows[:, 0], np.arange(6))
+        assert np.array_equal(rows[:5, 1], np.arange(5))
+        assert np.isnan(rows[5, 1])
+        assert np.array_equal(rows[:, 3], -np.arange(6))
+    else:
+        with xr.open_dataset(path) as dataset:
+            assert dataset.parameter.values.tolist() == ["a", "b"]
+            assert dataset.record.values.tolist() == list(range(6))
+            assert np.array_equal(dataset.parameter_values[:, 0], np.arange(6))
+            assert np.array_equal(dataset.cost[:5], np.arange(5))
@@ -1,4 +1,5 @@
 from glotaran.project.result import Result
+from glotaran.project.scheme import ParameterHistoryOptions
 from glotaran.project.scheme import SavingOptions
 from glotaran.project.scheme import Scheme
 from glotaran.project.scheme import default_data_filters
@@ -110,6 +110,12 @@ class Result:
             gtol=self.scheme.gtol,
             xtol=self.scheme.xtol,
             optimization_method=self.scheme.optimization_method,
+            jacobian_method=self.scheme.jacobian_method,
+            number_of_jacobian_workers=self.scheme.number_of_jacobian_workers,
+            jacobian_start_method=self.scheme.jacobian_start_method,
+            number_of_residual_threads=self.scheme.number_of_residual_threads,
+            number_of_residual_workers=self.scheme.number_of_residual_workers,
+            parameter_history=self.scheme.parameter_history,
         )
 
     def markdown(self, with_model: bool = True, base_heading_level: int = 1) -> MarkdownStr:
@@ -29,6 +29,13 @@ class SavingOptions:
     report: bool = True
 
 
+@dataclass
+class ParameterHistoryOptions:
+    keep_last: int | None = None
+    keep_every: int = 1
+    spill_path: str | None = None
+
+
 @dataclass
 class Scheme:
     model: Model | str
@@ -47,9 +54,27 @@ class Scheme:
         "Dogbox",
         "Levenberg-Marquardt",
     ] = "TrustRegionReflection"
+    jacobian_method: Literal[
+        "FiniteDifference",
+        "ParallelFiniteDifference",
+        "Analytic",
+    ] = "FiniteDifference"
+    number_of_jacobian_workers: int | None = None
+    jacobian_start_method: Literal["fork", "spawn", "forkserver"] = "spawn"
+    number_of_residual_threads: int | None = None
+    number_of_residual_workers: int | None = None
     saving: SavingOptions = SavingOptions()
+    parameter_history: ParameterHistoryOptions = ParameterHistoryOptions()
     result_path: str | None = None
 
+    def __post_init__(self):
+        if self.jacobian_start_method == "fork":
+            warnings.warn(
+                "The jacobian start method 'fork' is not supported, since the workers are started "
+                "after numba's threads, which makes forked workers abort. Use 'spawn' or "
+                "'forkserver' instead."
+            )
+
     def problem_list(self) -> list[str]:
         """Returns a list with all problems in the model and missing parameters."""
         return self.model.problem_list(self.parameters)
@@ -106,11 +106,7 @@ shapes:
 PARAMETERS_3C_BASE_SEQUENTIAL = f"""\
 {PARAMETERS_3C_BASE}
 shapes:
-    amps:
-        - 9
-        - 7
-        - 5
-        - {{"vary": True, min: 0, max: 10}}
+    amps: [9, 7, 5, {{"vary": False}}]
     locs: [610, 670, 730, {{"vary": False}}]
     width: [15, 25, 10, {{"vary": False}}]
 """